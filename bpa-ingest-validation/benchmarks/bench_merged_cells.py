@@ -0,0 +1,71 @@
+"""
+Peak memory of resolving merged cells, for merged ranges spanning whole columns.
+
+Runs ExcelWrapper._get_rows over an in-memory sheet of increasing length, in which
+every other column is a single merged range from the header to the last row, and
+reports the tracemalloc peak. The peak should stay flat as the sheet grows.
+
+    python benchmarks/bench_merged_cells.py [--columns 20] [--rows 10000 100000 250000]
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+
+import xlrd
+from xlrd.sheet import Cell
+
+from bpa_ingest_validation.excel_wrapper import ExcelWrapper
+
+
+class ColumnMergedSheet:
+    """Generates rows on the fly, with every other column merged top to bottom"""
+
+    name = "Sample metadata"
+    visibility = 0
+
+    def __init__(self, nrows, ncols):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.merged_cells = [(0, nrows, colx, colx + 1) for colx in range(0, ncols, 2)]
+
+    def get_rows(self):
+        for rowx in range(self.nrows):
+            yield [Cell(xlrd.XL_CELL_NUMBER, float(rowx)) for _ in range(self.ncols)]
+
+
+def run(nrows, ncols):
+    wrapper = ExcelWrapper.__new__(ExcelWrapper)
+    wrapper._logger = logging.getLogger(__name__)
+    wrapper.header_length = 1
+    wrapper.sheet = ColumnMergedSheet(nrows, ncols)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in wrapper._get_rows():
+        count += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert count == nrows - 1
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 250_000]
+    )
+    args = parser.parse_args()
+
+    print("{:>10}  {:>14}  {:>10}".format("rows", "peak memory", "seconds"))
+    for nrows in args.rows:
+        peak, elapsed = run(nrows, args.columns)
+        print("{:>10}  {:>11.1f} KiB  {:>10.2f}".format(nrows, peak / 1024, elapsed))
+
+
+if __name__ == "__main__":
+    main()
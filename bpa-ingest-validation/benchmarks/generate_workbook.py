@@ -0,0 +1,183 @@
+"""
+Synthetic sample metadata workbooks, shaped like the ones BaseSampleContextual reads.
+
+The header is taken from BaseSampleContextual.field_spec, and the values in each column
+from its coerce function: BPA IDs, integers and depths, and dates written either as date
+cells or as dd/mm/YYYY text. A fraction of the cells can be replaced by dirty values,
+which the coerce functions report as errors, and runs of rows can be merged in the
+text columns, as submitters do for values shared by a batch of samples.
+
+Rows are written with a write_only workbook, so generating a million rows does not
+need the workbook in memory.
+
+    python benchmarks/generate_workbook.py OUT.xlsx [--rows 10000] [--dirty 0.01]
+        [--merge-every 0] [--seed 0]
+"""
+
+import argparse
+import datetime
+import random
+import re
+
+from openpyxl import Workbook
+from openpyxl.utils.cell import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+from bpa_ingest_validation.bpa_ingest_validations import (
+    extract_ands_id,
+    get_int,
+    int_or_comment,
+)
+from bpa_ingest_validation.excel_wrapper import SkipColumn
+from bpa_ingest_validation.metadata_handler import BaseSampleContextual
+
+SHEET_NAME = "Sample metadata"
+
+# headers for the fields whose column_name is a regex the attribute name doesn't match
+HEADER_OVERRIDES = {"lifestage": "life_stage"}
+
+DIRTY_VALUES = {
+    "id": ["102.100.100", "sample ?", "10-2-100"],
+    "int": ["approx. ten", "n.d.", "~"],
+    "date": ["13/13/2021", "sometime in May", "2021/02/30"],
+    "text": [],
+}
+
+FIRST_DATE = datetime.datetime(2015, 1, 1)
+
+
+def header_for(spec):
+    if isinstance(spec, SkipColumn):
+        return spec.column_name
+    if spec.attribute in HEADER_OVERRIDES:
+        return HEADER_OVERRIDES[spec.attribute]
+    if isinstance(spec.column_name, tuple):
+        return spec.column_name[0]
+    if hasattr(spec.column_name, "match"):
+        return spec.attribute
+    return spec.column_name
+
+
+def column_kind(spec):
+    """The sort of value to generate for spec, from its coerce function"""
+    coerce = getattr(spec, "coerce", None)
+    if coerce is None:
+        return "text"
+    coerce = getattr(coerce, "func", coerce)
+    if coerce is extract_ands_id:
+        return "id"
+    if coerce in (get_int, int_or_comment):
+        return "int"
+    if "date" in getattr(coerce, "__name__", ""):
+        return "date"
+    return "text"
+
+
+def make_columns(field_spec=None):
+    """[(header, kind)] for field_spec, one column per distinct header"""
+    if field_spec is None:
+        field_spec = BaseSampleContextual.field_spec
+    columns = []
+    seen = set()
+    for spec in field_spec:
+        header = header_for(spec)
+        if header.lower() in seen:
+            continue
+        seen.add(header.lower())
+        columns.append((header, column_kind(spec)))
+    return columns
+
+
+def clean_value(kind, header, rowx, rng):
+    if kind == "id":
+        # a mix of full and abbreviated IDs, unique per row
+        sample_id = 100000 + rowx
+        if rowx % 3 == 0:
+            return sample_id
+        return "102.100.100/{}".format(sample_id)
+    if kind == "int":
+        return rng.randrange(0, 5000)
+    if kind == "date":
+        value = FIRST_DATE + datetime.timedelta(days=rng.randrange(0, 3000))
+        if rng.random() < 0.5:
+            return value
+        return value.strftime("%d/%m/%Y")
+    if re.search(r"itude|metres|temperature|conc", header):
+        return round(rng.uniform(-90, 90), 5)
+    return "{} {}".format(header, rng.randrange(0, 50))
+
+
+def generate_rows(columns, nrows, dirty=0.0, seed=0):
+    """The data rows of a workbook with columns, a fraction dirty of cells are dirty"""
+    rng = random.Random(seed)
+    for rowx in range(nrows):
+        row = []
+        for header, kind in columns:
+            if dirty and DIRTY_VALUES[kind] and rng.random() < dirty:
+                row.append(rng.choice(DIRTY_VALUES[kind]))
+            else:
+                row.append(clean_value(kind, header, rowx, rng))
+        yield row
+
+
+def merged_ranges(columns, nrows, merge_every):
+    """Ranges merging each run of merge_every rows in every other text column"""
+    if not merge_every or merge_every < 2:
+        return []
+    ranges = []
+    text_columns = [
+        idx for idx, (_header, kind) in enumerate(columns) if kind == "text"
+    ][::2]
+    # data rows start at spreadsheet row 2
+    for first in range(2, nrows + 2, merge_every):
+        last = min(first + merge_every - 1, nrows + 1)
+        if last == first:
+            continue
+        for idx in text_columns:
+            letter = get_column_letter(idx + 1)
+            ranges.append("{0}{1}:{0}{2}".format(letter, first, last))
+    return ranges
+
+
+def write_workbook(path, nrows, dirty=0.0, merge_every=0, seed=0, field_spec=None):
+    """Write a sample metadata workbook with nrows data rows to path"""
+    columns = make_columns(field_spec)
+    merged = merged_ranges(columns, nrows, merge_every)
+    merged_columns = set()
+    for cell_range in merged:
+        merged_columns.add(CellRange(cell_range).min_col - 1)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+    for cell_range in merged:
+        sheet.merged_cells.add(CellRange(cell_range))
+    sheet.append([header for header, _kind in columns])
+    for rowx, row in enumerate(generate_rows(columns, nrows, dirty, seed)):
+        if merged_columns and rowx % merge_every:
+            # only the top left cell of a merged range holds a value
+            row = [None if idx in merged_columns else v for idx, v in enumerate(row)]
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="workbook to write (.xlsx)")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument(
+        "--dirty", type=float, default=0.01, help="fraction of cells with dirty values"
+    )
+    parser.add_argument(
+        "--merge-every",
+        type=int,
+        default=0,
+        help="merge runs of this many rows in every other text column (default: no merges)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_workbook(args.path, args.rows, args.dirty, args.merge_every, args.seed)
+
+
+if __name__ == "__main__":
+    main()
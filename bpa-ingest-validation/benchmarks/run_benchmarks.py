@@ -0,0 +1,198 @@
+"""
+Timings of the validation pipeline over generated workbooks (see generate_workbook.py).
+
+For each workbook size this times:
+
+    wrapper           ExcelWrapper construction (opening the workbook, mapping the header)
+    get_all           opening the workbook, then reading and coercing every row
+    get_all_columnar  the same, with get_all(columnar=True)
+    read_metadata     BaseSampleContextual._read_metadata, end to end
+    coerce.<name>     each coerce function in the field_spec, over that column's values
+
+Each benchmark is run --repeat times and the fastest run is kept. Results are written
+as JSON; pass a previous run as --baseline to compare against it, the exit status is 1
+if anything is slower than the baseline by more than --threshold.
+
+    python benchmarks/run_benchmarks.py [--rows 10 1000 100000] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.1]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from bpa_ingest_validation.excel_wrapper import ExcelWrapper
+from bpa_ingest_validation.metadata_handler import BaseSampleContextual
+from bpa_ingest_validation.result_cache import package_version
+
+from generate_workbook import column_kind, generate_rows, header_for, write_workbook
+
+
+def best_of(repeat, func):
+    """Fastest of repeat timed calls of func, in seconds"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def quiet_contextual():
+    contextual = BaseSampleContextual(streaming=True)
+    contextual.logger.setLevel(logging.CRITICAL)
+    return contextual
+
+
+def open_wrapper(contextual, path):
+    return ExcelWrapper(
+        contextual.logger,
+        contextual.field_spec,
+        path,
+        sheet_name=contextual.sheet_names,
+        header_length=1,
+        column_name_row_index=0,
+        streaming=True,
+    )
+
+
+def consume(rows):
+    for _ in rows:
+        pass
+
+
+def bench_workbook(path, repeat):
+    contextual = quiet_contextual()
+    return {
+        "wrapper": best_of(repeat, lambda: open_wrapper(contextual, path)),
+        "get_all": best_of(
+            repeat, lambda: consume(open_wrapper(contextual, path).get_all())
+        ),
+        "get_all_columnar": best_of(
+            repeat,
+            lambda: consume(open_wrapper(contextual, path).get_all(columnar=True)),
+        ),
+        "read_metadata": best_of(repeat, lambda: contextual._read_metadata(path)),
+    }
+
+
+def bench_coerce(nrows, dirty, seed, repeat):
+    """Time each coerce function over the values generated for its column"""
+    field_spec = BaseSampleContextual.field_spec
+    specs = [
+        spec
+        for spec in field_spec
+        if getattr(spec, "coerce", None) is not None
+    ]
+    columns = [(header_for(spec), column_kind(spec)) for spec in specs]
+    values = list(zip(*generate_rows(columns, nrows, dirty, seed)))
+
+    results = {}
+    for spec, column in zip(specs, values):
+        coerce = spec.coerce
+
+        def run(coerce=coerce, column=column):
+            for val in column:
+                coerce(val)
+
+        results["coerce." + spec.attribute] = best_of(repeat, run)
+    return results
+
+
+def run_benchmarks(rows, repeat=3, dirty=0.01, merge_every=0, seed=0, workdir=None):
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        for nrows in rows:
+            path = os.path.join(tmpdir, "samples_{}.xlsx".format(nrows))
+            write_workbook(path, nrows, dirty, merge_every, seed)
+            timings = bench_workbook(path, repeat)
+            timings.update(bench_coerce(nrows, dirty, seed, repeat))
+            for name, seconds in timings.items():
+                results["{}@{}".format(name, nrows)] = seconds
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    [(name, baseline seconds, seconds, change)] for the benchmarks in both runs, and
+    the names of those slower than the baseline by more than threshold
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(results) & set(baseline)):
+        before, after = baseline[name], results[name]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10, 1000, 100_000],
+        help="workbook sizes, in data rows (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dirty", type=float, default=0.01)
+    parser.add_argument("--merge-every", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="slowdown, as a fraction, reported as a regression (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.rows, args.repeat, args.dirty, args.merge_every, args.seed
+    )
+    run = {
+        "meta": {
+            "version": package_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "repeat": args.repeat,
+            "dirty": args.dirty,
+            "merge_every": args.merge_every,
+            "seed": args.seed,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(run, fd, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        for name in sorted(results):
+            print("{:<45} {:>10.4f}s".format(name, results[name]))
+        return 0
+
+    with open(args.baseline) as fd:
+        baseline = json.load(fd)["results"]
+    rows, regressions = compare(results, baseline, args.threshold)
+    print("{:<45} {:>11} {:>11} {:>8}".format("benchmark", "baseline", "now", "change"))
+    for name, before, after, change in rows:
+        print(
+            "{:<45} {:>10.4f}s {:>10.4f}s {:>+7.1%}{}".format(
+                name, before, after, change, "  REGRESSION" if name in regressions else ""
+            )
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,26 @@
 
 import datetime
+import functools
+import itertools
+import logging
 import math
+import operator
 import re
 
 from .bpa_constants import BPA_PREFIX
-
-ands_id_re = re.compile(r"^102\.100\.100[/\.](\d+)$")
-ands_id_abbrev_re = re.compile(r"^(\d+)$")
-# this format of BPA ID has been used in older projects (e.g. BASE)
-ands_id_abbrev_2_re = re.compile(r"^102\.100\.\.100[/\.](\d+)$")
+from .date_parser import (
+    DateParser,
+    DATE_SENTINELS,
+    DATE_TIME_FORMATS,
+    NAIVE_DATE_TIME_FORMATS,
+)
+
+logger = logging.getLogger(__name__)
+
+# a BPA ID, 102.100.100/<digits> or 102.100.100.<digits>, or just the digits. The
+# 102.100..100 form has been used in older projects (e.g. BASE)
+ands_id_re = re.compile(r"^(?:102\.100\.\.?100[/\.])?(\d+)$")
+ands_id_prefixes = ("102.100.100/", "102.100.100.", "102.100..100/", "102.100..100.")
 # <sample_id>_<extraction>
 #sample_extraction_id_re = re.compile(r"^\d{4,6}_\d")
 
@@ -22,6 +34,10 @@ get_int
 get_date_isoformat
 """
 
+# shared parsers for callers that don't need a per-column parser, see column_date_isoformat
+default_date_parser = DateParser()
+default_date_time_parser = DateParser(DATE_TIME_FORMATS)
+
 #Second return value in ALL cases is the error that was reported.
 # Makes logging the responsibility of the caller.
 # If no error, return None.
@@ -56,18 +72,87 @@ def extract_ands_id(s, silent=False):
         s = s.rsplit("_", 1)[0]
     m = ands_id_re.match(s)
     if m:
-        return BPA_PREFIX + m.groups()[0], None
-    m = ands_id_abbrev_re.match(s)
-    if m:
-        return BPA_PREFIX + m.groups()[0], None
-    m = ands_id_abbrev_2_re.match(s)
-    if m:
-        return BPA_PREFIX + m.groups()[0], None
+        return BPA_PREFIX + m.group(1), None
     if not silent:
         return None, "unable to parse BPA ID: {}".format(str(s))
     return None, None
 
 
+def extract_ands_ids(values, silent=False):
+    """
+    extract_ands_id applied to a whole column of values, returning (values, errors).
+
+    The common forms of ID - strings of digits, with or without a prefix, and numbers -
+    are converted with a cheap check of each value (see _string_ands_ids and
+    _float_ands_ids), and only the other values go through extract_ands_id. The results
+    are the same as calling extract_ands_id on each value.
+    """
+    kinds = list(map(type, values))
+    if kinds.count(str) == len(values):
+        return _string_ands_ids(values, silent)
+    if kinds.count(float) == len(values):
+        return _float_ands_ids(values, silent)
+
+    out = [None] * len(values)
+    errors = [None] * len(values)
+    by_kind = [
+        (_positions(kinds, str), _string_ands_ids),
+        (_positions(kinds, float), _float_ands_ids),
+    ]
+    if sum(len(positions) for positions, _ in by_kind) + kinds.count(type(None)) < len(
+        values
+    ):
+        for pos, kind in enumerate(kinds):
+            if kind is not str and kind is not float and kind is not type(None):
+                out[pos], errors[pos] = extract_ands_id(values[pos], silent)
+    for positions, convert in by_kind:
+        if positions:
+            ids, id_errors = convert([values[pos] for pos in positions], silent)
+            for pos, value, error in zip(positions, ids, id_errors):
+                out[pos] = value
+                errors[pos] = error
+    return out, errors
+
+
+def _positions(kinds, kind):
+    return list(itertools.compress(range(len(kinds)), map(operator.is_, kinds, itertools.repeat(kind))))
+
+
+def _float_ands_ids(floats, silent):
+    if -1.0 < min(floats) and max(floats) < math.inf and not any(map(math.isnan, floats)):
+        # %d truncates a float as int() does
+        return list(map((BPA_PREFIX + "%d").__mod__, floats)), [None] * len(floats)
+    out = [None] * len(floats)
+    errors = [None] * len(floats)
+    for idx, s in enumerate(floats):
+        out[idx], errors[idx] = extract_ands_id(s, silent)
+    return out, errors
+
+
+def _string_ands_ids(strings, silent):
+    """
+    Strings of digits, and IDs which already have the prefix, are told apart with
+    isdecimal(), which is true of the same characters as \\d; other prefixed IDs match
+    ands_id_re as they are. Only the remaining values go through extract_ands_id.
+    """
+    ids = [None] * len(strings)
+    errors = [None] * len(strings)
+    prefix_length = len(BPA_PREFIX)
+    fullmatch = ands_id_re.fullmatch
+    for idx, s in enumerate(strings):
+        if s.isdecimal():
+            ids[idx] = BPA_PREFIX + s
+        elif s.startswith(BPA_PREFIX) and s[prefix_length:].isdecimal():
+            ids[idx] = s
+        else:
+            m = fullmatch(s)
+            if m:
+                ids[idx] = BPA_PREFIX + m.group(1)
+            else:
+                ids[idx], errors[idx] = extract_ands_id(s, silent)
+    return ids, errors
+
+
 def extract_ands_id_silent(s):
     return extract_ands_id(s, silent=True)
 
@@ -120,7 +205,7 @@ def int_or_comment(val):
 
 def date_or_int_or_comment( val):
     if isinstance(val, datetime.date):
-        return get_date_isoformat(val), None
+        return get_date_isoformat(val)
     return int_or_comment(val)
 
 
@@ -157,17 +242,35 @@ def get_clean_number( val, default=None):
     return float(matches[0]), error
 
 
-def get_date_isoformat(s, silent=False):
+def get_date_isoformat(s, silent=False, parser=None):
     "try to parse the date, if we can, return the date as an ISO format string"
-    dt = _get_date(s, silent)
+    try:
+        dt = _get_date(s, parser)
+    except ValueError as e:
+        if silent:
+            return None, None
+        return None, str(e)
     if dt is None:
         return None, None
-    return dt.strftime("%Y-%m-%d")
+    return dt.strftime("%Y-%m-%d"), None
+
+
+def column_date_isoformat(maxsize=1024):
+    """
+    get_date_isoformat with its own DateParser, for use as the coerce function of a single
+    column, so that the parser learns the date format that column is written in.
+    """
+    return functools.partial(get_date_isoformat, parser=DateParser(maxsize=maxsize))
 
 
 def get_date_isoformat_as_datetime(s, silent=False):
     "try to parse the date, if we can, return the date as an ISO format string"
-    dt = _get_date_time( s, silent)
+    try:
+        dt = _get_date_time(s, silent)
+    except ValueError as e:
+        if not silent:
+            logger.error(str(e))
+        return None
     if dt is None:
         return None
     return dt.strftime("%Y-%m-%dT%H:%M:%S")
@@ -178,102 +281,37 @@ def get_time(s):
     return str(s)
 
 
-def _get_date_time(dt, silent=False):
-    if dt is None:
+def _date_candidate(dt):
+    """dt if it needs parsing as a date string, otherwise None"""
+    if not isinstance(dt, str):
         return None
-
-    if (
-        dt == "unknown"
-        or dt == "Unknown"
-        or dt == "UnkNown"
-        or dt == "unkNown"
-        or dt == "event date not recorded"
-        or dt == "Not yet assigned"
-        or dt == "Not applicable"
-        or dt == "not applicable"
-        or dt == "no information"
-        or dt == "Not submitted"
-        or dt == "not determined"
-        or dt == "To be filled in"
-        or dt == "(null)"
-        or dt == "NA"
-        or dt == "n/a"
-        or dt == "TBA"
-        or dt == "No record"
-    ):
+    if dt in DATE_SENTINELS:
+        return None
+    if dt.strip() == "":
         return None
+    return dt
+
 
+def _get_date_time(dt, silent=False):
     if isinstance(dt, datetime.date):
         return dt
-
-    if not isinstance(dt, str):
-        return None
-
-    if dt.strip() == "":
+    s = _date_candidate(dt)
+    if s is None:
         return None
 
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%M:%SZ")
-    except ValueError:
-        pass
-    try:
-        return datetime.datetime.strptime(dt, "%y-%m-%dT%H:%M:%SZ")
-    except ValueError:
-        pass
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%MZ")
-    except ValueError:
-        pass
-    try:
-        retval = datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S")
-        if not silent:
-            logger.warning(
-                "DateTime {} does not have a timezone - will force to Z time.".format(
-                    retval
-                )
+    retval, fmt = default_date_time_parser.parse(s)
+    if retval is None:
+        return _get_date(s)
+    if fmt in NAIVE_DATE_TIME_FORMATS and not silent:
+        logger.warning(
+            "DateTime {} does not have a timezone - will force to Z time.".format(
+                retval
             )
-        return retval
-    except ValueError:
-        pass
-    try:
-        retval = datetime.datetime.strptime(dt, "%y-%m-%d %H:%M:%S")
-        if not silent:
-            logger.warning(
-                "DateTime {} does not have a timezone - will force to Z time.".format(
-                    retval
-                )
-            )
-        return retval
-    except ValueError:
-        pass
-    try:
-        retval = datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M")
-        if not silent:
-            logger.warning(
-                "DateTime {} does not have a timezone - will force to Z time.".format(
-                    retval
-                )
-            )
-        return retval
-    except ValueError:
-        pass
-    try:
-        retval = datetime.datetime.strptime(dt, "%y-%m-%d %H:%M")
-        if not silent:
-            logger.warning(
-                "DateTime {} does not have a timezone - will force to Z time.".format(
-                    retval
-                )
-            )
-        return retval
-
-    except ValueError:
-        pass
-
-    return _get_date(logger, dt, silent)
+        )
+    return retval
 
 
-def _get_date(logger, dt, silent=False):
+def _get_date(dt, parser=None):
     """
     Convert `dt` into a datetime.date, returning `dt` if it is already an
     instance of datetime.date.
@@ -288,110 +326,22 @@ def _get_date(logger, dt, silent=False):
        YYYY-mm (convert to first date of month)
        mm/YYYY (convert to first date of month)
 
-    If conversion fails, returns None.
+    Returns None for empty or placeholder values (see DATE_SENTINELS), and raises
+    ValueError if `dt` is a string in none of the supported formats.
     """
 
-    if dt is None:
-        return None
-
-    if (
-        dt == "unknown"
-        or dt == "Unknown"
-        or dt == "UnkNown"
-        or dt == "unkNown"
-        or dt == "event date not recorded"
-        or dt == "Not yet assigned"
-        or dt == "Not applicable"
-        or dt == "not applicable"
-        or dt == "no information"
-        or dt == "Not submitted"
-        or dt == "not determined"
-        or dt == "To be filled in"
-        or dt == "(null)"
-        or dt == "NA"
-        or dt == "n/a"
-        or dt == "TBA"
-        or dt == "No record"
-    ):
-        return None
-
     if isinstance(dt, datetime.date):
         return dt
-
-    if not isinstance(dt, str):
-        return None
-
-    if dt.strip() == "":
+    s = _date_candidate(dt)
+    if s is None:
         return None
 
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%d").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%b-%d").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d/%m/%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d-%m-%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d.%m.%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d.%m.%y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%m/%Y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%d/%m/%y").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%y-%m-%d %H:%M:%S").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%M:%SZ").date()
-    except ValueError:
-        pass
-
-    try:
-        return datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%MZ").date()
-    except ValueError:
-        pass
-
-    if not silent:
-        logger.error("Date `{}` is not in a supported format".format(dt))
-    return None
+    if parser is None:
+        parser = default_date_parser
+    retval, _ = parser.parse(s)
+    if retval is None:
+        raise ValueError("Date `{}` is not in a supported format".format(dt))
+    return retval.date()
 
 
 def get_year(logger, s):
@@ -399,11 +349,11 @@ def get_year(logger, s):
         # remove decimal and convert back to string
         return str(math.trunc(float(s)))
     else:
-        return get_date_isoformat(logger, s)
+        return get_date_isoformat(s)[0]
 
 
 def date_or_str(logger, v):
-    d = get_date_isoformat(logger, v, silent=True)
+    d, _ = get_date_isoformat(v, silent=True)
     if d is not None:
         return d
     as_string = str(v)
@@ -0,0 +1,488 @@
+"""
+Validate every sample metadata workbook under one or more paths.
+
+Excel workbooks (.xls, .xlsx), CSV/TSV files and Parquet files are read, each with the
+reader engine its content calls for (see readers.py).
+
+Workbooks are validated in parallel, one per worker process, with BaseSampleContextual.
+The per-file results are merged into a single report, ordered by file path, so the
+output is the same whatever the number of workers.
+
+    bpa-ingest-validate [--workers N] [--json] [--cache-dir DIR] PATH [PATH ...]
+
+With --cache-dir, results are cached by workbook content, path and schema (see
+result_cache.py), and workbooks which have not changed since the last run are not
+parsed again. Reports of workbooks which couldn't be read aren't cached.
+
+With --trace FILE, the time spent in each stage of validating each workbook is appended
+to FILE as JSON lines (see tracing.py), and with --profile-dir DIR a cProfile of each
+workbook is written to DIR.
+
+With --preflight, only the sheet names and header row of each workbook are read, to
+report missing and unmapped columns, and a suggested field_spec, without reading the
+data rows (see BaseSampleContextual.preflight).
+
+With --sample-registry FILE, the sample IDs of each workbook are checked against those
+of every workbook validated before with the same FILE, and then recorded in it (see
+sample_registry.py). Workbooks validated in parallel are checked and recorded by the
+main process once they are all read, in path order, so a sample ID in several of them
+is reported in all but the first, whatever the number of workers.
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import sys
+
+from .metadata_handler import BaseSampleContextual
+from .errors import ErrorBudget
+from .result_cache import DEFAULT_MAX_BYTES, ValidationCache, schema_fingerprint
+from .sample_registry import SampleRegistry, check_samples
+from .tracing import JsonLinesTracer
+
+WORKBOOK_EXTENSIONS = (".xls", ".xlsx", ".csv", ".tsv", ".parquet")
+
+
+def find_workbooks(paths):
+    """Sorted list of the workbooks in paths, directories are searched recursively"""
+    found = set()
+    for path in paths:
+        if os.path.isfile(path):
+            found.add(os.path.abspath(path))
+            continue
+        for dirpath, _dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                # skip the lock files Excel leaves next to open workbooks
+                if filename.startswith("~$"):
+                    continue
+                if filename.lower().endswith(WORKBOOK_EXTENSIONS):
+                    found.add(os.path.abspath(os.path.join(dirpath, filename)))
+    return sorted(found)
+
+
+def contextual_fingerprint(contextual):
+    """Fingerprint of everything about contextual which affects its validation results"""
+    return schema_fingerprint(
+        type(contextual).__qualname__,
+        contextual.field_spec,
+        contextual.sheet_names,
+        contextual.name_mapping,
+        contextual.metadata_unique_identifier,
+        contextual.process_row,
+        contextual.streaming,
+        contextual.engine,
+        contextual.aggregate_errors,
+        contextual.error_budget,
+    )
+
+
+def validate_file(
+    fname,
+    log_level=logging.WARNING,
+    cache_dir=None,
+    cache_max_bytes=DEFAULT_MAX_BYTES,
+    aggregate_errors=False,
+    trace_file=None,
+    profile_dir=None,
+    error_budget=None,
+    preflight=False,
+    coerce_workers=None,
+    sample_registry=None,
+    record_samples=False,
+):
+    """
+    Validate a single workbook, returning a report dict with the file name, the errors
+    found and the number of samples read. Exceptions are reported as errors, and mark
+    the file as failed. If error_budget (an errors.ErrorBudget) stopped the validation
+    early, `stopped` gives the reason and the report covers the rows read until then.
+
+    If cache_dir is set, the report and sample metadata are looked up in, and stored
+    to, a ValidationCache in that directory, unless the file failed.
+
+    If trace_file is set, spans for each stage are appended to it, and if profile_dir
+    is set a cProfile of the validation is written there.
+
+    If preflight is set, only the header is checked (see BaseSampleContextual.preflight),
+    the report has the `missing_columns` and `unmapped_columns`, and the cache isn't used.
+
+    If coerce_workers is set, the rows are coerced in chunks by that many processes,
+    which gives the same report.
+
+    If sample_registry (the path of a SampleRegistry) is set, sample IDs already
+    recorded there from other workbooks are reported as errors, and the workbook's
+    sample IDs are recorded. The cache isn't used.
+
+    If record_samples is set, the report has the workbook's `samples`, a
+    sample_registry.SampleRows (None if it couldn't be read), to be checked against a
+    registry by check_sample_registry. The cache isn't used.
+    """
+    tracer = JsonLinesTracer(trace_file) if trace_file is not None else None
+    registry = SampleRegistry(sample_registry) if sample_registry is not None else None
+    try:
+        return _validate_file(
+            fname,
+            log_level,
+            cache_dir,
+            cache_max_bytes,
+            aggregate_errors,
+            tracer,
+            profile_dir,
+            error_budget,
+            preflight,
+            coerce_workers,
+            registry,
+            record_samples,
+        )
+    finally:
+        if tracer is not None:
+            tracer.close()
+        if registry is not None:
+            registry.close()
+
+
+def _validate_file(
+    fname,
+    log_level,
+    cache_dir,
+    cache_max_bytes,
+    aggregate_errors,
+    tracer,
+    profile_dir,
+    error_budget,
+    preflight,
+    coerce_workers,
+    registry,
+    record_samples,
+):
+    contextual = BaseSampleContextual(
+        aggregate_errors=aggregate_errors,
+        tracer=tracer,
+        profile_dir=profile_dir,
+        error_budget=error_budget,
+        coerce_workers=coerce_workers,
+        sample_registry=registry,
+        record_samples=record_samples,
+    )
+    contextual.logger.setLevel(log_level)
+
+    if preflight:
+        return _preflight_file(fname, contextual)
+
+    cache = cache_key = None
+    # a cached report would miss samples recorded in the registry since, and has no
+    # samples to record
+    if cache_dir is not None and registry is None and not record_samples:
+        with contextual.tracer.span("cache_lookup", file=fname) as span:
+            cache = ValidationCache(cache_dir, cache_max_bytes)
+            cache_key = cache.key(fname, contextual_fingerprint(contextual))
+            cached = cache.get(cache_key)
+            span.set("hit", cached is not None)
+        if cached is not None:
+            return dict(cached["report"], file=fname)
+
+    report = {
+        "file": fname,
+        "sample_count": 0,
+        "errors": [],
+        "failed": False,
+        "stopped": None,
+    }
+    sample_metadata = None
+    try:
+        sample_metadata = contextual._read_metadata(fname)
+        report["sample_count"] = len(sample_metadata)
+        report["errors"] = contextual.errors
+    except Exception as e:
+        report["failed"] = True
+        report["errors"] = contextual.errors + ["{}: {}".format(type(e).__name__, e)]
+    report["stopped"] = contextual.stopped
+    if record_samples:
+        report["samples"] = contextual.samples
+
+    # a failure may not happen next time, e.g. if the file was still being written
+    if cache is not None and not report["failed"]:
+        cache.put(cache_key, {"report": report, "sample_metadata": sample_metadata})
+    return report
+
+
+def _preflight_file(fname, contextual):
+    report = {
+        "file": fname,
+        "sample_count": 0,
+        "errors": [],
+        "failed": False,
+        "stopped": None,
+        "preflight": True,
+        "missing_columns": [],
+        "unmapped_columns": [],
+    }
+    try:
+        header = contextual.preflight(fname)
+        report["missing_columns"] = header["missing_columns"]
+        report["unmapped_columns"] = header["unmapped_columns"]
+        report["errors"] = contextual.errors
+        report["stopped"] = contextual.stopped
+    except Exception as e:
+        report["failed"] = True
+        report["errors"] = contextual.errors + ["{}: {}".format(type(e).__name__, e)]
+    return report
+
+
+def validate_files(
+    fnames,
+    workers=None,
+    log_level=logging.WARNING,
+    cache_dir=None,
+    cache_max_bytes=DEFAULT_MAX_BYTES,
+    aggregate_errors=False,
+    trace_file=None,
+    profile_dir=None,
+    error_budget=None,
+    preflight=False,
+    coerce_workers=None,
+    sample_registry=None,
+):
+    """
+    Validate fnames with a pool of worker processes, returning the reports in fnames
+    order. The sample IDs of each file are checked against sample_registry, if set, by
+    this process, in fnames order.
+    """
+    validate = functools.partial(
+        validate_file,
+        log_level=log_level,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_bytes,
+        aggregate_errors=aggregate_errors,
+        trace_file=trace_file,
+        profile_dir=profile_dir,
+        error_budget=error_budget,
+        preflight=preflight,
+        coerce_workers=coerce_workers,
+        record_samples=sample_registry is not None and not preflight,
+    )
+    if workers == 1 or len(fnames) <= 1:
+        reports = [validate(fname) for fname in fnames]
+    else:
+        # only imported when needed, it is slow to import
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(validate, fnames))
+    if sample_registry is not None and not preflight:
+        check_sample_registry(sample_registry, reports)
+    return reports
+
+
+def check_sample_registry(sample_registry, reports):
+    """
+    Check the `samples` of each report, from validate_file with record_samples set,
+    against the SampleRegistry at path sample_registry and record them, in the order
+    of reports. The errors are added to the reports, and `samples` removed.
+    """
+    with SampleRegistry(sample_registry) as registry:
+        for report in reports:
+            samples = report.pop("samples", None)
+            if samples is None:
+                continue
+            report["errors"] = report["errors"] + [
+                error.format() for error in check_samples(registry, samples)
+            ]
+
+
+def merge_reports(reports):
+    """Combine per-file reports into a single report, with totals"""
+    reports = sorted(reports, key=lambda report: report["file"])
+    return {
+        "files": reports,
+        "file_count": len(reports),
+        "sample_count": sum(report["sample_count"] for report in reports),
+        "error_count": sum(len(report["errors"]) for report in reports),
+        "failed_count": sum(1 for report in reports if report["failed"]),
+        "stopped_count": sum(1 for report in reports if report.get("stopped")),
+    }
+
+
+def format_report(report):
+    lines = []
+    for file_report in report["files"]:
+        lines.append(
+            "{}: {}, {} errors{}{}".format(
+                file_report["file"],
+                "header only"
+                if file_report.get("preflight")
+                else "{} samples".format(file_report["sample_count"]),
+                len(file_report["errors"]),
+                " (FAILED)" if file_report["failed"] else "",
+                " (STOPPED: {})".format(file_report["stopped"])
+                if file_report.get("stopped")
+                else "",
+            )
+        )
+        for error in file_report["errors"]:
+            lines.append("    " + error.replace("\n", "\n    "))
+    lines.append(
+        "Validated {} files: {} samples, {} errors, {} failed".format(
+            report["file_count"],
+            report["sample_count"],
+            report["error_count"],
+            report["failed_count"],
+        )
+    )
+    return "\n".join(lines)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="bpa-ingest-validate",
+        description="Validate BPA sample metadata workbooks (.xls/.xlsx/.csv/.tsv/.parquet).",
+    )
+    parser.add_argument(
+        "paths", nargs="+", metavar="PATH", help="workbook, or directory to search"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="write the report as JSON"
+    )
+    parser.add_argument(
+        "--aggregate-errors",
+        action="store_true",
+        help="report repeated errors once per field and kind, with counts and row ranges",
+    )
+    parser.add_argument(
+        "--coerce-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="coerce the rows of each workbook in chunks with N processes, "
+        "for workbooks with very many rows (use with --workers 1)",
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help="only check the sheet names and header row, don't read the data rows",
+    )
+    budget = parser.add_argument_group(
+        "error budget", "stop reading a workbook early once it is clearly broken"
+    )
+    budget.add_argument(
+        "--max-errors", type=int, default=None, help="stop after this many errors"
+    )
+    budget.add_argument(
+        "--max-field-errors",
+        type=int,
+        default=None,
+        help="stop after this many errors in any one field",
+    )
+    budget.add_argument(
+        "--max-error-ratio",
+        type=float,
+        default=None,
+        help="stop if more than this fraction of rows have errors",
+    )
+    budget.add_argument(
+        "--sample-rows",
+        type=int,
+        default=ErrorBudget().sample_rows,
+        help="rows read before --max-error-ratio is checked (default: %(default)s)",
+    )
+    budget.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="don't read the rows of a workbook missing a required column",
+    )
+    parser.add_argument(
+        "--sample-registry",
+        default=None,
+        metavar="FILE",
+        help="report sample IDs already used by workbooks validated before, "
+        "and record those of these workbooks, in the SQLite file FILE",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="cache results here, and skip workbooks that have not changed",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="size cap of the cache in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="append the time spent in each stage, per workbook, to FILE as JSON lines",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        metavar="DIR",
+        help="write a cProfile of each workbook to DIR",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="log level for the validation logging (default: WARNING)",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file=sys.stderr)
+        return 2
+    if args.coerce_workers is not None and args.coerce_workers < 1:
+        print("--coerce-workers must be at least 1", file=sys.stderr)
+        return 2
+
+    error_budget = None
+    if (
+        args.max_errors is not None
+        or args.max_field_errors is not None
+        or args.max_error_ratio is not None
+        or args.fail_fast
+    ):
+        error_budget = ErrorBudget(
+            max_errors=args.max_errors,
+            max_field_errors=args.max_field_errors,
+            max_error_ratio=args.max_error_ratio,
+            sample_rows=args.sample_rows,
+            stop_on_missing_column=args.fail_fast,
+        )
+
+    fnames = find_workbooks(args.paths)
+    reports = validate_files(
+        fnames,
+        workers=args.workers,
+        log_level=getattr(logging, args.log_level),
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_size * 1024 * 1024,
+        aggregate_errors=args.aggregate_errors,
+        trace_file=args.trace,
+        profile_dir=args.profile_dir,
+        error_budget=error_budget,
+        preflight=args.preflight,
+        coerce_workers=args.coerce_workers,
+        sample_registry=args.sample_registry,
+    )
+    report = merge_reports(reports)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+    return 1 if report["error_count"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Memoization for coerce functions.
+
+Sample sheets repeat the same handful of values (custodians, depths, "NA" placeholders)
+thousands of times, and the coerce functions redo their regex matching and string
+cleanup for every cell. MemoizedCoerce puts a size bounded LRU cache in front of any
+coerce function. Values are keyed on their type as well as their value, so 1, 1.0 and
+True are cached separately, as the coerce functions treat them differently.
+"""
+
+import functools
+
+DEFAULT_MAXSIZE = 4096
+
+
+class MemoizedCoerce:
+    """
+    A coerce function with an LRU cache of its results.
+
+    func: coerce function taking a single value, returning (value, error)
+    maxsize: number of distinct values to keep results for
+    """
+
+    def __init__(self, func, maxsize=DEFAULT_MAXSIZE):
+        self.func = func
+        self.maxsize = maxsize
+        self._cached = functools.lru_cache(maxsize=maxsize, typed=True)(func)
+
+    def __call__(self, val):
+        try:
+            return self._cached(val)
+        except TypeError:
+            # unhashable value, these are rare enough not to count
+            return self.func(val)
+
+    def cache_info(self):
+        """(hits, misses, maxsize, currsize) of the cache"""
+        return self._cached.cache_info()
+
+    def cache_clear(self):
+        self._cached.cache_clear()
+
+    def __repr__(self):
+        return "MemoizedCoerce({!r}, maxsize={})".format(self.func, self.maxsize)
+
+    def __getstate__(self):
+        return {"func": self.func, "maxsize": self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state["func"], state["maxsize"])
+
+
+def memoize_coerce(func, maxsize=DEFAULT_MAXSIZE):
+    if func is None or isinstance(func, MemoizedCoerce):
+        return func
+    return MemoizedCoerce(func, maxsize)
+
+
+def memoize_field_spec(field_spec, maxsize=DEFAULT_MAXSIZE):
+    """Copy of field_spec with every coerce function memoized, SkipColumns are unchanged"""
+    return [
+        spec._replace(coerce=memoize_coerce(spec.coerce, maxsize))
+        if hasattr(spec, "coerce")
+        else spec
+        for spec in field_spec
+    ]
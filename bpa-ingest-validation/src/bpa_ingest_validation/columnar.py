@@ -0,0 +1,188 @@
+"""
+Column-at-a-time versions of the coerce functions in bpa_ingest_validations.
+
+Each batch function takes the list of (already date-converted and stripped) values for
+one column and returns two lists of the same length: the coerced values, and the error
+for each value (or None). The common shapes of value - Excel floats, blank cells, plain
+numeric strings and canonical BPA IDs - are converted in bulk, with pandas/NumPy or with
+string operations over the whole column (see extract_ands_ids); any value that does not
+fit one of those shapes falls back to the scalar coerce function, so results and error
+messages are identical to applying the scalar function cell by cell.
+
+coerce_chunk() coerces a chunk of rows given as plain cell types and values, so that
+ExcelWrapper.get_all(workers=N) can hand chunks of one sheet to worker processes.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from .bpa_ingest_validations import (
+    extract_ands_id,
+    extract_ands_ids,
+    get_clean_number,
+    get_int,
+    int_or_comment,
+)
+from .coerce_cache import MemoizedCoerce
+from .excel_wrapper import XL_CELL_DATE, XL_CELL_TEXT, xldate_to_datetime
+
+# strings float() accepts and that need no further cleaning
+number_str_re = r"-?\d+(?:\.\d*)?"
+
+
+def batch_coerce(func, values):
+    """Apply coerce function func to a whole column, returning (values, errors)"""
+    if isinstance(func, MemoizedCoerce) and func.func in batch_coercers:
+        # the batch path already handles the repeated values memoization is for
+        func = func.func
+    batch_func = batch_coercers.get(func)
+    if batch_func is None:
+        out = [None] * len(values)
+        errors = [None] * len(values)
+        return _scalar_coerce(func, values, range(len(values)), out, errors)
+    return batch_func(values)
+
+
+def coerce_chunk(columns, funcs, datemode, nrows, coerce_times=None):
+    """
+    Coerce a chunk of nrows rows, a column at a time.
+
+    columns: for each field, the (ctypes, values) of its cells, or None if the field
+        has no column
+    funcs: for each field, (name, coerce function or None)
+    datemode: the workbook's datemode, for converting dates
+    coerce_times: if given, the seconds spent in each coerce function are added to it,
+        by field name
+
+    Returns (columns, errors), errors being (row offset, field position, stage, error)
+    in the order coercing cell by cell reports them. Stage 0 errors are dates which
+    could not be converted, with the cell value as the error, stage 1 errors are from
+    the coerce functions.
+    """
+    out = []
+    errors = []
+    for field_idx, ((name, func), column) in enumerate(zip(funcs, columns)):
+        if column is None:
+            out.append([None] * nrows)
+            continue
+        ctypes, values = column
+        values = list(values)
+        for offset, ctype in enumerate(ctypes):
+            if ctype == XL_CELL_DATE:
+                try:
+                    values[offset] = xldate_to_datetime(values[offset], datemode)
+                except ValueError:
+                    errors.append((offset, field_idx, 0, values[offset]))
+            elif ctype == XL_CELL_TEXT:
+                values[offset] = values[offset].strip()
+        if func is not None:
+            started = time.perf_counter()
+            values, column_errors = batch_coerce(func, values)
+            if coerce_times is not None:
+                coerce_times[name] = (
+                    coerce_times.get(name, 0.0) + time.perf_counter() - started
+                )
+            for offset, error in enumerate(column_errors):
+                if error:
+                    errors.append((offset, field_idx, 1, error))
+        out.append(values)
+    errors.sort(key=lambda t: t[:3])
+    return out, errors
+
+
+def coerce_chunk_timed(columns, funcs, datemode, nrows):
+    """coerce_chunk, returning the seconds spent in each coerce function with the result"""
+    coerce_times = {}
+    return coerce_chunk(columns, funcs, datemode, nrows, coerce_times), coerce_times
+
+
+def _scalar_coerce(func, values, positions, out, errors):
+    for pos in positions:
+        out[pos], errors[pos] = func(values[pos])
+    return out, errors
+
+
+def _split_column(values):
+    """Series of the column, plus masks for the fast-path value shapes"""
+    series = pd.Series(values, dtype=object)
+    types = series.map(type)
+    is_float = (types == float).to_numpy()
+    is_str = (types == str).to_numpy()
+    is_none = (types == type(None)).to_numpy()
+    strings = series[is_str]
+    is_blank = np.zeros(len(values), dtype=bool)
+    is_blank[is_str] = (strings == "").to_numpy()
+    is_number_str = np.zeros(len(values), dtype=bool)
+    is_number_str[is_str] = strings.str.fullmatch(number_str_re).to_numpy(dtype=bool)
+    return series, is_float, is_str, is_none, is_blank, is_number_str
+
+
+def _finite(series, mask):
+    """
+    mask narrowed to the floats, or numeric strings, which convert to an int64 without
+    overflow
+    """
+    finite = np.zeros(len(mask), dtype=bool)
+    floats = series[mask].astype(float).to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        finite[mask] = np.isfinite(floats) & (np.abs(floats) < 2.0**63)
+    return finite
+
+
+def _assign(out, mask, values):
+    for pos, value in zip(np.flatnonzero(mask).tolist(), values):
+        out[pos] = value
+
+
+def batch_get_clean_number(values):
+    series, is_float, _, is_none, is_blank, is_number_str = _split_column(values)
+    out = [None] * len(values)
+    errors = [None] * len(values)
+    _assign(out, is_float, series[is_float].tolist())
+    _assign(out, is_number_str, series[is_number_str].astype(float).tolist())
+    # None and "" both come back as (None, None), which is already in place
+    fallback = ~(is_float | is_number_str | is_none | is_blank)
+    return _scalar_coerce(get_clean_number, values, np.flatnonzero(fallback).tolist(), out, errors)
+
+
+def batch_get_int(values):
+    series, is_float, _, is_none, is_blank, is_number_str = _split_column(values)
+    out = [None] * len(values)
+    errors = [None] * len(values)
+    is_finite = _finite(series, is_float)
+    is_int_str = _finite(series, is_number_str)
+    _assign(out, is_finite, series[is_finite].astype(float).astype(np.int64).tolist())
+    _assign(
+        out,
+        is_int_str,
+        series[is_int_str].astype(float).astype(np.int64).tolist(),
+    )
+    fallback = ~(is_finite | is_int_str | is_none | is_blank)
+    return _scalar_coerce(get_int, values, np.flatnonzero(fallback).tolist(), out, errors)
+
+
+def batch_int_or_comment(values):
+    series, is_float, _, is_none, is_blank, is_number_str = _split_column(values)
+    out = [None] * len(values)
+    errors = [None] * len(values)
+    is_finite = _finite(series, is_float)
+    is_int_str = _finite(series, is_number_str)
+    for mask in (is_finite, is_int_str):
+        _assign(out, mask, series[mask].astype(float).astype(np.int64).astype(str).tolist())
+    fallback = ~(is_finite | is_int_str | is_none | is_blank)
+    return _scalar_coerce(int_or_comment, values, np.flatnonzero(fallback).tolist(), out, errors)
+
+
+def batch_extract_ands_id(values):
+    # string operations over the whole column beat pandas here, see extract_ands_ids
+    return extract_ands_ids(values)
+
+
+batch_coercers = {
+    get_clean_number: batch_get_clean_number,
+    get_int: batch_get_int,
+    int_or_comment: batch_int_or_comment,
+    extract_ands_id: batch_extract_ands_id,
+}
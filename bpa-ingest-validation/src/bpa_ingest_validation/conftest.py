@@ -0,0 +1,29 @@
+import openpyxl
+import pytest
+
+# the columns of the smallest sample metadata sheet BaseSampleContextual reads
+SAMPLE_HEADER = ["bioplatforms_sample_id", "sample_id"]
+
+
+@pytest.fixture
+def make_workbook():
+    """
+    Factory saving an .xlsx workbook at path, with a `Sample metadata' sheet of header
+    and rows, and returning the path as a string.
+
+    merged: cell ranges to merge, e.g. "A2:A4"
+    """
+
+    def make(path, rows, header=SAMPLE_HEADER, merged=()):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = "Sample metadata"
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+        for cell_range in merged:
+            sheet.merge_cells(cell_range)
+        workbook.save(path)
+        return str(path)
+
+    return make
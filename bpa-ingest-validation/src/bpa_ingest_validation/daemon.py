@@ -0,0 +1,493 @@
+"""
+A long running validation service, so that many small validations don't each pay for
+starting Python and importing the readers.
+
+The service keeps a pool of worker processes, warmed up at start, and accepts jobs over
+HTTP on localhost or on a Unix socket:
+
+    POST /validate   JSON {"paths": [...], "aggregate_errors": false}; paths are files or
+                     directories (searched as by the CLI), relative to the service's
+                     working directory
+    POST /upload     the file itself as the body, with its name in an X-Filename header
+    GET  /health     status, and how many files are queued
+
+Each file is validated with cli.validate_file, and its report (the same dict the CLI
+reports per file) is streamed back as a line of JSON as soon as it is ready, followed
+by a line {"summary": {...}} with the totals.
+
+At most queue_size files are queued or being validated at once. A job with more files
+than there is room for queues what fits, and the rest of its files as its first ones
+finish. A job which arrives when there is no room at all is refused with 503 Service
+Unavailable and a Retry-After header, rather than queued without bound, so callers
+slow down when the service is saturated.
+
+    bpa-ingest-validate-daemon [--listen 127.0.0.1:8765 | --listen unix:/path/to.sock]
+        [--workers N] [--queue-size 64] [--cache-dir DIR]
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .cli import find_workbooks, merge_reports, validate_file
+from .result_cache import DEFAULT_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LISTEN = "127.0.0.1:8765"
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+UNIX_PREFIX = "unix:"
+RETRY_AFTER_SECONDS = 1
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _warm_up():
+    """Import everything a validation needs, so the first job doesn't pay for it"""
+    import openpyxl  # noqa: F401
+    import xlrd  # noqa: F401
+
+    from . import metadata_handler, xlsx_reader  # noqa: F401
+
+    return os.getpid()
+
+
+def summarize(reports):
+    summary = merge_reports(reports)
+    del summary["files"]
+    return summary
+
+
+class ValidationService:
+    """
+    The worker pool, and the bounded count of files queued on it.
+
+    workers: number of worker processes (default: number of CPUs)
+    queue_size: most files queued or being validated at once
+    cache_dir, cache_max_bytes, log_level: passed to cli.validate_file
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        cache_dir=None,
+        cache_max_bytes=DEFAULT_MAX_BYTES,
+        log_level=logging.WARNING,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self._validate = functools.partial(
+            validate_file,
+            log_level=log_level,
+            cache_dir=cache_dir,
+            cache_max_bytes=cache_max_bytes,
+        )
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # notified as files finish, for jobs waiting for room
+        self._room = threading.Condition()
+        self.pending = 0
+
+    def warm_up(self):
+        """Start every worker process, and import the validation code in it"""
+        futures = [self._executor.submit(_warm_up) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def _reserve(self, count, block=False):
+        """
+        Reserve room for up to count files, returning how many. If there is no room,
+        returns 0, or if block is set, waits for some.
+        """
+        with self._room:
+            while block and self.pending >= self.queue_size:
+                self._room.wait()
+            count = max(0, min(count, self.queue_size - self.pending))
+            self.pending += count
+            return count
+
+    def _release(self, _future=None):
+        with self._room:
+            self.pending -= 1
+            self._room.notify_all()
+
+    def validate(self, fnames, aggregate_errors=False, display_names=None):
+        """
+        Yields the report for each of fnames as it completes. Raises QueueFull, before
+        anything is queued, if there is no room for any of them; otherwise as many are
+        queued as there is room for, and the others as room is freed.
+
+        display_names: file name to report for each of fnames, e.g. for uploads
+        """
+        if not fnames:
+            return
+        reserved = self._reserve(len(fnames))
+        if not reserved:
+            raise QueueFull("{} files queued, no room for more".format(self.pending))
+        futures = {}
+        queued = 0
+        while True:
+            start = queued
+            try:
+                for idx in range(start, start + reserved):
+                    future = self._executor.submit(
+                        self._validate, fnames[idx], aggregate_errors=aggregate_errors
+                    )
+                    future.add_done_callback(self._release)
+                    futures[future] = idx
+                    queued += 1
+            except BaseException:
+                # release the reservations that no future was created for
+                for _ in range(start + reserved - queued):
+                    self._release()
+                raise
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield self._report(future, fnames, futures.pop(future), display_names)
+            remaining = len(fnames) - queued
+            # wait for room only when none of this job's files are left to free it
+            reserved = self._reserve(remaining, block=not futures) if remaining else 0
+
+    def _report(self, future, fnames, idx, display_names):
+        try:
+            report = future.result()
+        except Exception as e:
+            # the worker died, e.g. killed for running out of memory
+            report = {
+                "file": fnames[idx],
+                "sample_count": 0,
+                "errors": ["{}: {}".format(type(e).__name__, e)],
+                "failed": True,
+            }
+        if display_names is not None:
+            report["file"] = display_names[idx]
+        return report
+
+    def health(self):
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "pending": self.pending,
+            "queue_size": self.queue_size,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ValidationRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "bpa-ingest-validate"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix socket peers have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return self.server.server_name
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf8") + b"\n"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=()):
+        self._send_json(status, {"error": message}, headers)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream_reports(self, reports):
+        """Send each report as a line of JSON as it arrives, then the totals"""
+        try:
+            first = next(reports)
+        except QueueFull as e:
+            self._send_error(503, str(e), [("Retry-After", str(RETRY_AFTER_SECONDS))])
+            return
+        except StopIteration:
+            first = None
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        done = []
+        if first is not None:
+            done.append(first)
+            self._write_chunk(json.dumps(first).encode("utf8") + b"\n")
+        for report in reports:
+            done.append(report)
+            self._write_chunk(json.dumps(report).encode("utf8") + b"\n")
+        self._write_chunk(json.dumps({"summary": summarize(done)}).encode("utf8") + b"\n")
+        self._write_chunk(b"")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length).decode("utf8") or "{}")
+        except ValueError as e:
+            raise ValueError("request body is not JSON: {}".format(e))
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_error(404, "no such endpoint: {}".format(self.path))
+            return
+        self._send_json(200, self.service.health())
+
+    def do_POST(self):
+        if self.path == "/validate":
+            self._validate_paths()
+        elif self.path == "/upload":
+            self._validate_upload()
+        else:
+            self._send_error(404, "no such endpoint: {}".format(self.path))
+
+    def _validate_paths(self):
+        try:
+            body = self._read_json()
+            paths = body["paths"]
+            if isinstance(paths, str) or not all(isinstance(p, str) for p in paths):
+                raise ValueError("paths must be a list of strings")
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_error(400, "expected {{\"paths\": [...]}}: {}".format(e))
+            return
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            self._send_error(400, "not found: {}".format(", ".join(missing)))
+            return
+        fnames = find_workbooks(paths)
+        self._stream_reports(
+            self.service.validate(
+                fnames, aggregate_errors=bool(body.get("aggregate_errors"))
+            )
+        )
+
+    def _validate_upload(self):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._send_error(411, "Content-Length is required")
+            return
+        length = int(length)
+        if length > self.server.max_upload_bytes:
+            self._send_error(
+                413, "upload is larger than {} bytes".format(self.server.max_upload_bytes)
+            )
+            return
+        # only the base name is used, the upload is stored in a directory of its own
+        filename = self.headers.get("X-Filename")
+        display_name = os.path.basename(filename) if filename else "upload"
+        if display_name in ("", ".", "..") or "\0" in display_name:
+            # the upload isn't read, so the connection can't be reused
+            self.close_connection = True
+            self._send_error(400, "X-Filename is not a file name: {!r}".format(filename))
+            return
+        tmpdir = tempfile.mkdtemp(prefix="bpa-ingest-validate-")
+        try:
+            fname = os.path.join(tmpdir, display_name)
+            with open(fname, "wb") as fd:
+                remaining = length
+                while remaining:
+                    block = self.rfile.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    fd.write(block)
+                    remaining -= len(block)
+            self._stream_reports(
+                self.service.validate(
+                    [fname],
+                    aggregate_errors=self.headers.get("X-Aggregate-Errors") == "1",
+                    display_names=[display_name],
+                )
+            )
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class ValidationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+        self.service = service
+        self.max_upload_bytes = max_upload_bytes
+        super().__init__(address, ValidationRequestHandler)
+
+
+class UnixValidationServer(ValidationServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def parse_listen(listen):
+    """(server class, address) for a host:port or unix:/path address"""
+    if listen.startswith(UNIX_PREFIX):
+        return UnixValidationServer, listen[len(UNIX_PREFIX) :]
+    host, _, port = listen.rpartition(":")
+    return ValidationServer, (host or "127.0.0.1", int(port))
+
+
+def make_server(listen, service, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES):
+    server_class, address = parse_listen(listen)
+    return server_class(address, service, max_upload_bytes)
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def connect(listen, timeout=None):
+    """HTTPConnection to the service listening on listen"""
+    server_class, address = parse_listen(listen)
+    if server_class is UnixValidationServer:
+        return _UnixHTTPConnection(address, timeout=timeout)
+    return HTTPConnection(address[0], address[1], timeout=timeout)
+
+
+def request_validation(listen, paths, aggregate_errors=False, timeout=None):
+    """
+    Ask the service on listen to validate paths, yielding each line of its response: the
+    reports, then the summary. Raises QueueFull if the service is saturated.
+    """
+    connection = connect(listen, timeout)
+    try:
+        body = json.dumps({"paths": paths, "aggregate_errors": aggregate_errors})
+        connection.request(
+            "POST", "/validate", body, {"Content-Type": "application/json"}
+        )
+        response = connection.getresponse()
+        if response.status == 503:
+            raise QueueFull(json.loads(response.read())["error"])
+        if response.status != 200:
+            raise RuntimeError(
+                "{} {}: {}".format(response.status, response.reason, response.read())
+            )
+        for line in response:
+            yield json.loads(line)
+    finally:
+        connection.close()
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="bpa-ingest-validate-daemon",
+        description="Serve validations of BPA sample metadata from a warm worker pool.",
+    )
+    parser.add_argument(
+        "--listen",
+        default=DEFAULT_LISTEN,
+        help="host:port, or unix:/path for a Unix socket (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="most files queued at once, jobs arriving when it is full are refused "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-upload-size",
+        type=int,
+        default=DEFAULT_MAX_UPLOAD_BYTES // (1024 * 1024),
+        help="largest upload accepted, in MiB (default: %(default)s)",
+    )
+    parser.add_argument("--cache-dir", default=None, help="see bpa-ingest-validate")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="size cap of the cache in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="log level for the validation logging (default: WARNING)",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file=sys.stderr)
+        return 2
+    logging.basicConfig(level=logging.INFO)
+
+    service = ValidationService(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_size * 1024 * 1024,
+        log_level=getattr(logging, args.log_level),
+    )
+    try:
+        service.warm_up()
+        server = make_server(args.listen, service, args.max_upload_size * 1024 * 1024)
+        logger.info(
+            "listening on %s with %d workers", args.listen, service.workers
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
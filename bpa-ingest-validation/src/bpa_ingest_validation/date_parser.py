@@ -0,0 +1,126 @@
+"""
+Date parsing for spreadsheet columns.
+
+Dates arrive as free text in a handful of formats. Trying each format in turn with
+datetime.strptime costs an exception per miss, so a column written as dd/mm/YY pays for
+every format listed before it, on every cell. A DateParser remembers the format that
+last succeeded and tries it first, and keeps a bounded cache of string -> result, so a
+column in a consistent format parses each distinct value once with a single strptime.
+
+The supported formats do not overlap (no string parses under two of them to different
+dates), so trying them in a learned order gives the same result as the listed order.
+"""
+
+import datetime
+from collections import OrderedDict
+
+# placeholder values for "no date", these are not reported as errors
+DATE_SENTINELS = frozenset(
+    [
+        "unknown",
+        "Unknown",
+        "UnkNown",
+        "unkNown",
+        "event date not recorded",
+        "Not yet assigned",
+        "Not applicable",
+        "not applicable",
+        "no information",
+        "Not submitted",
+        "not determined",
+        "To be filled in",
+        "(null)",
+        "NA",
+        "n/a",
+        "TBA",
+        "No record",
+    ]
+)
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y-%m",
+    "%Y-%b-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d.%m.%y",
+    "%m/%Y",
+    "%d/%m/%y",
+    "%Y-%m-%d %H:%M:%S",
+    "%y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%MZ",
+)
+
+DATE_TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%MZ",
+    "%Y-%m-%d %H:%M:%S",
+    "%y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%y-%m-%d %H:%M",
+)
+
+# date time formats that carry no timezone, which are assumed to be in Z time
+NAIVE_DATE_TIME_FORMATS = frozenset(
+    [
+        "%Y-%m-%d %H:%M:%S",
+        "%y-%m-%d %H:%M:%S",
+        "%Y-%m-%d %H:%M",
+        "%y-%m-%d %H:%M",
+    ]
+)
+
+
+class DateParser:
+    """
+    Parses strings against a list of strptime formats, trying the most recently
+    successful format first.
+
+    formats: strptime formats, in order of preference
+    maxsize: number of distinct strings to keep parse results for
+    """
+
+    def __init__(self, formats=DATE_FORMATS, maxsize=1024):
+        self._formats = tuple(formats)
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    @property
+    def formats(self):
+        return self._formats
+
+    def parse(self, s):
+        """Returns (datetime, format) for the string s, or (None, None) if no format matches"""
+        cache = self._cache
+        try:
+            result = cache[s]
+            cache.move_to_end(s)
+            return result
+        except KeyError:
+            pass
+        result = self._parse(s)
+        cache[s] = result
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return result
+
+    def _parse(self, s):
+        formats = self._formats
+        for idx, fmt in enumerate(formats):
+            try:
+                value = datetime.datetime.strptime(s, fmt)
+            except ValueError:
+                continue
+            if idx > 0:
+                self._formats = (fmt,) + formats[:idx] + formats[idx + 1 :]
+            return value, fmt
+        return None, None
+
+    def __getstate__(self):
+        # the cache is only an optimisation, don't ship it to other processes
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        return state
@@ -0,0 +1,305 @@
+"""
+Validation errors, recorded as their parts and formatted only when read.
+
+A dirty sheet can produce an error for most of its cells. Building the message for each
+one (column letter, file basename, string formatting) as it is found, and logging it,
+costs more than the validation itself when nobody reads the messages. ExcelWrapper keeps
+a ValidationError per error instead; the text is produced by format() when the errors
+are read, or by the logging module if, and only if, the record is actually emitted.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict, namedtuple
+
+# the templates are str.format strings, positional fields are the record's args and the
+# named fields are the record's attributes (see ValidationError.format)
+CELL_ERROR = "Field {field}, Cell {column_letter}:{row} in {basename}, {sheet}: {0}"
+DATE_ERROR = "column: `{column}' -- value `{0}' cannot be converted to a date"
+HEADER_NOT_STRING = "header is not a string: {0} `{1}'"
+MISSING_COLUMN = "{code}: Column `{0}' not found in `{basename}' `{sheet}'"
+UNMAPPED_COLUMN = "{code}: Column `{0}` in `{basename}` `{sheet}` is not mapped to an output field in the codebase."
+SUGGESTED_TEMPLATE = "{file_name} @ {sheet} - suggested template is:\n{0}"
+MISSING_SHEET = "Missing sheet named '{0}' in {file_name}"
+AVAILABLE_SHEETS = "Available sheets are {0}"
+UNEXPECTED_SHEET = "Using the sheet named {sheet} in {file_name}, instead of {0}"
+FIRST_SHEET = "Using the FIRST sheet (named {sheet}) in {file_name}"
+MESSAGE = "{0}"
+STOPPED = "Stopped reading `{basename}' `{sheet}' after {row} rows: {0}"
+REUSED_SAMPLE_ID = (
+    "{field} {0} in `{basename}' `{sheet}' row {row} was already submitted in "
+    "`{1}' `{2}' row {3}"
+)
+
+
+def get_column_letter(idx):
+    """Spreadsheet column letter(s) for the one based column index idx, e.g. 28 -> AB"""
+    letters = ""
+    while idx > 0:
+        idx, remainder = divmod(idx - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class ValidationError:
+    """
+    A single error found in a workbook.
+
+    template: str.format template for the message, see format()
+    args: positional values for the template
+    code: error code, e.g. E3001, if the error has one
+    field: attribute name of the field (FieldDefinition.attribute) the error is for
+    column: zero based column index
+    row: row number, counting data rows from 1
+    file_name: workbook the error was found in
+    sheet: name of the sheet the error was found in
+    """
+
+    __slots__ = (
+        "code",
+        "field",
+        "column",
+        "row",
+        "file_name",
+        "sheet",
+        "template",
+        "args",
+    )
+
+    def __init__(
+        self,
+        template,
+        args=(),
+        code=None,
+        field=None,
+        column=None,
+        row=None,
+        file_name=None,
+        sheet=None,
+    ):
+        self.template = template
+        self.args = args
+        self.code = code
+        self.field = field
+        self.column = column
+        self.row = row
+        self.file_name = file_name
+        self.sheet = sheet
+
+    @property
+    def column_letter(self):
+        if self.column is None:
+            return None
+        return get_column_letter(self.column + 1)
+
+    def format(self):
+        return self.template.format(
+            *self.args,
+            code=self.code,
+            field=self.field,
+            column=self.column,
+            column_letter=self.column_letter,
+            row=self.row,
+            file_name=self.file_name,
+            basename=os.path.basename(self.file_name) if self.file_name else None,
+            sheet=self.sheet,
+        )
+
+    __str__ = format
+
+    def _key(self):
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, ValidationError):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return "ValidationError({!r})".format(self.format())
+
+    def __getstate__(self):
+        return self._key()
+
+    def __setstate__(self, state):
+        for attr, value in zip(self.__slots__, state):
+            setattr(self, attr, value)
+
+
+# values quoted in messages, e.g. Date `12/13/2021` is not in a supported format
+_quoted_value_re = re.compile(r"`[^`']*[`']")
+
+
+def error_kind(error):
+    """
+    What sort of error this is, ignoring the offending value: the code if the error has one,
+    otherwise the coerce function's message up to the value
+    """
+    if error.code is not None:
+        return error.code
+    if error.template == CELL_ERROR:
+        message = _quoted_value_re.sub("`...`", str(error.args[0]))
+        return message.split(": ", 1)[0].strip()
+    return error.template
+
+
+class ErrorGroup:
+    """Errors with the same field and kind: a count, the first few, and the rows they are in"""
+
+    def __init__(self, field, kind, max_examples):
+        self.field = field
+        self.kind = kind
+        self.count = 0
+        self.examples = []
+        # [first, last] pairs of consecutive row numbers
+        self.row_ranges = []
+        self._max_examples = max_examples
+
+    def add(self, error):
+        self.count += 1
+        if len(self.examples) < self._max_examples:
+            self.examples.append(error)
+        row = error.row
+        if row is None:
+            return
+        if self.row_ranges and self.row_ranges[-1][1] + 1 >= row >= self.row_ranges[-1][0]:
+            self.row_ranges[-1][1] = max(self.row_ranges[-1][1], row)
+        else:
+            self.row_ranges.append([row, row])
+
+    def format_rows(self):
+        return ", ".join(
+            str(first) if first == last else "{}-{}".format(first, last)
+            for first, last in self.row_ranges
+        )
+
+    def format(self):
+        if self.count == 1:
+            return self.examples[0].format()
+        if self.field is not None:
+            summary = "Field {}: {} errors".format(self.field, self.count)
+        else:
+            summary = "{} errors".format(self.count)
+        if self.row_ranges:
+            summary += " in rows {}".format(self.format_rows())
+        summary += ": {} (first {} shown)".format(self.kind, len(self.examples))
+        lines = [summary]
+        lines.extend("  " + error.format() for error in self.examples)
+        return "\n".join(lines)
+
+
+class ErrorAggregator:
+    """
+    Collects errors into an ErrorGroup per (field, error kind), so a column that is wrong
+    in every row is reported once, with a count and its row ranges, rather than per cell.
+
+    max_examples: number of errors kept, in full, for each group
+    """
+
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self._groups = OrderedDict()
+
+    def add(self, error):
+        """Add error, returning the group it was added to"""
+        key = (error.field, error_kind(error))
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = ErrorGroup(key[0], key[1], self.max_examples)
+        group.add(error)
+        return group
+
+    def groups(self):
+        return list(self._groups.values())
+
+    def count(self):
+        return sum(group.count for group in self._groups.values())
+
+    def examples(self):
+        return [error for group in self._groups.values() for error in group.examples]
+
+    def format(self):
+        return [group.format() for group in self._groups.values()]
+
+
+class ErrorBudget(
+    namedtuple(
+        "ErrorBudget",
+        [
+            "max_errors",
+            "max_field_errors",
+            "max_error_ratio",
+            "sample_rows",
+            "stop_on_missing_column",
+        ],
+        defaults=[None, None, None, 100, False],
+    )
+):
+    """
+    When to give up on a sheet, rather than read every row of a sheet that is clearly
+    broken. ExcelWrapper stops reading rows as soon as any limit is passed.
+
+    max_errors: most cell errors in the sheet
+    max_field_errors: most cell errors in any one field
+    max_error_ratio: largest fraction of rows with errors, checked once sample_rows rows
+        have been read, and after each row from then on
+    sample_rows: rows to read before checking max_error_ratio
+    stop_on_missing_column: read no rows at all if a required column is missing
+    """
+
+    __slots__ = ()
+
+    def exceeded(self, rows, error_count, error_rows, field_error_counts):
+        """Why reading should stop, given the errors after rows rows, or None"""
+        if self.max_errors is not None and error_count > self.max_errors:
+            return "more than {} errors".format(self.max_errors)
+        if self.max_field_errors is not None and field_error_counts:
+            field, count = max(field_error_counts.items(), key=lambda t: t[1])
+            if count > self.max_field_errors:
+                return "more than {} errors in field {}".format(self.max_field_errors, field)
+        if (
+            self.max_error_ratio is not None
+            and rows >= self.sample_rows
+            and error_rows > self.max_error_ratio * rows
+        ):
+            return "{} of the first {} rows have errors".format(error_rows, rows)
+        return None
+
+
+class RateLimitedLogger:
+    """
+    Passes at most `rate` messages per `per` seconds to logger, and counts the rest.
+    The number suppressed is logged when the next window starts, or on flush().
+    """
+
+    def __init__(self, logger, rate=20, per=1.0, clock=time.monotonic):
+        self._logger = logger
+        self.rate = rate
+        self.per = per
+        self._clock = clock
+        self._window_start = None
+        self._emitted = 0
+        self.suppressed = 0
+
+    def warning(self, message):
+        now = self._clock()
+        if self._window_start is None or now - self._window_start >= self.per:
+            self.flush()
+            self._window_start = now
+            self._emitted = 0
+        if self._emitted < self.rate:
+            self._emitted += 1
+            self._logger.warning("%s", message)
+        else:
+            self.suppressed += 1
+
+    def flush(self):
+        if self.suppressed:
+            self._logger.warning(
+                "%d further validation messages were not logged", self.suppressed
+            )
+            self.suppressed = 0
@@ -12,14 +12,24 @@ as mangled by the provided method.
 """
 
 import datetime
+import heapq
+import itertools
 from collections import namedtuple, Counter, OrderedDict
 
 import re
-import os
-import xlrd
 import string
 import logging
-from openpyxl.utils.cell import get_column_letter
+
+from . import errors, readers
+from .coerce_cache import MemoizedCoerce, memoize_coerce
+from .errors import ErrorAggregator, RateLimitedLogger, ValidationError
+from .schema import compile_schema
+from .tracing import NULL_TRACER, Timed
+
+# xlrd cell types (xlrd.biffh), so that importing this module doesn't import xlrd. xlrd
+# and openpyxl are only imported once a workbook is opened.
+XL_CELL_TEXT = 1
+XL_CELL_DATE = 3
 
 SkipColumn = namedtuple("SkipColumn", ["column_name", "skip_all"])
 skip_column_default = SkipColumn("column_name", False)
@@ -37,9 +47,79 @@ def make_field_definition(attribute, column_name, **kwargs):
     )
 
 
+def xldate_to_datetime(val, datemode):
+    """
+    The Excel date val as a datetime, or as a time if it has no date part. Raises
+    ValueError if val is not a valid date.
+    """
+    from xlrd.xldate import xldate_as_tuple
+
+    date_time_tup = xldate_as_tuple(val, datemode)
+    # well ok...
+    if date_time_tup[0] == 0 and date_time_tup[1] == 0 and date_time_tup[2] == 0:
+        return datetime.time(*date_time_tup[3:])
+    return datetime.datetime(*date_time_tup)
+
+
 def make_skip_column(column_name, **kwargs):
     return skip_column_default._replace(column_name=column_name, **kwargs)
 
+class MergedCellIndex:
+    """
+    Resolves merged ranges one row at a time, as the sheet is read top to bottom.
+
+    merged_cells: xlrd style (rlo, rhi, clo, chi) ranges, rhi and chi exclusive
+
+    Only the ranges overlapping the current row are held, along with the value of each
+    range's top-left source cell, so memory is proportional to the number of merged ranges
+    and not to the number of cells they cover.
+    """
+
+    def __init__(self, merged_cells):
+        from xlrd.sheet import empty_cell
+
+        self._empty_cell = empty_cell
+        self._pending = sorted(merged_cells)
+        self._next = 0
+        self._active = []
+        self._expiry = []
+        self._source_cells = {}
+
+    def resolve(self, row_idx, row):
+        """Returns row with any merged cells replaced by the source cell of their range"""
+
+        pending = self._pending
+        while self._next < len(pending) and pending[self._next][0] <= row_idx:
+            crange = pending[self._next]
+            self._next += 1
+            if crange[1] > row_idx:
+                self._active.append(crange)
+                heapq.heappush(self._expiry, crange[1])
+        if self._expiry and self._expiry[0] <= row_idx:
+            while self._expiry and self._expiry[0] <= row_idx:
+                heapq.heappop(self._expiry)
+            for crange in self._active:
+                if crange[1] <= row_idx:
+                    self._source_cells.pop(crange, None)
+            self._active = [t for t in self._active if t[1] > row_idx]
+        if not self._active:
+            return row
+
+        row = list(row)
+        width = len(row)
+        for crange in self._active:
+            rlo, _, clo, chi = crange
+            if rlo == row_idx:
+                self._source_cells[crange] = row[clo] if clo < width else self._empty_cell
+                start = clo + 1
+            else:
+                start = clo
+            source_cell = self._source_cells.get(crange, self._empty_cell)
+            for colx in range(start, min(chi, width)):
+                row[colx] = source_cell
+        return row
+
+
 """
 class ExcelWrapperLogger(logging.LoggerAdapter):
     def process(self, msg, kwargs):
@@ -76,8 +156,30 @@ class ExcelWrapper:
     sheet_name: sheet in workbook
     header_length: first number of lines to ignore
     column_name_row_index: row in which column names are found, typically 0
+    engine: name of the reader engine for the file (see readers.py), by default the
+        engine is picked from the file's content
+    streaming: read an .xlsx workbook row by row in read-only mode, the same as
+        engine="xlsx"
+    memoize_size: if set, cache up to this many results of each coerce function, see
+        coerce_cache.py and coerce_cache_info()
+    aggregate_errors: group errors by field and kind (see errors.ErrorAggregator) keeping
+        error_examples of each, and log at most log_rate_limit messages a second
+    tracer: tracing.Tracer to report the time spent in each stage to
+    error_budget: errors.ErrorBudget, when to stop reading a sheet with too many errors.
+        If reading stops early, `stopped` says why and get_all() returns the rows read
+        up to that point. With columnar=True the budget is checked a chunk at a time.
+    session: readers.WorkbookSession to read the sheet from, rather than opening
+        file_name; engine and streaming are then the session's
+    header_only: only read the sheet names and the header row, to check the columns
+        against field_spec (see missing_required_fields(), unmapped_columns and
+        suggested_template); get_all() can't be called. Engines that can skip reading
+        the rest of the file do, see readers.open_workbook().
     """
 
+    # decode rows with a function generated for the sheet's header, see
+    # CompiledSchema.row_decoder(), rather than the generic _decode_rows()
+    generate_row_decoder = True
+
     def __init__(
         self,
         logger,
@@ -88,18 +190,66 @@ class ExcelWrapper:
         column_name_row_index=0,
         suggest_template=False,
         additional_context=None,
+        streaming=False,
+        memoize_size=None,
+        aggregate_errors=False,
+        error_examples=5,
+        log_rate_limit=20,
+        tracer=None,
+        engine=None,
+        error_budget=None,
+        header_only=False,
+        session=None,
     ):
         self._logger = logger
+        self._tracer = tracer if tracer is not None else NULL_TRACER
+        # ValidationError records, formatted on demand by get_errors()
         self._log = []
+        self._aggregator = None
+        self._rate_limited_logger = None
+        if aggregate_errors:
+            self._aggregator = ErrorAggregator(error_examples)
+            self._rate_limited_logger = RateLimitedLogger(logger, rate=log_rate_limit)
         self.file_name = file_name
+        self.sheet = None
+        self.error_budget = error_budget
+        # why reading stopped early, see ErrorBudget
+        self.stopped = None
+        # cell errors found by get_all, in total and by field
+        self._error_count = 0
+        self._field_error_counts = Counter()
+        self._error_rows = None
         self.header_length = header_length
         self.column_name_row_index = column_name_row_index
         self.field_spec = field_spec
         assert isinstance(self.field_spec[0], FieldDefinition)
+        # compiled once per field_spec, see schema.py
+        self.schema = compile_schema(field_spec)
         self.additional_context = additional_context
         self.suggest_template = suggest_template
-
-        self.workbook = xlrd.open_workbook(file_name)
+        self.memoize_size = memoize_size
+        self.header_only = header_only
+        # set by set_name_to_column_map()
+        self.unmapped_columns = []
+        self.suggested_template = None
+
+        self.streaming = streaming
+        if session is not None:
+            self.engine = session.engine
+            self.workbook = session.workbook
+        else:
+            if engine is None and streaming:
+                engine = "xlsx"
+            if engine is None:
+                engine = readers.sniff_engine(file_name)
+            self.engine = engine
+            with self._tracer.span("open_workbook", file=file_name, engine=engine):
+                self.workbook = readers.open_workbook(file_name, engine, header_only)
+        if not header_only:
+            # all the engines return xlrd cells, so xlrd is loaded by now
+            from xlrd.xldate import xldate_as_tuple
+
+            self._xldate_as_tuple = xldate_as_tuple
         self.modified = None
         try:
             self.modified = self.workbook.props["modified"]
@@ -110,30 +260,89 @@ class ExcelWrapper:
                 % file_name
             )
 
-        self.sheet = self._find_sheet_in_workbook(file_name, self.workbook, sheet_name)
+        with self._tracer.span("find_sheet", file=file_name) as span:
+            self.sheet = self._find_sheet_in_workbook(file_name, self.workbook, sheet_name)
+            span.set("sheet", self.sheet.name)
 
         self.missing_headers = []
-        self.header, self.name_to_column_map = self.set_name_to_column_map()
+        with self._tracer.span("map_header", file=file_name) as span:
+            self.header, self.name_to_column_map = self.set_name_to_column_map()
+            span.set("columns", len(self.header))
+            span.set("missing", len(self.missing_headers))
+        if hasattr(self.sheet, "project") and not header_only:
+            # engines which can, only read the columns that are mapped to a field
+            self.sheet.project(
+                i for i in self.name_to_column_map.values() if i is not None
+            )
         self.field_names = self._set_field_names()
         self.name_to_func_map = self.set_name_to_func_map()
 
+        if error_budget is not None and error_budget.stop_on_missing_column:
+            missing = self.missing_required_fields()
+            if missing:
+                self._stop(0, "required columns missing: {}".format(", ".join(missing)))
+
     def _error(self, s):
+        if not isinstance(s, ValidationError):
+            s = self._make_error(errors.MESSAGE, s)
+        if self._aggregator is not None:
+            return self._aggregator.add(s)
         self._log.append(s)
 
+    def _warn(self, error):
+        if self._aggregator is not None:
+            # only the examples kept for each group are logged
+            if self._error(error).count <= self._aggregator.max_examples:
+                self._rate_limited_logger.warning(error)
+            return
+        # logging only formats the record if the message is actually emitted
+        self._logger.warning("%s", error)
+        self._error(error)
+
+    def _make_error(self, template, *args, **kwargs):
+        if "sheet" not in kwargs and self.sheet is not None:
+            kwargs["sheet"] = self.sheet.name
+        return ValidationError(template, args, file_name=self.file_name, **kwargs)
+
+    def _stop(self, rows, reason):
+        self.stopped = reason
+        self._warn(self._make_error(errors.STOPPED, reason, row=rows))
+
+    def missing_required_fields(self):
+        """Attributes of the fields which are not optional, but have no column"""
+        return [
+            spec.attribute
+            for spec in self.field_spec
+            if isinstance(spec, FieldDefinition)
+            and not spec.optional
+            and self.name_to_column_map.get(spec.attribute) is None
+        ]
+
     def get_errors(self):
+        """The errors found so far, as messages. Aggregated errors give a message per group."""
+        if self._aggregator is not None:
+            return self._aggregator.format()
+        return [error.format() for error in self._log]
+
+    def get_error_records(self):
+        """The errors found so far, as ValidationError records, only examples if aggregated"""
+        if self._aggregator is not None:
+            return self._aggregator.examples()
         return self._log.copy()
 
+    def get_error_groups(self):
+        """The aggregated errors as errors.ErrorGroup instances, if aggregate_errors is set"""
+        if self._aggregator is None:
+            return []
+        return self._aggregator.groups()
+
+    def flush_log(self):
+        """Log the count of any messages held back by the log rate limit"""
+        if self._rate_limited_logger is not None:
+            self._rate_limited_logger.flush()
+
     def _set_field_names(self):
-        defs = [t for t in self.field_spec if isinstance(t, FieldDefinition)]
-        names = list([spec.attribute for spec in defs])
-        if len(list(names)) != len(defs):
-            # this is a problem in the bpa-ingest code, not in the passed-in spreadsheet,
-            # so we can fail hard here
-            raise Exception(
-                "duplicate attribute in field definition: %s"
-                % [t for (t, c) in Counter(names).items() if c > 1]
-            )
-        return names
+        return list(self.schema.field_names)
 
     def _find_sheet_in_workbook(self, file_name, workbook, sheet_name):
         # This method performs the following in order to find an appropriately named sheet in the given workbook:
@@ -148,6 +357,10 @@ class ExcelWrapper:
         # this lists a number of sheet names for the code to search for in the xlsx file if a sheet with the name
         # provided in the data class is not found. If new variants of sheet names are required, add them here.
 
+        if getattr(workbook, "single_sheet", False):
+            # CSV and Parquet files hold one sheet, and it has no name to look for
+            return workbook.sheet_by_index(0)
+
         possible_sheet_names = [
             "Metadata",
             "Library_Metadata",
@@ -158,21 +371,14 @@ class ExcelWrapper:
         ]
 
         sheet = None
-        available_sheet_message = "Available sheets are {}".format(
-            str(
-                workbook.sheet_names(),
-            )
+        available_sheet_message = self._make_error(
+            errors.AVAILABLE_SHEETS, str(workbook.sheet_names())
         )
         if sheet_name is not None:
             if isinstance(sheet_name, str):
                 if sheet_name not in workbook.sheet_names():
-                    missing_sheet_message = "Missing sheet named '{}' in {}".format(
-                        sheet_name, file_name
-                    )
-                    self._logger.warn( missing_sheet_message)
-                    self._error(missing_sheet_message)
-                    self._logger.warn(available_sheet_message)
-                    self._error(available_sheet_message)
+                    self._warn(self._make_error(errors.MISSING_SHEET, sheet_name))
+                    self._warn(available_sheet_message)
 
                 else:
                     sheet = workbook.sheet_by_name(sheet_name)
@@ -186,13 +392,8 @@ class ExcelWrapper:
                         break
                 if sheet is None:
                     for candidate in notfound:
-                        missing_sheet_message = "Missing sheet named '{}' in {}".format(
-                            candidate, file_name
-                        )
-                        self._logger.warn(missing_sheet_message)
-                        self._error(missing_sheet_message)
-                        self._logger.warn(available_sheet_message)
-                        self._error(available_sheet_message)
+                        self._warn(self._make_error(errors.MISSING_SHEET, candidate))
+                        self._warn(available_sheet_message)
 
             else:
                 raise TypeError
@@ -204,22 +405,19 @@ class ExcelWrapper:
                     sheet = workbook.sheet_by_name(possible_sheet)
                     if sheet_name is not None:
                         # log that we are using a possibly  unexpected sheet
-                        bad_sheet_message =  "Using the sheet named {} in {}, instead of {}".format(
-                            sheet.name, file_name, sheet_name
+                        self._warn(
+                            self._make_error(
+                                errors.UNEXPECTED_SHEET, sheet_name, sheet=sheet.name
+                            )
                         )
-                        self._logger.warn(bad_sheet_message)
-                        self._error(bad_sheet_message)
-                        self._logger.warn(available_sheet_message)
-                        self._error(available_sheet_message)
+                        self._warn(available_sheet_message)
 
                     break
 
         # Last resort, we haven't found a sheet by any of the possible names, so use the first sheet
         if sheet is None:
             sheet = workbook.sheet_by_index(0)
-            first_sheet_message = "Using the FIRST sheet (named {}) in {}".format(sheet.name, file_name)
-            self._logger.warn(first_sheet_message)
-            self._error(first_sheet_message)
+            self._warn(self._make_error(errors.FIRST_SHEET, sheet=sheet.name))
 
         if sheet.visibility > 0:
             raise Exception(
@@ -234,110 +432,37 @@ class ExcelWrapper:
         maps the named field to the actual column in the spreadsheet
         """
 
-        def coerce_header(s):
-            if not isinstance(s, str):
-                self._error("header is not a string: %s `%s'" % (type(s), repr(s)))
-                return str(s)
-            return s.strip()
-
-        header = [
-            coerce_header(t).strip().lower()
-            for t in self.sheet.row_values(self.column_name_row_index)
-        ]
-
-        # wrapper for find_column enables consistent return types with `find_all_columns_re`
-        def find_column_as_list(column_name):
-            all_index = []
-            found_index = find_column(column_name)
-            if found_index > -1:
-                all_index.append(found_index)
-            return all_index
-
-        def find_column(column_name):
-            # if has the 'match' attribute, it's a regexp
-            if hasattr(column_name, "match"):
-                return find_column_re(column_name)
-            col_index = -1
-            try:
-                col_index = header.index(column_name.strip().lower())
-            except ValueError:
-                pass
-            return col_index
-
-        def find_column_re(column_name_re):
-            for idx, name in enumerate(header):
-                if column_name_re.match(name):
-                    return idx
-            return -1
-
-        def find_all_columns_re(column_name_re):
-            all_idx = []
-            if not hasattr(column_name_re, "match"):
-                raise Exception("Column name must be a regex for find all")
-            for idx, name in enumerate(header):
-                if column_name_re.match(name):
-                    all_idx.append(idx)
-            return all_idx
-
-        cmap = {}
-        skip_columns = set()
-        missing_columns = False
-        for spec in self.field_spec:
-            if isinstance(spec, SkipColumn):
-                if spec.skip_all:
-                    skip_columns.update(find_all_columns_re(spec.column_name))
-                else:
-                    skip_columns.update(find_column_as_list(spec.column_name))
-                continue
-
-            col_descr = spec.column_name
-            if hasattr(spec.column_name, "match"):
-                col_descr = spec.column_name.pattern
-            find_fn = find_all_columns_re if spec.find_all else find_column_as_list
-            col_index_list = self.get_index(find_fn, spec)
-
-            if not col_index_list:
-                self.missing_headers.append(spec.column_name)
-                if not spec.optional:
-                    self._error(
-                        "E3001: Column `{}' not found in `{}' `{}'".format(
-                            col_descr, os.path.basename(self.file_name), self.sheet.name
-                        )
-                    )
-                    missing_columns = True
-                cmap[spec.attribute] = None
-            else:
-                for counter, col_index in enumerate(col_index_list):
-                    key_name = spec.attribute
-                    if counter > 0:
-                        key_name += str(counter + 1)
-                        header[col_index] = key_name
-                    cmap[key_name] = col_index
-
-        mapped_columns = set(cmap.values())
-        unmapped_columns = []
-        for idx, s in enumerate(header):
-            if s != "" and idx not in mapped_columns and idx not in skip_columns:
-                unmapped_columns.append(idx)
+        mapping = self.schema.resolve(self.sheet.row_values(self.column_name_row_index))
+        for value in mapping.non_strings:
+            self._error(
+                self._make_error(errors.HEADER_NOT_STRING, type(value), repr(value))
+            )
+        header = list(mapping.header)
+        for spec in mapping.missing:
+            self.missing_headers.append(spec.column_name)
+            if not spec.optional:
+                col_descr = spec.column_name
+                if hasattr(spec.column_name, "match"):
+                    col_descr = spec.column_name.pattern
                 self._error(
-                    "E3002: Column `{}` in `{}` `{}` is not mapped to an output field in the codebase.".format(
-                        s, os.path.basename(self.file_name), self.sheet.name
+                    self._make_error(
+                        errors.MISSING_COLUMN,
+                        col_descr,
+                        code="E3001",
+                        field=spec.attribute,
                     )
                 )
-        if (len(unmapped_columns) > 0 or missing_columns) and self.suggest_template:
+        for idx in mapping.unmapped:
+            self.unmapped_columns.append(header[idx])
+            self._error(
+                self._make_error(
+                    errors.UNMAPPED_COLUMN, header[idx], code="E3002", column=idx
+                )
+            )
+        missing_columns = any(not spec.optional for spec in mapping.missing)
+        if (mapping.unmapped or missing_columns) and self.suggest_template:
             self.print_template(header)
-        return header, cmap
-
-    def get_index(self, find_fn, spec):
-        all_index = []
-        if isinstance(spec.column_name, tuple):
-            for c, _name in enumerate(spec.column_name):
-                all_index = find_fn(_name)
-                if all_index:
-                    break
-        else:
-            all_index = find_fn(spec.column_name)
-        return all_index
+        return header, dict(mapping.column_map)
 
     def print_template(self, header):
         acceptable = set(string.ascii_letters + string.digits + "_")
@@ -435,19 +560,26 @@ class ExcelWrapper:
                 args.append("coerce=" + cleanup)
             template.append("{}fld({}),".format(indent, ", ".join(args)))
         template.append("]")
-        self._error(
-            "{} @ {} - suggested template is:\n{}".format(
-                self.file_name, self.sheet.name, "\n".join(template)
-            )
-        )
+        self.suggested_template = "\n".join(template)
+        self._error(self._make_error(errors.SUGGESTED_TEMPLATE, self.suggested_template))
 
     def set_name_to_func_map(self):
         """Map the spec fields to their corresponding functions"""
 
+        if self.memoize_size:
+            return dict(
+                (name, memoize_coerce(func, self.memoize_size))
+                for name, func in self.schema.coercers.items()
+            )
+        return dict(self.schema.coercers)
+
+    def coerce_cache_info(self):
+        """Hit/miss statistics of each memoized coerce function, by field name"""
+
         return dict(
-            (t.attribute, t.coerce)
-            for t in self.field_spec
-            if isinstance(t, FieldDefinition)
+            (name, func.cache_info())
+            for name, func in self.name_to_func_map.items()
+            if isinstance(func, MemoizedCoerce)
         )
 
     def get_date_mode(self):
@@ -457,7 +589,7 @@ class ExcelWrapper:
     def date_to_string(self, s):
         try:
             date_val = float(s)
-            tpl = xlrd.xldate_as_tuple(date_val, self.workbook.datemode)
+            tpl = self._xldate_as_tuple(date_val, self.workbook.datemode)
             return datetime.datetime(*tpl).strftime("%d/%m/%Y")
         except ValueError:
             return s
@@ -465,77 +597,186 @@ class ExcelWrapper:
     def _get_rows(self):
         """Yields sequence of cells"""
 
-        merge_redirect = {}
-        for crange in self.sheet.merged_cells:
-            rlo, rhi, clo, chi = crange
-            source_coords = (rlo, clo)
-            for rowx in range(rlo, rhi):
-                for colx in range(clo, chi):
-                    if rowx == rlo and colx == clo:
-                        continue
-                    merge_redirect[(rowx, colx)] = source_coords
-
-        for row_idx in range(self.header_length, self.sheet.nrows):
-            row = self.sheet.row(row_idx)
-            merged_row = []
-            for colx, val in enumerate(row):
-                coord = (row_idx, colx)
-                if coord in merge_redirect:
-                    merge_row, merge_col = merge_redirect[coord]
-                    merged_row.append(self.sheet.row(merge_row)[merge_col])
-                else:
-                    merged_row.append(val)
-            yield merged_row
+        rows = self.sheet.get_rows()
+        if not self.sheet.merged_cells:
+            yield from itertools.islice(rows, self.header_length, None)
+            return
+
+        # the source cell of a merged range may sit above header_length, so resolve
+        # merges from the first row and only start yielding once past the header
+        merged_cells = MergedCellIndex(self.sheet.merged_cells)
+        for row_idx, row in enumerate(rows):
+            row = merged_cells.resolve(row_idx, row)
+            if row_idx >= self.header_length:
+                yield row
 
     def get_date_time(self, i, cell):
         """the cell contains a float and pious hope, get a date, if you dare."""
 
+        val, error = self._convert_date(i, cell)
+        if error:
+            self._error_count += 1
+            self._error(error)
+        return val
+
+    def _convert_date(self, i, cell):
         val = cell.value
         try:
-            date_time_tup = xlrd.xldate_as_tuple(val, self.get_date_mode())
-            # well ok...
-            if (
-                date_time_tup[0] == 0
-                and date_time_tup[1] == 0
-                and date_time_tup[2] == 0
-            ):
-                val = datetime.time(*date_time_tup[3:])
-            else:
-                val = datetime.datetime(*date_time_tup)
+            val = xldate_to_datetime(val, self.get_date_mode())
         except ValueError:
-            self._error(
-                "column: `%s' -- value `%s' cannot be converted to a date" % (i, val)
-            )
-        return val
+            return val, self._make_error(errors.DATE_ERROR, val, column=i)
+        return val, None
+
+    def _cell_error(self, name, i, row_num, error):
+        self._error_count += 1
+        self._field_error_counts[name] += 1
+        self._warn(
+            self._make_error(errors.CELL_ERROR, error, field=name, column=i, row=row_num)
+        )
 
-    def get_all(self, typname="DataRow"):
-        """Returns all rows for the sheet as namedtuple instances. Filters out any exact duplicates."""
+    def get_all(
+        self, typname="DataRow", columnar=False, chunk_size=10000, workers=None, columns=None
+    ):
+        """
+        Returns all rows for the sheet as namedtuple instances. Filters out any exact duplicates.
+
+        columnar: read chunk_size rows at a time and coerce each column of the chunk in one
+            batch (see columnar.py), rather than cell by cell. Rows and errors are the same.
+        workers: coerce the chunks in a pool of this many processes, implies columnar.
+            Rows and errors are the same, in the same order, as coercing them here.
+        columns: names of the fields to read, in the order the rows have them, by default
+            all of them. Only these fields are coerced, and only their errors reported;
+            the header was checked against the whole field_spec when the sheet was opened.
+        """
 
+        if self.header_only:
+            raise ValueError(
+                "{} was opened with header_only=True, it has no rows to read".format(
+                    self.file_name
+                )
+            )
+        field_names = self.field_names
+        if columns is not None:
+            field_names = self._projected_field_names(columns)
         # row is added so we know where in the spreadsheet this came from
-        typ_attrs = [n for n in self.field_names]
+        typ_attrs = [n for n in field_names]
         if self.additional_context is not None:
             typ_attrs += list(self.additional_context.keys())
         typ = namedtuple(typname, typ_attrs)
+        name_to_func_map = self.name_to_func_map
+        # seconds spent in each field's coerce function, only kept when tracing
+        coerce_times = None
+        if self._tracer.enabled:
+            coerce_times = {}
+            name_to_func_map = dict(
+                (name, Timed(func, name, coerce_times) if func is not None else None)
+                for name, func in name_to_func_map.items()
+            )
+        self._error_count = 0
+        self._field_error_counts = Counter()
+        # the columnar path reports a chunk's errors before yielding its rows, so it
+        # notes the row numbers with errors here for the error budget, if there is one
+        self._error_rows = (
+            set() if (columnar or workers) and self.error_budget is not None else None
+        )
+        if self.stopped is not None:
+            rows = iter(())
+        elif columnar or workers:
+            rows = self._get_all_columnar(typ, field_names, chunk_size, coerce_times, workers)
+        else:
+            rows = self._get_all_rows(typ, field_names, name_to_func_map)
+        if self.error_budget is not None and self.stopped is None:
+            rows = self._within_budget(rows)
+        rows = self._tracer.trace_rows(
+            "get_all",
+            rows,
+            file=self.file_name,
+            sheet=self.sheet.name,
+            columnar=bool(columnar or workers),
+            workers=workers,
+            coerce=coerce_times,
+        )
+        try:
+            yield from rows
+        finally:
+            self.flush_log()
+
+    def _projected_field_names(self, columns):
+        columns = list(columns)
+        known = set(self.field_names)
+        unknown = [name for name in columns if name not in known]
+        if unknown:
+            raise ValueError("no field named {}".format(", ".join(map(str, unknown))))
+        repeated = [name for name, count in Counter(columns).items() if count > 1]
+        if repeated:
+            raise ValueError("fields given more than once: {}".format(", ".join(map(str, repeated))))
+        return columns
+
+    def _within_budget(self, rows):
+        """Yields from rows until the error budget is used up"""
+        budget = self.error_budget
+        error_rows = 0
+        last_count = self._error_count
+        try:
+            for row_count, row in enumerate(rows, 1):
+                # the errors in a row are reported before it is yielded
+                if self._error_rows is not None:
+                    if row_count in self._error_rows:
+                        self._error_rows.discard(row_count)
+                        error_rows += 1
+                elif self._error_count != last_count:
+                    error_rows += 1
+                    last_count = self._error_count
+                yield row
+                reason = budget.exceeded(
+                    row_count, self._error_count, error_rows, self._field_error_counts
+                )
+                if reason is not None:
+                    self._stop(row_count, reason)
+                    return
+        finally:
+            rows.close()
+
+    def _get_all_rows(self, typ, field_names, name_to_func_map):
+        if not self.generate_row_decoder:
+            return self._decode_rows(typ, field_names, name_to_func_map)
+        columns = tuple(self.name_to_column_map[name] for name in field_names)
+        funcs = [name_to_func_map[name] for name in field_names]
+        context = ()
+        if self.additional_context:
+            context = tuple(self.additional_context.values())
+        decode = self.schema.row_decoder(
+            tuple(field_names),
+            columns,
+            tuple(func is not None for func in funcs),
+            len(context),
+        )
+        return decode(
+            self._get_rows(), typ, funcs, context, self.get_date_time, self._cell_error
+        )
+
+    def _decode_rows(self, typ, field_names, name_to_func_map):
+        """The generic version of the decoder CompiledSchema.row_decoder() generates"""
         row_num = 0
         for row in self._get_rows():
             row_num = row_num + 1
             tpl = []
 
-            for name in self.field_names:
+            for name in field_names:
                 i = self.name_to_column_map[name]
                 # i is None if the column specified was not found, in that case,
                 # set the val to None as well
                 if i is None:
                     tpl.append(None)
                     continue
-                func = self.name_to_func_map[name]
+                func = name_to_func_map[name]
                 cell = row[i]
                 ctype = cell.ctype
                 val = cell.value
                 # convert dates to python dates
-                if ctype == xlrd.XL_CELL_DATE:
+                if ctype == XL_CELL_DATE:
                     val = self.get_date_time(i, cell)
-                if ctype == xlrd.XL_CELL_TEXT:
+                if ctype == XL_CELL_TEXT:
                     val = val.strip()
                 # clear any previous error
                 error = None
@@ -543,17 +784,112 @@ class ExcelWrapper:
                 if func is not None:
                     val, error = func(val)
                 if error:
-                    return_message = "Field {}, Cell {}:{} in {}, {}: {}".format(
-                        name,
-                        get_column_letter(i + 1),
-                        row_num,
-                        os.path.basename(self.file_name),
-                        self.sheet.name,
-                        error,
-                    )
-                    self._logger.warn(return_message)
-                    self._error(return_message)
+                    self._cell_error(name, i, row_num, error)
                 tpl.append(val)
             if self.additional_context:
                 tpl += list(self.additional_context.values())
             yield typ(*tpl)
+
+    def _get_all_columnar(self, typ, field_names, chunk_size, coerce_times=None, workers=None):
+        from .columnar import coerce_chunk
+
+        context = []
+        if self.additional_context:
+            context = list(self.additional_context.values())
+        columns_at = [self.name_to_column_map[name] for name in field_names]
+        funcs = [(name, self.name_to_func_map[name]) for name in field_names]
+        datemode = self.get_date_mode()
+        chunks = self._get_chunks(chunk_size, columns_at)
+        if workers and workers > 1:
+            results = self._coerce_in_pool(chunks, funcs, datemode, workers, coerce_times)
+        else:
+            results = (
+                (nrows, coerce_chunk(columns, funcs, datemode, nrows, coerce_times))
+                for nrows, columns in chunks
+            )
+        row_num = 0
+        try:
+            for nrows, (columns, chunk_errors) in results:
+                for offset, field_idx, stage, error in chunk_errors:
+                    if self._error_rows is not None:
+                        self._error_rows.add(row_num + offset + 1)
+                    i = columns_at[field_idx]
+                    if stage == 0:
+                        self._error_count += 1
+                        self._error(self._make_error(errors.DATE_ERROR, error, column=i))
+                    else:
+                        self._cell_error(funcs[field_idx][0], i, row_num + offset + 1, error)
+                for tpl in zip(*columns):
+                    yield typ(*tpl, *context)
+                row_num += nrows
+        finally:
+            results.close()
+
+    def _get_chunks(self, chunk_size, columns_at):
+        """
+        Yields (row count, columns) for each chunk_size rows, a column being the
+        (ctypes, values) of the cells at a position in columns_at, or None for a position
+        of None (see columnar.coerce_chunk)
+        """
+        rows = self._get_rows()
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            columns = []
+            for i in columns_at:
+                if i is None:
+                    columns.append(None)
+                    continue
+                cells = [row[i] for row in chunk]
+                columns.append(([cell.ctype for cell in cells], [cell.value for cell in cells]))
+            yield len(chunk), columns
+
+    def _coerce_in_pool(self, chunks, funcs, datemode, workers, coerce_times=None):
+        """
+        Yields (row count, coerce_chunk result) for chunks, in order, coercing them in a
+        pool of worker processes. At most two chunks per worker are read ahead.
+        """
+        import pickle
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+
+        from .columnar import coerce_chunk, coerce_chunk_timed
+
+        try:
+            pickle.dumps(funcs)
+        except Exception as e:
+            self._logger.warning(
+                "coerce functions can't be sent to worker processes (%s), "
+                "coercing %s here",
+                e,
+                self.file_name,
+            )
+            for nrows, columns in chunks:
+                yield nrows, coerce_chunk(columns, funcs, datemode, nrows, coerce_times)
+            return
+
+        def result(future):
+            if coerce_times is None:
+                return future.result()
+            chunk_result, chunk_times = future.result()
+            for name, seconds in chunk_times.items():
+                coerce_times[name] = coerce_times.get(name, 0.0) + seconds
+            return chunk_result
+
+        coerce_fn = coerce_chunk if coerce_times is None else coerce_chunk_timed
+        pending = deque()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            for nrows, columns in chunks:
+                pending.append(
+                    (nrows, executor.submit(coerce_fn, columns, funcs, datemode, nrows))
+                )
+                if len(pending) > 2 * workers:
+                    nrows, future = pending.popleft()
+                    yield nrows, result(future)
+            while pending:
+                nrows, future = pending.popleft()
+                yield nrows, result(future)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,109 @@
+"""
+Columnar export of sample metadata, as a pandas DataFrame or a Parquet file.
+
+_read_metadata builds a dict per sample, keyed by field name; for large sheets that is
+far more memory than the values themselves, and has to be reshaped before analysis.
+The functions here read the ExcelWrapper rows straight into one list per column, and
+apply name_mapping and the metadata_revision_* fields to whole columns. The resulting
+frame holds the same samples, fields and values as _read_metadata would return, with
+each column given the narrowest nullable pandas dtype that holds its values.
+
+Parquet output needs pyarrow, which is an optional dependency (the `parquet` extra).
+"""
+
+import os
+
+import pandas as pd
+
+from .bpa_ingest_validations import get_date_isoformat
+
+
+def read_metadata_frame(contextual, fname, columnar=False, columns=None):
+    """
+    DataFrame of the samples in workbook fname, read with contextual (a
+    BaseSampleContextual), one row per sample with the unique identifier as the
+    first column. Rows with no identifier are skipped, and duplicate identifiers raise
+    an Exception, as in _read_metadata. If columns (field attributes) is given, only
+    those fields are read.
+    """
+    wrapper = contextual._open_wrapper(fname)
+    unique_identifier = contextual.metadata_unique_identifier
+    columns = contextual._with_identifier(columns)
+    fields = list(wrapper.field_names if columns is None else columns)
+    if wrapper.additional_context:
+        fields += list(wrapper.additional_context.keys())
+    key_idx = fields.index(unique_identifier)
+
+    values = [[] for _ in fields]
+    appenders = [column.append for column in values]
+    try:
+        for row in wrapper.get_all(columnar=columnar, columns=columns):
+            if not row[key_idx]:
+                continue
+            for append, value in zip(appenders, row):
+                append(value)
+    finally:
+        contextual.errors = wrapper.get_errors()
+        contextual.stopped = wrapper.stopped
+
+    keys = pd.Series(values[key_idx], dtype=object)
+    duplicated = keys[keys.duplicated()]
+    if len(duplicated):
+        raise Exception(
+            "duplicate {}: {}".format(unique_identifier, duplicated.iloc[0])
+        )
+
+    revision_date, _ = get_date_isoformat(wrapper.modified)
+    # same column order as the dicts from process_row, scalars fill the whole column
+    data = {
+        unique_identifier: pd.Series(values[key_idx], dtype=object),
+        "metadata_revision_date": revision_date,
+        "metadata_revision_filename": os.path.basename(fname),
+    }
+    for field, column in zip(fields, values):
+        if field == unique_identifier:
+            continue
+        data[contextual.name_mapping.get(field, field)] = pd.Series(column, dtype=object)
+    frame = pd.DataFrame(data)
+    # nullable dtypes keep integer columns with blanks as integers, rather than floats
+    return frame.convert_dtypes()
+
+
+def metadata_frame_to_arrow(frame):
+    """
+    pyarrow Table of a frame from read_metadata_frame. Columns convert_dtypes() left as
+    object because they mix types, text and numbers say, are written as strings.
+    """
+    pa = _import_pyarrow()
+    mixed = [
+        column
+        for column, dtype in frame.dtypes.items()
+        if dtype == object and frame[column].dropna().map(type).nunique() > 1
+    ]
+    if mixed:
+        frame = frame.astype({column: "string" for column in mixed})
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def write_metadata_parquet(contextual, fname, path, columnar=False, **kwargs):
+    """
+    Read the samples in workbook fname with contextual and write them to the Parquet
+    file path, kwargs are passed to pyarrow.parquet.write_table. Returns the frame.
+    """
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    frame = read_metadata_frame(contextual, fname, columnar=columnar)
+    pq.write_table(metadata_frame_to_arrow(frame), path, **kwargs)
+    return frame
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required for Arrow/Parquet export, "
+            "install bpa-ingest-validation[parquet]"
+        ) from None
+    return pyarrow
@@ -7,14 +7,21 @@ from .excel_wrapper import (
     make_skip_column as skp,
 )
 
+from . import errors
+from .tracing import NULL_TRACER, Timed, profiled
+from .readers import WorkbookSession
+from .sample_registry import SampleRows, check_samples
 from .util import make_logger
 from .bpa_ingest_validations import ( get_date_isoformat,
+column_date_isoformat,
+date_or_int_or_comment,
 extract_ands_id,
 int_or_comment,
 get_int,
 )
 import re
-"""
+
+
 class BaseDatasetControlContextual:
     metadata_patterns = [re.compile(r"^.*\.xlsx$")]
     sheet_names = [
@@ -24,10 +31,33 @@ class BaseDatasetControlContextual:
     name_mapping = {}
     additional_fields = []
 
-    def __init__(self, logger, path):
+    def __init__(self, logger, path, session=None):
+        """
+        path: the dataset control workbook, or a directory holding exactly one workbook
+            matching metadata_patterns
+        session: readers.WorkbookSession of the workbook, to share with other readers
+        """
         self._logger = logger
         self._logger.info("dataset control path is: {}".format(path))
-        #self.dataset_metadata = self._read_metadata(one(glob(path + "/*.xlsx")))
+        self.dataset_metadata = self._read_metadata(
+            self._find_workbook(path), session=session
+        )
+
+    def _find_workbook(self, path):
+        if not os.path.isdir(path):
+            return path
+        matches = sorted(
+            fname
+            for fname in os.listdir(path)
+            if any(pattern.match(fname) for pattern in self.metadata_patterns)
+        )
+        if len(matches) != 1:
+            raise Exception(
+                "expected one dataset control workbook in {}, found {}".format(
+                    path, len(matches)
+                )
+            )
+        return os.path.join(path, matches[0])
 
     def get(self, *context):
         if len(context) != len(self.contextual_linkage):
@@ -53,16 +83,26 @@ class BaseDatasetControlContextual:
             "bioplatforms_library_id",
             "bioplatforms_dataset_id",
         ):
-            return ingest_utils.extract_ands_id(self._logger, value)
+            value, error = extract_ands_id(value)
+            if error:
+                self._logger.error(error)
         return value
 
-    def _read_metadata(self, fname):
+    def _read_metadata(self, fname, session=None):
+        """
+        Metadata of each sheet in sheet_names, keyed by the contextual_linkage values.
+        Without a session, the workbook is opened once for all the sheets.
+        """
+        if session is None:
+            with WorkbookSession(fname) as session:
+                return self._read_metadata(fname, session)
+
         # Obligatory fields
         field_spec = [
             fld(
                 "access_control_date",
                 "access_control_date",
-                coerce=ingest_utils.date_or_int_or_comment,
+                coerce=date_or_int_or_comment,
             ),
             fld("access_control_reason", "access_control_reason"),
             fld("related_data", "related_data"),
@@ -99,7 +139,7 @@ class BaseDatasetControlContextual:
                         fld(
                             field,
                             field,
-                            coerce=ingest_utils.extract_ands_id,
+                            coerce=extract_ands_id,
                         )
                     )
         else:
@@ -109,7 +149,7 @@ class BaseDatasetControlContextual:
                         fld(
                             field,
                             field,
-                            coerce=ingest_utils.extract_ands_id,
+                            coerce=extract_ands_id,
                         )
                     )
 
@@ -123,6 +163,7 @@ class BaseDatasetControlContextual:
                 header_length=1,
                 column_name_row_index=0,
                 suggest_template=True,
+                session=session,
             )
             for error in wrapper.get_errors():
                 self._logger.error(error)
@@ -153,11 +194,12 @@ class BaseDatasetControlContextual:
                     if field in self.contextual_linkage:
                         continue
                     row_meta[name_mapping.get(field, field)] = value
+            session.unload(wrapper.sheet.name)
         return dataset_metadata
 
     def filename_metadata(self, *args, **kwargs):
         return {}
-"""
+
 
 # This was previously name BaseLibraryContextual (but it is really SAMPLE metadata)
 #todo: change to GenericSampleContextual
@@ -235,7 +277,7 @@ class BaseSampleContextual:
         fld(
             "collection_date",
             "collection_date",
-            coerce=get_date_isoformat,
+            coerce=column_date_isoformat(),
         ),
         # collector
         fld("collector", "collector"),
@@ -269,9 +311,9 @@ class BaseSampleContextual:
         # life-stage
         fld("lifestage", re.compile("life[_-]stage")),
         # birth_date
-        fld("birth_date", "birth_date", coerce=get_date_isoformat, optional=True),
+        fld("birth_date", "birth_date", coerce=column_date_isoformat(), optional=True),
         # death_date
-        fld("death_date", "death_date", coerce=get_date_isoformat, optional=True),
+        fld("death_date", "death_date", coerce=column_date_isoformat(), optional=True),
         fld("health_state", "health_state"),
         # associated_media
         fld("associated_media", "associated_media"),
@@ -287,7 +329,7 @@ class BaseSampleContextual:
         fld(
             "material_extraction_date",
             re.compile(r"[Mm]aterial_extraction_date"),
-            coerce=get_date_isoformat,
+            coerce=column_date_isoformat(),
         ),
         # material_extracted_by
         fld("material_extracted_by", re.compile(r"[Mm]aterial_extracted_by")),
@@ -309,13 +351,51 @@ class BaseSampleContextual:
 
     ]
 
-    def __init__(self):
+    def __init__(
+        self,
+        streaming=False,
+        aggregate_errors=False,
+        tracer=None,
+        profile_dir=None,
+        engine=None,
+        error_budget=None,
+        coerce_workers=None,
+        metadata_store=None,
+        sample_registry=None,
+        record_samples=False,
+    ):
         self.logger = make_logger(__name__)
-        pass
-
-    def _read_metadata(self, fname):
-        sample_metadata = {}
+        # read .xlsx workbooks row by row rather than loading them whole
+        self.streaming = streaming
+        # reader engine (see readers.py), picked per file from its content if None
+        self.engine = engine
+        # report repeated errors once per field and kind, see ExcelWrapper
+        self.aggregate_errors = aggregate_errors
+        # errors reported by the last _read_metadata call
+        self.errors = []
+        # when to stop reading a sheet with too many errors, see errors.ErrorBudget
+        self.error_budget = error_budget
+        # why the last _read_metadata call stopped early, None if it read every row
+        self.stopped = None
+        # tracing.Tracer receiving the time spent in each stage of _read_metadata
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        # if set, a cProfile of each _read_metadata call is written to this directory
+        self.profile_dir = profile_dir
+        # if set, each sheet is coerced in chunks by this many processes, see get_all
+        self.coerce_workers = coerce_workers
+        # called for an empty mapping to keep each workbook's sample metadata in, a
+        # dict if None (see metadata_store.py)
+        self.metadata_store = metadata_store
+        # if set, a sample_registry.SampleRegistry each workbook's sample IDs are
+        # checked against, and then recorded in
+        self.sample_registry = sample_registry
+        # keep the sample IDs read in samples, for a sample registry checked later
+        self.record_samples = record_samples
+        # sample_registry.SampleRows of the last _read_metadata call, if sample_registry
+        # or record_samples is set and the sheet was read
+        self.samples = None
 
+    def _open_wrapper(self, fname, header_only=False, session=None):
         wrapper = ExcelWrapper(
             self.logger,
             self.field_spec,
@@ -324,17 +404,132 @@ class BaseSampleContextual:
             header_length=1,
             column_name_row_index=0,
             suggest_template=True,
+            streaming=self.streaming,
+            aggregate_errors=self.aggregate_errors,
+            tracer=self.tracer,
+            engine=self.engine,
+            error_budget=self.error_budget,
+            header_only=header_only,
+            session=session,
             )
         for error in wrapper.get_errors():
             self.logger.error(error)
+        return wrapper
+
+    def preflight(self, fname):
+        """
+        Check the sheet names and the header of workbook fname against the field_spec,
+        without reading its data rows. Returns a dict of the sheet read, the required
+        fields with no column (`missing_columns`), the columns no field maps
+        (`unmapped_columns`) and a field_spec for the header (`suggested_template`, None
+        if nothing is missing or unmapped). The errors are in `errors` as usual.
+        """
+        with self.tracer.span("preflight", file=fname):
+            wrapper = self._open_wrapper(fname, header_only=True)
+        wrapper.workbook.release_resources()
+        self.errors = wrapper.get_errors()
+        self.stopped = wrapper.stopped
+        return {
+            "sheet": wrapper.sheet.name,
+            "missing_columns": wrapper.missing_required_fields(),
+            "unmapped_columns": wrapper.unmapped_columns,
+            "suggested_template": wrapper.suggested_template,
+        }
+
+    def _read_metadata(self, fname, session=None, columns=None):
+        """
+        Sample metadata of workbook fname, keyed by metadata_unique_identifier. Pass a
+        readers.WorkbookSession to read from a workbook other readers have open.
 
-        for row in wrapper.get_all():
-            sample_metadata = self.process_row(
-                row, sample_metadata, os.path.basename(fname), wrapper.modified
+        If columns (field attributes) is given, only those fields are read and coerced,
+        see ExcelWrapper.get_all(); the sheet's header is still checked in full.
+        """
+        with profiled(self.profile_dir, fname), self.tracer.span(
+            "read_metadata", file=fname
+        ) as span:
+            sample_metadata = self._read_sample_metadata(fname, session, columns)
+            span.set("samples", len(sample_metadata))
+        return sample_metadata
+
+    def _read_sample_metadata(self, fname, session=None, columns=None):
+        sample_metadata = self.metadata_store() if self.metadata_store is not None else {}
+
+        wrapper = self._open_wrapper(fname, session=session)
+
+        process_row = self.process_row
+        process_row_time = process_row_calls = None
+        if self.tracer.enabled:
+            process_row_time, process_row_calls = {}, {}
+            process_row = Timed(
+                process_row, "process_row", process_row_time, process_row_calls
+            )
+        self.samples = None
+        # (sample ID, row) of each sample, for the sample registry
+        sample_rows = (
+            [] if self.sample_registry is not None or self.record_samples else None
+        )
+        try:
+            rows = wrapper.get_all(
+                workers=self.coerce_workers, columns=self._with_identifier(columns)
             )
+            for row_num, row in enumerate(rows, 1):
+                sample_count = len(sample_metadata)
+                sample_metadata = process_row(
+                    row, sample_metadata, os.path.basename(fname), wrapper.modified
+                )
+                if sample_rows is not None and len(sample_metadata) != sample_count:
+                    sample_rows.append(
+                        (getattr(row, self.metadata_unique_identifier), row_num)
+                    )
+        except BaseException:
+            # a store which spilled to disk holds a file until it is closed
+            if hasattr(sample_metadata, "close"):
+                sample_metadata.close()
+            raise
+        finally:
+            self.errors = wrapper.get_errors()
+            self.stopped = wrapper.stopped
+            if process_row_time is not None:
+                self.tracer.add_span(
+                    "process_row",
+                    process_row_time["process_row"],
+                    file=fname,
+                    rows=process_row_calls["process_row"],
+                )
 
+        if sample_rows is not None:
+            revision_date, _ = get_date_isoformat(wrapper.modified)
+            self.samples = SampleRows(
+                fname,
+                wrapper.sheet.name,
+                self.metadata_unique_identifier,
+                sample_rows,
+                revision_date,
+                wrapper.stopped is None,
+            )
+        if self.sample_registry is not None:
+            with self.tracer.span("sample_registry", file=fname):
+                self._check_sample_registry()
         return sample_metadata
 
+    def _with_identifier(self, columns):
+        """columns, with the unique identifier first if it isn't one of them"""
+        if columns is None:
+            return None
+        columns = list(columns)
+        if self.metadata_unique_identifier not in columns:
+            columns.insert(0, self.metadata_unique_identifier)
+        return columns
+
+    def _check_sample_registry(self):
+        """
+        Report the samples just read already recorded in the sample registry from other
+        workbooks, then record them, unless the workbook was only partly read
+        """
+        for error in check_samples(self.sample_registry, self.samples):
+            self.logger.warning("%s", error)
+            self.errors.append(error.format())
+
     def process_row(self, row, sample_metadata, metadata_filename, metadata_modified):
         key_value = getattr(row, self.metadata_unique_identifier)
         if not key_value:
@@ -343,14 +538,14 @@ class BaseSampleContextual:
             raise Exception(
                 "duplicate {}: {}".format(self.metadata_unique_identifier, key_value)
             )
-        sample_metadata[key_value] = row_meta = {}
-        sample_metadata[key_value][
-            "metadata_revision_date"
-        ] = get_date_isoformat( metadata_modified)
-        sample_metadata[key_value]["metadata_revision_filename"] = metadata_filename
+        # built in full before it is stored, a store may keep a copy rather than the dict
+        row_meta = {}
+        row_meta["metadata_revision_date"], _ = get_date_isoformat(metadata_modified)
+        row_meta["metadata_revision_filename"] = metadata_filename
         for field in row._fields:
             value = getattr(row, field)
             if field == self.metadata_unique_identifier:
                 continue
             row_meta[self.name_mapping.get(field, field)] = value
+        sample_metadata[key_value] = row_meta
         return sample_metadata
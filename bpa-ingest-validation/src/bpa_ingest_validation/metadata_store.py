@@ -0,0 +1,166 @@
+"""
+Where BaseSampleContextual keeps the sample metadata it reads.
+
+process_row adds one dict per sample to a mapping keyed by the sample's unique
+identifier, and checks each new key against it for duplicates. By default that mapping
+is a plain dict, holding every sample in memory until the caller is done with it.
+SpillingMetadataStore is a mapping which holds at most max_in_memory samples in
+memory, and moves them into an SQLite file once there are more. Lookups, including the
+duplicate check, use the SQLite primary key index, and iteration gives the samples in
+the order they were added, as a dict would.
+
+Pass a store factory to BaseSampleContextual as metadata_store, e.g.
+
+    BaseSampleContextual(metadata_store=functools.partial(SpillingMetadataStore, 10000))
+
+Values must be picklable; they are stored pickled, so a value read back is a copy, and
+changing it doesn't change the store.
+"""
+
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections.abc import MutableMapping
+
+DEFAULT_MAX_IN_MEMORY = 10000
+
+
+class SpillingMetadataStore(MutableMapping):
+    """
+    A mapping which moves its entries into an SQLite file once it holds more than
+    max_in_memory of them. The file is deleted by close(), or when the store is used as
+    a context manager, on exit.
+
+    max_in_memory: number of entries held in memory, at most, between writes to disk
+    directory: where the SQLite file is created, the system temporary directory if None
+    """
+
+    def __init__(self, max_in_memory=DEFAULT_MAX_IN_MEMORY, directory=None):
+        self.max_in_memory = max_in_memory
+        self.directory = directory
+        # the newest entries, not yet written to disk
+        self._buffer = {}
+        self._db = None
+        self._path = None
+        self._spilled = 0
+
+    @property
+    def spilled(self):
+        """Number of entries held on disk"""
+        return self._spilled
+
+    def _connect(self):
+        fd, self._path = tempfile.mkstemp(
+            prefix="sample-metadata-", suffix=".sqlite", dir=self.directory
+        )
+        os.close(fd)
+        db = sqlite3.connect(self._path)
+        # a scratch file, which is deleted if anything goes wrong
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        self._db = db
+
+    def _spill(self):
+        if self._db is None:
+            self._connect()
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                (
+                    (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                    for key, value in self._buffer.items()
+                ),
+            )
+        self._spilled += len(self._buffer)
+        self._buffer = {}
+
+    def _select(self, key):
+        if not self._spilled:
+            return None
+        return self._db.execute(
+            "SELECT value FROM metadata WHERE key = ?", (key,)
+        ).fetchone()
+
+    def __getitem__(self, key):
+        try:
+            return self._buffer[key]
+        except KeyError:
+            pass
+        row = self._select(key)
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __contains__(self, key):
+        return key in self._buffer or self._select(key) is not None
+
+    def __setitem__(self, key, value):
+        if key not in self._buffer and self._select(key) is not None:
+            # replaced where it is, as a dict keeps the key's position
+            with self._db:
+                self._db.execute(
+                    "UPDATE metadata SET value = ? WHERE key = ?",
+                    (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+                )
+            return
+        self._buffer[key] = value
+        if len(self._buffer) > self.max_in_memory:
+            self._spill()
+
+    def __delitem__(self, key):
+        try:
+            del self._buffer[key]
+            return
+        except KeyError:
+            pass
+        if self._select(key) is None:
+            raise KeyError(key)
+        with self._db:
+            self._db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+        self._spilled -= 1
+
+    def __len__(self):
+        return self._spilled + len(self._buffer)
+
+    def __iter__(self):
+        if self._spilled:
+            for (key,) in self._db.execute("SELECT key FROM metadata ORDER BY rowid"):
+                yield key
+        yield from list(self._buffer)
+
+    def values(self):
+        for _key, value in self.items():
+            yield value
+
+    def items(self):
+        """(key, value) of each entry, in the order they were added, read in one pass"""
+        if self._spilled:
+            for key, value in self._db.execute(
+                "SELECT key, value FROM metadata ORDER BY rowid"
+            ):
+                yield key, pickle.loads(value)
+        yield from list(self._buffer.items())
+
+    def close(self):
+        """Delete the SQLite file, the store is empty afterwards"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+            os.unlink(self._path)
+            self._path = None
+        self._spilled = 0
+        self._buffer = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        return False
+
+    def __repr__(self):
+        return "SpillingMetadataStore({} entries, {} on disk)".format(
+            len(self), self._spilled
+        )
@@ -0,0 +1,386 @@
+"""
+Reader engines: the input formats ExcelWrapper can read.
+
+An engine opens a file and returns a workbook with the part of the xlrd Book interface
+that ExcelWrapper uses (datemode, props, sheet_names(), sheet_by_name(),
+sheet_by_index()), whose sheets yield rows of xlrd Cells from get_rows(). The field_spec
+and get_all() work the same whichever engine read the file.
+
+    xlrd     .xls workbooks, loaded whole by xlrd
+    xlsx     .xlsx workbooks, read row by row (see xlsx_reader.py)
+    csv      comma or tab separated text, read row by row
+    parquet  Parquet files, read a batch of rows at a time, only the mapped columns
+
+open_workbook() picks the engine from the first bytes of the file (see sniff_engine),
+not from its extension. CSV and Parquet files hold a single sheet, which has no name
+to look up, and every value in a CSV file is text. CSV files are read as UTF-8, or as
+cp1252, the encoding Excel exports CSV in on Windows, if they aren't valid UTF-8.
+
+Every engine reads a sheet only once it is asked for: xlrd opens workbooks on demand,
+and the other engines read rows as they are iterated. A WorkbookSession opens a file
+once for several ExcelWrappers, e.g. one per sheet. Opened header_only, the xlsx engine
+reads the header row straight from the archive (see xlsx_header.py).
+
+The Parquet engine needs pyarrow, which is an optional dependency (the `parquet` extra).
+"""
+
+import codecs
+import datetime
+import os
+
+ENCODING = "utf-8-sig"
+FALLBACK_ENCODING = "cp1252"
+SNIFF_BYTES = 64 * 1024
+PARQUET_BATCH_ROWS = 64 * 1024
+
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_ZIP_MAGIC = b"PK\x03\x04"
+_PARQUET_MAGIC = b"PAR1"
+
+
+def sniff_engine(file_name):
+    """Name of the engine for file_name, from the first bytes of the file"""
+    with open(file_name, "rb") as fd:
+        head = fd.read(8)
+    if head.startswith(_OLE2_MAGIC):
+        return "xlrd"
+    if head.startswith(_ZIP_MAGIC):
+        return "xlsx"
+    if head.startswith(_PARQUET_MAGIC):
+        return "parquet"
+    return "csv"
+
+
+def sniff_encoding(file_name):
+    """
+    ENCODING if the first SNIFF_BYTES of file_name are valid UTF-8, otherwise
+    FALLBACK_ENCODING. CsvSheet falls back if the rest of the file isn't.
+    """
+    with open(file_name, "rb") as fd:
+        head = fd.read(SNIFF_BYTES)
+    try:
+        # not final, a multi-byte character may be cut off at the end of the sample
+        codecs.getincrementaldecoder(ENCODING)().decode(head)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return ENCODING
+
+
+def sniff_delimiter(file_name, encoding=ENCODING):
+    """Tab if the first line of file_name has more tabs than commas, otherwise comma"""
+    with open(file_name, "rb") as fd:
+        head = fd.read(SNIFF_BYTES)
+    # a multi-byte character may be cut off at the end of the sample
+    first_line = codecs.getincrementaldecoder(encoding)("replace").decode(head)
+    first_line = first_line.split("\n", 1)[0]
+    return "\t" if first_line.count("\t") > first_line.count(",") else ","
+
+
+def _modified(file_name):
+    """The file's modification time, in the form xlrd reads out of docProps/core.xml"""
+    mtime = datetime.datetime.fromtimestamp(
+        os.stat(file_name).st_mtime, datetime.timezone.utc
+    )
+    return mtime.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def open_xlrd_workbook(file_name, header_only=False):
+    import xlrd
+
+    # on demand, xlrd loads a sheet when it is asked for, not every sheet up front
+    return xlrd.open_workbook(file_name, on_demand=True)
+
+
+def open_xlsx_workbook(file_name, header_only=False):
+    if header_only:
+        from .xlsx_header import open_header_workbook
+
+        return open_header_workbook(file_name)
+    from .xlsx_reader import open_streaming_workbook
+
+    return open_streaming_workbook(file_name)
+
+
+def open_csv_workbook(file_name, header_only=False, delimiter=None):
+    return SingleSheetWorkbook(
+        file_name, CsvSheet(file_name, delimiter, header_only=header_only)
+    )
+
+
+def open_tsv_workbook(file_name, header_only=False):
+    return open_csv_workbook(file_name, header_only, delimiter="\t")
+
+
+def open_parquet_workbook(file_name, header_only=False):
+    return SingleSheetWorkbook(file_name, ParquetSheet(file_name))
+
+
+engines = {
+    "xlrd": open_xlrd_workbook,
+    "xlsx": open_xlsx_workbook,
+    "csv": open_csv_workbook,
+    "tsv": open_tsv_workbook,
+    "parquet": open_parquet_workbook,
+}
+
+
+def open_workbook(file_name, engine=None, header_only=False):
+    """
+    Open file_name with the named engine, or if engine is None the engine sniff_engine
+    picks for it. If header_only, the workbook need only read sheet names and header
+    rows, and engines that can skip the rest of the file do.
+    """
+    if engine is None:
+        engine = sniff_engine(file_name)
+    try:
+        open_fn = engines[engine]
+    except KeyError:
+        raise ValueError(
+            "unknown reader engine {!r}, expected one of {}".format(
+                engine, ", ".join(sorted(engines))
+            )
+        )
+    return open_fn(file_name, header_only=header_only)
+
+
+class WorkbookSession:
+    """
+    A workbook opened once and read by several ExcelWrappers, e.g. one per sheet, or one
+    per contextual class reading the same file (pass it as ExcelWrapper's session).
+    Sheets are loaded when a wrapper first asks for them; unload() frees a sheet which
+    has been read. Use as a context manager, or call close() when done.
+
+    file_name: the workbook
+    engine: reader engine name, picked from the file's content if None
+    """
+
+    def __init__(self, file_name, engine=None):
+        self.file_name = file_name
+        if engine is None:
+            engine = sniff_engine(file_name)
+        self.engine = engine
+        self.workbook = open_workbook(file_name, engine)
+
+    def unload(self, sheet_name):
+        """Free the memory held by a loaded sheet, it is loaded again if asked for"""
+        if hasattr(self.workbook, "unload_sheet"):
+            self.workbook.unload_sheet(sheet_name)
+
+    def close(self):
+        self.workbook.release_resources()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        return False
+
+
+class SingleSheetWorkbook:
+    """
+    A file holding one sheet, e.g. a CSV file, with the parts of the xlrd.Book interface
+    used by ExcelWrapper. Its only sheet is used whatever sheet name is asked for.
+    """
+
+    single_sheet = True
+    datemode = 0
+
+    def __init__(self, file_name, sheet):
+        self.file_name = file_name
+        self.sheet = sheet
+        self.props = {"modified": _modified(file_name)}
+
+    def sheet_names(self):
+        return [self.sheet.name]
+
+    def sheet_by_name(self, sheet_name):
+        if sheet_name != self.sheet.name:
+            raise KeyError(sheet_name)
+        return self.sheet
+
+    def sheet_by_index(self, sheetx):
+        if sheetx != 0:
+            raise IndexError("sheet index out of range: {}".format(sheetx))
+        return self.sheet
+
+    def release_resources(self):
+        pass
+
+
+class _SingleSheet:
+    visibility = 0
+    merged_cells = ()
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.name = os.path.basename(file_name)
+
+    def row(self, rowx):
+        for cells in self.get_rows(rowx):
+            return cells
+        raise IndexError("row index out of range: {}".format(rowx))
+
+    def row_values(self, rowx):
+        return [cell.value for cell in self.row(rowx)]
+
+
+class CsvSheet(_SingleSheet):
+    """
+    The rows of a CSV file, parsed from the file each time they are iterated. Values are
+    text cells, empty values are empty cells, and rows are padded to the header width.
+
+    delimiter: field separator, sniffed from the first line if None (see sniff_delimiter)
+    encoding: the file's encoding, sniffed if None (see sniff_encoding)
+    header_only: only the header will be read, so the encoding isn't sniffed, UTF-8 is
+        assumed until a row turns out not to be
+    """
+
+    def __init__(self, file_name, delimiter=None, encoding=None, header_only=False):
+        super().__init__(file_name)
+        if encoding is None:
+            encoding = ENCODING if header_only else sniff_encoding(file_name)
+        self.encoding = encoding
+        if delimiter is None:
+            delimiter = sniff_delimiter(file_name, encoding)
+        self.delimiter = delimiter
+        self._ncols = None
+
+    @property
+    def ncols(self):
+        if self._ncols is None:
+            self._ncols = len(self.row(0))
+        return self._ncols
+
+    def get_rows(self, start_rowx=0):
+        """Yields each row as a list of xlrd Cells"""
+        import csv
+        import itertools
+
+        from xlrd.biffh import XL_CELL_TEXT
+        from xlrd.sheet import Cell, empty_cell
+
+        width = self.ncols if start_rowx else None
+        yielded = 0
+        while True:
+            # the few bytes cp1252 leaves undefined are read as U+FFFD rather than
+            # failing part way through the rows
+            errors = "replace" if self.encoding == FALLBACK_ENCODING else "strict"
+            try:
+                with open(
+                    self.file_name, newline="", encoding=self.encoding, errors=errors
+                ) as fd:
+                    reader = csv.reader(fd, delimiter=self.delimiter)
+                    for values in itertools.islice(reader, start_rowx + yielded, None):
+                        cells = [
+                            Cell(XL_CELL_TEXT, v) if v != "" else empty_cell
+                            for v in values
+                        ]
+                        if width is None:
+                            # the header row
+                            width = self._ncols = len(cells)
+                        elif len(cells) < width:
+                            cells.extend([empty_cell] * (width - len(cells)))
+                        yielded += 1
+                        yield cells
+                return
+            except UnicodeDecodeError:
+                if self.encoding != ENCODING:
+                    raise
+                # only the start of the file was sniffed, the rest isn't UTF-8: read
+                # on from the same row as cp1252
+                self.encoding = FALLBACK_ENCODING
+
+
+class ParquetSheet(_SingleSheet):
+    """
+    The rows of a Parquet file, as if the column names were a header row.
+
+    Rows are read batch_rows at a time. Once project() has been called with the columns
+    ExcelWrapper mapped, only those columns are read from the file, and the others are
+    returned as empty cells.
+    """
+
+    def __init__(self, file_name, batch_rows=PARQUET_BATCH_ROWS):
+        super().__init__(file_name)
+        pq = _import_pyarrow_parquet()
+        self._parquet_file = pq.ParquetFile(file_name)
+        self.column_names = list(self._parquet_file.schema_arrow.names)
+        self.ncols = len(self.column_names)
+        self.batch_rows = batch_rows
+        self.columns = None
+
+    def project(self, columns):
+        """
+        Read only the columns with these indexes, and those of any earlier calls, as
+        each ExcelWrapper sharing the sheet projects the columns it maps
+        """
+        self.columns = sorted(set(self.columns or ()) | set(columns))
+
+    def get_rows(self, start_rowx=0):
+        """Yields each row as a list of xlrd Cells, starting with the column names"""
+        import itertools
+
+        from xlrd.biffh import XL_CELL_TEXT
+        from xlrd.sheet import Cell
+
+        rows = itertools.chain(
+            [[Cell(XL_CELL_TEXT, name) for name in self.column_names]],
+            self._get_data_rows(),
+        )
+        return itertools.islice(rows, start_rowx, None)
+
+    def _get_data_rows(self):
+        from xlrd.sheet import empty_cell
+
+        columns = self.columns
+        if columns is None:
+            columns = list(range(self.ncols))
+        names = [self.column_names[idx] for idx in columns]
+        for batch in self._parquet_file.iter_batches(
+            batch_size=self.batch_rows, columns=names
+        ):
+            values = [_column_cells(batch.column(pos)) for pos in range(len(names))]
+            for row_values in zip(*values):
+                cells = [empty_cell] * self.ncols
+                for idx, cell in zip(columns, row_values):
+                    cells[idx] = cell
+                yield cells
+
+
+def _column_cells(array):
+    """xlrd Cells for the values of a pyarrow array, as xlrd would read them from Excel"""
+    from openpyxl.utils.datetime import to_excel
+    from xlrd.biffh import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_NUMBER, XL_CELL_TEXT
+    from xlrd.sheet import Cell, empty_cell
+
+    cells = []
+    for value in array.to_pylist():
+        if value is None:
+            cells.append(empty_cell)
+        elif isinstance(value, bool):
+            cells.append(Cell(XL_CELL_BOOLEAN, int(value)))
+        elif isinstance(value, (int, float)):
+            cells.append(Cell(XL_CELL_NUMBER, float(value)))
+        elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+                # Excel dates carry no timezone, timestamps are given in UTC
+                value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            cells.append(Cell(XL_CELL_DATE, to_excel(value)))
+        elif isinstance(value, datetime.timedelta):
+            cells.append(Cell(XL_CELL_DATE, value.total_seconds() / 86400.0))
+        elif value == "":
+            cells.append(empty_cell)
+        else:
+            cells.append(Cell(XL_CELL_TEXT, str(value)))
+    return cells
+
+
+def _import_pyarrow_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "reading Parquet files needs pyarrow, install bpa-ingest-validation[parquet]"
+        ) from e
+    return pq
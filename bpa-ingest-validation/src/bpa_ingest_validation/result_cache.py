@@ -0,0 +1,251 @@
+"""
+On-disk cache of validation results, for workbooks that have not changed since they
+were last validated.
+
+Entries are keyed on a hash of the workbook's content and path combined with a
+fingerprint of the schema it was validated against (the field_spec, including the code
+of each coerce function and of the helpers it calls) and the package version. Editing a
+schema or a coerce function therefore changes the key, and stale entries are never
+read; they age out through the LRU eviction that keeps the cache under its size cap.
+The path is part of the key as the results name the workbook, so a copied or renamed
+workbook is validated again.
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import re
+import types
+
+from .date_parser import DateParser
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = ".pickle"
+
+
+def package_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        return "unknown"
+    try:
+        return version("bpa-ingest-validation")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def file_digest(fname, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(fname, "rb") as fd:
+        for block in iter(lambda: fd.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _code_fingerprint(code, seen):
+    parts = [code.co_code.hex(), repr(code.co_names)]
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            parts.append(_code_fingerprint(const, seen))
+        else:
+            parts.append(_fingerprint(const, seen))
+    return "|".join(parts)
+
+
+def _fingerprint(obj, seen):
+    """Stable text describing obj, for callables this covers their code"""
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return repr(obj)
+    if isinstance(obj, (tuple, list)):
+        return "(" + ",".join(_fingerprint(t, seen) for t in obj) + ")"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ",".join(sorted(_fingerprint(t, seen) for t in obj)) + "}"
+    if isinstance(obj, dict):
+        return "{" + ",".join(
+            sorted(_fingerprint(k, seen) + ":" + _fingerprint(v, seen) for k, v in obj.items())
+        ) + "}"
+    if isinstance(obj, re.Pattern):
+        return "re({!r},{})".format(obj.pattern, obj.flags)
+    if isinstance(obj, DateParser):
+        # the order of the formats changes as the parser learns, the set of them doesn't
+        return "DateParser({},{})".format(
+            _fingerprint(frozenset(obj.formats), seen), _class_fingerprint(type(obj), seen)
+        )
+    if isinstance(obj, functools.partial):
+        return "partial({},{},{})".format(
+            _fingerprint(obj.func, seen),
+            _fingerprint(obj.args, seen),
+            _fingerprint(obj.keywords, seen),
+        )
+    if isinstance(obj, types.FunctionType):
+        name = "{}.{}".format(obj.__module__, obj.__qualname__)
+        if name in seen:
+            return name
+        seen.add(name)
+        parts = [name, _code_fingerprint(obj.__code__, seen)]
+        if obj.__defaults__:
+            parts.append(_fingerprint(obj.__defaults__, seen))
+        # follow the module level helpers, regexes and constants the function uses
+        for global_name in sorted(_global_names(obj.__code__)):
+            if global_name in obj.__globals__:
+                value = obj.__globals__[global_name]
+                if isinstance(value, types.ModuleType):
+                    continue
+                if isinstance(value, types.FunctionType) and (
+                    value.__module__.split(".")[0] != obj.__module__.split(".")[0]
+                ):
+                    # only follow code from this package
+                    continue
+                parts.append(global_name + "=" + _fingerprint(value, seen))
+        return "function(" + ";".join(parts) + ")"
+    if isinstance(obj, types.MethodType):
+        return "method({},{})".format(
+            _fingerprint(obj.__func__, seen), _fingerprint(obj.__self__, seen)
+        )
+    # wrapper objects such as coerce_cache.MemoizedCoerce
+    wrapped = getattr(obj, "func", None)
+    if wrapped is not None:
+        return "{}({})".format(type(obj).__qualname__, _fingerprint(wrapped, seen))
+    return "{}.{}".format(type(obj).__module__, type(obj).__qualname__)
+
+
+def _class_fingerprint(cls, seen):
+    """The code of the methods of cls and its bases, other than object"""
+    parts = []
+    for klass in cls.__mro__[:-1]:
+        for attr_name, value in sorted(vars(klass).items()):
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            elif isinstance(value, property):
+                value = value.fget
+            if isinstance(value, types.FunctionType):
+                parts.append(attr_name + "=" + _fingerprint(value, seen))
+    return "class({}.{};{})".format(cls.__module__, cls.__qualname__, ";".join(parts))
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def schema_fingerprint(*parts):
+    """sha256 of the fingerprint of parts, typically a field_spec plus any options"""
+    seen = set()
+    text = "\n".join(_fingerprint(part, seen) for part in parts)
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+class ValidationCache:
+    """
+    Validation results, one file per entry in directory.
+
+    directory: where entries are stored, created if missing
+    max_bytes: size cap, least recently used entries are removed to stay under it
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, fname, schema):
+        """Cache key for workbook fname validated against schema (see schema_fingerprint)"""
+        digest = hashlib.sha256()
+        for part in (
+            file_digest(fname),
+            os.path.abspath(fname),
+            schema,
+            package_version(),
+        ):
+            digest.update(part.encode("utf8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """The cached result for key, or None"""
+        path = self._path(key)
+        try:
+            fd = open(path, "rb")
+        except OSError:
+            return None
+        try:
+            with fd:
+                result = pickle.load(fd)
+        except (
+            OSError,
+            EOFError,
+            pickle.UnpicklingError,
+            # an entry pickled by an older build, whose classes have since been renamed
+            # or moved
+            AttributeError,
+            ImportError,
+        ):
+            # an entry which can't be read never will be
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        # the modification time orders entries for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                pickle.dump(result, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is under max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # another process got to it first
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,176 @@
+"""
+A registry of the sample IDs of every workbook validated, kept in an SQLite file.
+
+process_row finds a bioplatforms_sample_id used twice in one workbook. SampleRegistry
+finds one used again in a later submission: each workbook's IDs are recorded with the
+file, sheet, row and revision date they came from, and the IDs of a new workbook are
+looked up against all of those in one query, using the index on the ID.
+
+IDs are normalised with extract_ands_ids before they are recorded or looked up, so
+`102.100.100/1234`, `102.100.100.1234` and `1234` are the same sample.
+
+Pass a registry to BaseSampleContextual as sample_registry to check each workbook it
+reads, and record its IDs. Workbooks read by several processes at once would each miss
+the IDs of the others, as an ID is looked up and then recorded in separate steps; pass
+record_samples instead, and check the SampleRows of each workbook against the registry
+with check_samples, in one process, in order.
+"""
+
+import os
+import sqlite3
+from collections import namedtuple
+
+from . import errors
+from .bpa_ingest_validations import extract_ands_ids
+
+SampleRecord = namedtuple(
+    "SampleRecord", ["sample_id", "file_name", "sheet", "row", "revision_date"]
+)
+
+# the samples read from a workbook, see BaseSampleContextual.samples
+SampleRows = namedtuple(
+    "SampleRows",
+    [
+        "file_name",
+        "sheet",
+        # the column the sample IDs are in, for the error messages
+        "field",
+        # (sample ID, row) for each sample
+        "rows",
+        "revision_date",
+        # False if the sheet was only partly read, and the samples aren't recorded
+        "complete",
+    ],
+)
+
+_schema = """
+CREATE TABLE IF NOT EXISTS samples (
+    sample_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    sheet TEXT,
+    row INTEGER,
+    revision_date TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_sample_id ON samples (sample_id);
+CREATE INDEX IF NOT EXISTS samples_file_name ON samples (file_name);
+"""
+
+
+def normalise_sample_ids(sample_ids):
+    """The sample IDs normalised by extract_ands_ids, None for those which aren't IDs"""
+    sample_ids = list(sample_ids)
+    normalised, errors = extract_ands_ids(sample_ids, silent=True)
+    return [None if error else value for value, error in zip(normalised, errors)]
+
+
+def check_samples(registry, samples):
+    """
+    ValidationErrors for the SampleRows samples already recorded in registry from other
+    workbooks, then record the samples, if the sheet was read in full
+    """
+    file_name = os.path.abspath(samples.file_name)
+    found = registry.find(
+        (sample_id for sample_id, _row in samples.rows), exclude_file=file_name
+    )
+    reused = []
+    for sample_id, row_num in samples.rows:
+        for record in found.get(sample_id, ()):
+            reused.append(
+                errors.ValidationError(
+                    errors.REUSED_SAMPLE_ID,
+                    (sample_id, record.file_name, record.sheet, record.row),
+                    field=samples.field,
+                    row=row_num,
+                    file_name=samples.file_name,
+                    sheet=samples.sheet,
+                )
+            )
+    if samples.complete:
+        registry.register(file_name, samples.sheet, samples.rows, samples.revision_date)
+    return reused
+
+
+class SampleRegistry:
+    """
+    Sample IDs recorded from validated workbooks.
+
+    path: the SQLite file, created if it doesn't exist
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        with self._db:
+            self._db.executescript(_schema)
+        # the IDs being looked up, joined against samples by find()
+        self._db.execute(
+            "CREATE TEMP TABLE lookup (sample_id TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+    def find(self, sample_ids, exclude_file=None):
+        """
+        The records of the given sample IDs, as {sample ID: [SampleRecord]}, leaving out
+        IDs which aren't recorded and, if exclude_file is given, the records of that file
+        """
+        sample_ids = set(filter(None, normalise_sample_ids(sample_ids)))
+        if not sample_ids:
+            return {}
+        query = (
+            "SELECT s.sample_id, s.file_name, s.sheet, s.row, s.revision_date "
+            "FROM lookup l JOIN samples s ON s.sample_id = l.sample_id"
+        )
+        params = ()
+        if exclude_file is not None:
+            query += " WHERE s.file_name != ?"
+            params = (exclude_file,)
+        query += " ORDER BY s.rowid"
+        found = {}
+        with self._db:
+            self._db.execute("DELETE FROM lookup")
+            self._db.executemany(
+                "INSERT INTO lookup (sample_id) VALUES (?)",
+                ((sample_id,) for sample_id in sample_ids),
+            )
+            for record in self._db.execute(query, params):
+                record = SampleRecord(*record)
+                found.setdefault(record.sample_id, []).append(record)
+            self._db.execute("DELETE FROM lookup")
+        return found
+
+    def register(self, file_name, sheet, samples, revision_date=None):
+        """
+        Record the samples of workbook file_name, replacing any recorded from it before.
+
+        samples: (sample ID, row) for each sample
+        """
+        samples = list(samples)
+        sample_ids = normalise_sample_ids(sample_id for sample_id, _row in samples)
+        with self._db:
+            self._db.execute("DELETE FROM samples WHERE file_name = ?", (file_name,))
+            self._db.executemany(
+                "INSERT INTO samples (sample_id, file_name, sheet, row, revision_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    (sample_id, file_name, sheet, row, revision_date)
+                    for sample_id, (_raw, row) in zip(sample_ids, samples)
+                    if sample_id is not None
+                ),
+            )
+
+    def forget(self, file_name):
+        """Remove the samples recorded from workbook file_name"""
+        with self._db:
+            self._db.execute("DELETE FROM samples WHERE file_name = ?", (file_name,))
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        return False
@@ -0,0 +1,334 @@
+"""
+A field_spec compiled once, for mapping the header of every sheet read with it.
+
+ExcelWrapper maps each field of its field_spec to a column of the sheet's header. Done
+from the field_spec each time, that lowercases every column name in the spec, matches
+each regular expression in the spec against every column of the header, and rebuilds
+the field names and coerce function table, for every workbook. CompiledSchema does the
+work which depends only on the field_spec once: the column names are normalised, the
+regular expressions are combined into one, matched once against each column, and the
+field names and coerce functions are kept. How a header maps is cached, keyed by the
+header row, so workbooks written from the same template skip mapping altogether.
+
+Once a header is mapped, row_decoder() generates a function decoding the sheet's rows
+for that mapping: the Python source reads just the mapped cells, by their column
+index, and calls each field's coerce function directly, where ExcelWrapper's generic
+loop looks up the column and coerce function of every field for every cell. The
+generated decoders are cached too.
+
+compile_schema() returns the CompiledSchema of a field_spec, compiling it the first
+time it is seen; ExcelWrapper uses it, so a class's field_spec is compiled once.
+"""
+
+import bisect
+import functools
+import re
+from collections import Counter, namedtuple
+
+DEFAULT_MAX_HEADERS = 64
+
+# CompiledSchema.resolve() result
+HeaderMapping = namedtuple(
+    "HeaderMapping",
+    [
+        # the column names, stripped and lowercased, extra columns of find_all fields
+        # renamed to the field's attribute and a number
+        "header",
+        # {field attribute: column index, or None if missing}, find_all fields add
+        # attribute2, attribute3 etc. for their extra columns
+        "column_map",
+        # the FieldDefinitions with no column, in field_spec order
+        "missing",
+        # indexes of the non-blank columns not mapped to a field or skipped
+        "unmapped",
+        # values of the header row which aren't strings
+        "non_strings",
+    ],
+)
+
+# a pattern with a named group, or a backreference, can't be part of the combined
+# regular expression, its group names and numbers would change
+_backreference_re = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def _is_regex(column_name):
+    return hasattr(column_name, "match")
+
+
+class CompiledSchema:
+    """
+    The field_spec of an ExcelWrapper, compiled for mapping headers.
+
+    field_spec: list of FieldDefinitions and SkipColumns
+    max_headers: number of distinct header rows to cache the mapping of
+    """
+
+    def __init__(self, field_spec, max_headers=DEFAULT_MAX_HEADERS):
+        self.field_spec = list(field_spec)
+        self.field_definitions = [
+            spec for spec in self.field_spec if not _is_skip_column(spec)
+        ]
+        self.field_names = [spec.attribute for spec in self.field_definitions]
+        if len(list(self.field_names)) != len(self.field_definitions):
+            # this is a problem in the bpa-ingest code, not in the passed-in spreadsheet,
+            # so we can fail hard here
+            raise Exception(
+                "duplicate attribute in field definition: %s"
+                % [t for (t, c) in Counter(self.field_names).items() if c > 1]
+            )
+        self.coercers = dict(
+            (spec.attribute, spec.coerce) for spec in self.field_definitions
+        )
+
+        # each distinct column name or regular expression in the spec is a matcher,
+        # either (False, normalised name) or (True, index into self._patterns)
+        self._patterns = []
+        pattern_index = {}
+
+        def matcher(column_name):
+            if not _is_regex(column_name):
+                return False, column_name.strip().lower()
+            if column_name not in pattern_index:
+                pattern_index[column_name] = len(self._patterns)
+                self._patterns.append(column_name)
+            return True, pattern_index[column_name]
+
+        # (spec, matchers to try in turn)
+        self._plan = []
+        for spec in self.field_spec:
+            if _is_skip_column(spec):
+                if spec.skip_all and not _is_regex(spec.column_name):
+                    raise Exception("Column name must be a regex for find all")
+                self._plan.append((spec, [matcher(spec.column_name)]))
+                continue
+            names = spec.column_name
+            if not isinstance(names, tuple):
+                names = (names,)
+            if spec.find_all and not all(_is_regex(name) for name in names):
+                raise Exception("Column name must be a regex for find all")
+            self._plan.append((spec, [matcher(name) for name in names]))
+        self._combine_patterns()
+
+        self._resolve_cached = functools.lru_cache(maxsize=max_headers)(self._resolve)
+        self.row_decoder = functools.lru_cache(maxsize=max_headers)(self._row_decoder)
+
+    def _combine_patterns(self):
+        """
+        Joins the patterns into one regular expression, an optional lookahead per pattern
+        with a named group, so one match against a column shows every pattern which
+        matches it. Patterns which can't be combined are matched on their own.
+        """
+        parts = []
+        # (index into match.groups(), pattern index)
+        self._combined_groups = []
+        self._separate_patterns = []
+        group_count = 0
+        for pattern_idx, pattern in enumerate(self._patterns):
+            if (
+                not isinstance(pattern.pattern, str)
+                or pattern.flags != re.UNICODE
+                or pattern.groupindex
+                or _backreference_re.search(pattern.pattern)
+            ):
+                self._separate_patterns.append(pattern_idx)
+                continue
+            parts.append("(?:(?=(?P<p{}>{})))?".format(pattern_idx, pattern.pattern))
+            self._combined_groups.append((group_count, pattern_idx))
+            group_count += 1 + pattern.groups
+        self._combined = re.compile("".join(parts)) if parts else None
+
+    def matching_patterns(self, name):
+        """Indexes of the patterns in the field_spec that match column name"""
+        matching = []
+        if self._combined is not None:
+            groups = self._combined.match(name).groups()
+            matching = [idx for group, idx in self._combined_groups if groups[group] is not None]
+        for idx in self._separate_patterns:
+            if self._patterns[idx].match(name):
+                matching.append(idx)
+        return matching
+
+    def resolve(self, values):
+        """
+        HeaderMapping of the header row values, the same object for the same values.
+        Don't modify it.
+        """
+        values = tuple(values)
+        # keyed on the types too, 1 and 1.0 are different column names
+        return self._resolve_cached(values, tuple(map(type, values)))
+
+    def resolve_cache_info(self):
+        return self._resolve_cached.cache_info()
+
+    def _resolve(self, values, _types):
+        non_strings = []
+        header = []
+        for value in values:
+            if not isinstance(value, str):
+                non_strings.append(value)
+                value = str(value)
+            header.append(value.strip().lower())
+        index = _HeaderIndex(self, header)
+
+        column_map = {}
+        skip_columns = set()
+        missing = []
+        for spec, matchers in self._plan:
+            if _is_skip_column(spec):
+                if spec.skip_all:
+                    skip_columns.update(index.all(matchers[0]))
+                else:
+                    skip_columns.update(index.first(matchers[0]))
+                continue
+
+            find = index.all if spec.find_all else index.first
+            col_index_list = []
+            for column_matcher in matchers:
+                col_index_list = find(column_matcher)
+                if col_index_list:
+                    break
+
+            if not col_index_list:
+                missing.append(spec)
+                column_map[spec.attribute] = None
+                continue
+            for counter, col_index in enumerate(col_index_list):
+                key_name = spec.attribute
+                if counter > 0:
+                    key_name += str(counter + 1)
+                    index.rename(col_index, key_name)
+                column_map[key_name] = col_index
+
+        mapped_columns = set(column_map.values())
+        unmapped = [
+            idx
+            for idx, name in enumerate(header)
+            if name != "" and idx not in mapped_columns and idx not in skip_columns
+        ]
+        return HeaderMapping(header, column_map, missing, unmapped, non_strings)
+
+
+    def _row_decoder(self, field_names, columns, coerced, context_size):
+        """
+        A generator function decoding rows of cells the way ExcelWrapper.get_all() does.
+
+        field_names: the fields of a row, all of field_names or some of them
+        columns: column index of each field, None for fields with no column
+        coerced: whether each field has a coerce function
+        context_size: number of additional context values added to each row
+
+        It is called as decode(rows, typ, funcs, context, get_date_time, cell_error):
+        rows are sequences of xlrd cells, typ the namedtuple of a row, funcs the coerce
+        function of each field, context the additional context values, get_date_time
+        and cell_error ExcelWrapper's methods for converting dates and reporting errors.
+        """
+        source = _row_decoder_source(field_names, columns, coerced, context_size)
+        namespace = {}
+        exec(compile(source, "<row decoder>", "exec"), namespace)
+        return namespace["decode_rows"]
+
+
+def _row_decoder_source(field_names, columns, coerced, context_size):
+    # excel_wrapper imports this module
+    from .excel_wrapper import XL_CELL_DATE, XL_CELL_TEXT
+
+    lines = [
+        "def decode_rows(rows, typ, funcs, context, get_date_time, cell_error):",
+        "    new = tuple.__new__",
+    ]
+    for field_idx, (column, has_func) in enumerate(zip(columns, coerced)):
+        if column is not None and has_func:
+            lines.append("    f{0} = funcs[{0}]".format(field_idx))
+    lines.append("    for row_num, row in enumerate(rows, 1):")
+    values = []
+    for field_idx, (name, column, has_func) in enumerate(zip(field_names, columns, coerced)):
+        if column is None:
+            values.append("None")
+            continue
+        value = "v{}".format(field_idx)
+        values.append(value)
+        lines += [
+            "        cell = row[{}]".format(column),
+            "        ctype = cell.ctype",
+            "        val = cell.value",
+            "        if ctype == {}:".format(XL_CELL_DATE),
+            "            val = get_date_time({}, cell)".format(column),
+            "        elif ctype == {}:".format(XL_CELL_TEXT),
+            "            val = val.strip()",
+        ]
+        if not has_func:
+            lines.append("        {} = val".format(value))
+            continue
+        lines += [
+            "        {}, error = f{}(val)".format(value, field_idx),
+            "        if error:",
+            "            cell_error({!r}, {}, row_num, error)".format(name, column),
+        ]
+    record = "({},)".format(", ".join(values)) if values else "()"
+    if context_size:
+        record += " + context"
+    lines.append("        yield new(typ, {})".format(record))
+    return "\n".join(lines) + "\n"
+
+
+def _is_skip_column(spec):
+    # SkipColumn has no attribute field, see excel_wrapper
+    return not hasattr(spec, "attribute")
+
+
+class _HeaderIndex:
+    """
+    The columns of a header by name and by the patterns which match them, kept up to
+    date as columns are renamed
+    """
+
+    def __init__(self, schema, header):
+        self._schema = schema
+        self.header = header
+        self._by_name = {}
+        self._by_pattern = [[] for _pattern in schema._patterns]
+        for idx, name in enumerate(header):
+            self._add(idx, name)
+
+    def _add(self, idx, name):
+        bisect.insort(self._by_name.setdefault(name, []), idx)
+        for pattern_idx in self._schema.matching_patterns(name):
+            bisect.insort(self._by_pattern[pattern_idx], idx)
+
+    def rename(self, idx, name):
+        old_name = self.header[idx]
+        self._by_name[old_name].remove(idx)
+        for pattern_idx in self._schema.matching_patterns(old_name):
+            self._by_pattern[pattern_idx].remove(idx)
+        self.header[idx] = name
+        self._add(idx, name)
+
+    def all(self, matcher):
+        """Indexes of all the columns matcher matches"""
+        is_pattern, key = matcher
+        if is_pattern:
+            return list(self._by_pattern[key])
+        return list(self._by_name.get(key, ()))
+
+    def first(self, matcher):
+        """Index of the first column matcher matches, as a list, empty if none"""
+        return self.all(matcher)[:1]
+
+
+_schemas = {}
+_max_schemas = 128
+
+
+def compile_schema(field_spec):
+    """The CompiledSchema of field_spec, compiled only the first time it is seen"""
+    field_spec_list = list(field_spec)
+    cached = _schemas.get(id(field_spec))
+    # compared as well as looked up by id, in case field_spec was changed in place, or
+    # is a new list with the id of one since freed
+    if cached is not None and cached.field_spec == field_spec_list:
+        return cached
+    schema = CompiledSchema(field_spec_list)
+    if len(_schemas) >= _max_schemas:
+        _schemas.pop(next(iter(_schemas)), None)
+    _schemas[id(field_spec)] = schema
+    return schema
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+
+from .bpa_ingest_validations import column_date_isoformat, get_int, int_or_comment
+from .cli import find_workbooks, main, merge_reports, validate_file, validate_files
+from .date_parser import DateParser
+from .errors import ErrorBudget
+from .excel_wrapper import make_field_definition as fld
+from .result_cache import ValidationCache, schema_fingerprint
+
+
+def sample_rows(sample_ids):
+    return [[sample_id, "s{}".format(sample_id)] for sample_id in sample_ids]
+
+
+def test_validate_directory(tmp_path, make_workbook, capsys):
+    (tmp_path / "b").mkdir()
+    make_workbook(tmp_path / "b" / "second.xlsx", sample_rows([3, 4, 5]))
+    make_workbook(tmp_path / "first.xlsx", sample_rows([1, 2]))
+    make_workbook(tmp_path / "duplicates.xlsx", sample_rows([7, 7]))
+    (tmp_path / "notes.txt").write_text("not a workbook")
+    (tmp_path / "~$first.xlsx").write_text("excel lock file")
+
+    fnames = find_workbooks([str(tmp_path)])
+    assert [f[len(str(tmp_path)) + 1 :] for f in fnames] == [
+        "b/second.xlsx",
+        "duplicates.xlsx",
+        "first.xlsx",
+    ]
+
+    report = merge_reports(validate_files(fnames, workers=2))
+    assert [r["sample_count"] for r in report["files"]] == [3, 0, 2]
+    assert report["sample_count"] == 5
+    assert report["failed_count"] == 1
+    assert report["files"][1]["errors"][-1] == (
+        "Exception: duplicate bioplatforms_sample_id: 102.100.100/7"
+    )
+    # the same report whatever the number of workers
+    assert merge_reports(validate_files(fnames, workers=1)) == report
+
+    assert main(["--json", "--workers", "2", str(tmp_path)]) == 1
+    assert json.loads(capsys.readouterr().out) == report
+
+
+def test_validation_cache(tmp_path, make_workbook):
+    fname = str(tmp_path / "samples.xlsx")
+    make_workbook(fname, sample_rows([1, 2, 3]))
+    cache_dir = str(tmp_path / "cache")
+    report = validate_file(fname, cache_dir=cache_dir)
+    assert report["sample_count"] == 3
+    cache = ValidationCache(cache_dir)
+    (entry,) = cache._entries()
+    cached = validate_file(fname, cache_dir=cache_dir)
+    assert cached == report
+
+    # a changed workbook gets a new entry
+    make_workbook(fname, sample_rows([1, 2]))
+    assert validate_file(fname, cache_dir=cache_dir)["sample_count"] == 2
+    assert len(cache._entries()) == 2
+
+    # the cache is trimmed to its size cap, least recently used first
+    small = ValidationCache(cache_dir, max_bytes=entry[1])
+    small.evict()
+    assert len(small._entries()) == 1
+
+
+def test_validation_cache_path(tmp_path, make_workbook):
+    fname = str(tmp_path / "samples.xlsx")
+    make_workbook(fname, sample_rows([1, 2]))
+    cache_dir = str(tmp_path / "cache")
+    report = validate_file(fname, cache_dir=cache_dir)
+
+    # a copy, with the same content, is reported under its own name
+    (tmp_path / "copy").mkdir()
+    copy = str(tmp_path / "copy" / "renamed.xlsx")
+    shutil.copyfile(fname, copy)
+    copied = validate_file(copy, cache_dir=cache_dir)
+    assert copied["errors"] == [
+        error.replace("samples.xlsx", "renamed.xlsx").replace(
+            str(tmp_path), str(tmp_path / "copy")
+        )
+        for error in report["errors"]
+    ]
+    assert copied["errors"] != report["errors"]
+    assert len(ValidationCache(cache_dir)._entries()) == 2
+
+    # a workbook which failed is read again next time
+    broken = str(tmp_path / "broken.xlsx")
+    make_workbook(broken, sample_rows([1, 1]))
+    assert validate_file(broken, cache_dir=cache_dir)["failed"]
+    assert len(ValidationCache(cache_dir)._entries()) == 2
+
+
+def test_validation_cache_unreadable_entry(tmp_path):
+    cache = ValidationCache(str(tmp_path))
+    cache.put("stale", {"report": None})
+    path = cache._path("stale")
+    # entries pickled by a build with a class, or a module, since removed
+    for pickled in (b"cbpa_ingest_validation.errors\nRenamed\n.", b"cno_such_module\nx\n."):
+        with open(path, "wb") as fd:
+            fd.write(pickled)
+        assert cache.get("stale") is None
+        assert not os.path.exists(path)
+    assert cache.get("missing") is None
+
+
+def test_schema_fingerprint(monkeypatch):
+    spec = [fld("depth", "depth", coerce=get_int)]
+    assert schema_fingerprint(spec) == schema_fingerprint(
+        [fld("depth", "depth", coerce=get_int)]
+    )
+    assert schema_fingerprint(spec) != schema_fingerprint(
+        [fld("depth", "depth", coerce=int_or_comment)]
+    )
+    assert schema_fingerprint(spec) != schema_fingerprint(
+        [fld("depth", "depth", coerce=get_int, optional=True)]
+    )
+
+    # a DateParser's code is part of its fingerprint, not just its formats
+    parser_spec = [fld("date", "date", coerce=column_date_isoformat())]
+    fingerprint = schema_fingerprint(parser_spec)
+    with monkeypatch.context() as patch:
+        patch.setattr(DateParser, "parse", lambda self, value: None)
+        assert schema_fingerprint(parser_spec) != fingerprint
+    assert schema_fingerprint(parser_spec) == fingerprint
+
+    # same name, different code
+    def edited(val):
+        return val, None
+
+    edited.__module__ = get_int.__module__
+    edited.__qualname__ = get_int.__qualname__
+    assert schema_fingerprint(spec) != schema_fingerprint(
+        [fld("depth", "depth", coerce=edited)]
+    )
+
+
+def test_error_budget(tmp_path, make_workbook, capsys):
+    fname = str(tmp_path / "broken.xlsx")
+    make_workbook(fname, sample_rows(["junk{}".format(n) for n in range(20)]))
+    assert main(["--max-errors", "4", "--workers", "1", fname]) == 1
+    out = capsys.readouterr().out
+    assert "broken.xlsx: 0 samples, " in out
+    assert "(STOPPED: more than 4 errors)" in out
+
+    # stops before reading any rows, the sheet only has the two id columns
+    report = validate_file(fname, error_budget=ErrorBudget(stop_on_missing_column=True))
+    assert report["stopped"].startswith("required columns missing: specimen_id, ")
+    assert report["sample_count"] == 0
+
+
+def test_preflight(tmp_path, make_workbook, capsys):
+    fname = str(tmp_path / "samples.xlsx")
+    make_workbook(fname, sample_rows([1, 2, 3]))
+    report = validate_file(fname, preflight=True)
+    assert report["sample_count"] == 0
+    assert report["missing_columns"][0] == "specimen_id"
+    assert report["unmapped_columns"] == []
+    # the same header errors as a full validation, before any row is read
+    full = validate_file(fname)
+    assert report["errors"] == full["errors"][: len(report["errors"])]
+    assert "suggested template" in report["errors"][-1]
+
+    assert main(["--preflight", "--workers", "1", fname]) == 1
+    assert "samples.xlsx: header only, " in capsys.readouterr().out
+
+
+def test_sample_registry(tmp_path, make_workbook, capsys):
+    (tmp_path / "first").mkdir()
+    make_workbook(tmp_path / "first" / "samples.xlsx", sample_rows([1, 2, 3]))
+    (tmp_path / "second").mkdir()
+    second = str(tmp_path / "second" / "samples.xlsx")
+    make_workbook(second, sample_rows([4, "102.100.100.2"]))
+    registry = str(tmp_path / "registry.sqlite")
+
+    assert main(["--workers", "1", "--sample-registry", registry, str(tmp_path / "first")]) == 1
+    capsys.readouterr()
+    report = validate_file(second, sample_registry=registry)
+    assert report["errors"][-1] == (
+        "bioplatforms_sample_id 102.100.100/2 in `samples.xlsx' `Sample metadata' row 2 "
+        "was already submitted in `{}' `Sample metadata' row 2".format(
+            tmp_path / "first" / "samples.xlsx"
+        )
+    )
+    # validating a workbook again doesn't find its own samples
+    errors = validate_file(second, sample_registry=registry)["errors"]
+    assert errors == report["errors"]
+    assert validate_file(second)["errors"] == errors[:-1]
+
+
+def test_sample_registry_workers(tmp_path, make_workbook):
+    fnames = []
+    for name in "abcd":
+        fnames.append(str(tmp_path / "{}.xlsx".format(name)))
+        make_workbook(fnames[-1], sample_rows([1, 2]))
+    registry = str(tmp_path / "registry.sqlite")
+
+    reports = validate_files(fnames, workers=4, sample_registry=registry)
+    reused = [
+        [error for error in report["errors"] if "was already submitted" in error]
+        for report in reports
+    ]
+    # each workbook's IDs are reported against every workbook before it
+    assert [len(errors) for errors in reused] == [0, 2, 4, 6]
+    assert all(fnames[0] in errors[0] for errors in reused[1:])
+    assert all("samples" not in report for report in reports)
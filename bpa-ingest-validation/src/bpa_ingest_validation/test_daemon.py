@@ -0,0 +1,94 @@
+import json
+import threading
+
+import pytest
+
+from .daemon import (
+    QueueFull,
+    ValidationService,
+    connect,
+    make_server,
+    request_validation,
+)
+
+
+@pytest.fixture
+def service():
+    service = ValidationService(workers=1, queue_size=2)
+    service.warm_up()
+    yield service
+    service.close()
+
+
+def serve(listen, service):
+    server = make_server(listen, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def test_validate_over_unix_socket(tmp_path, make_workbook, service):
+    make_workbook(tmp_path / "first.xlsx", [[1, "s1"], [2, "s2"]])
+    make_workbook(tmp_path / "duplicates.xlsx", [[7, "s7"], [7, "s7"]])
+    listen = "unix:" + str(tmp_path / "daemon.sock")
+    server = serve(listen, service)
+    try:
+        lines = list(request_validation(listen, [str(tmp_path)]))
+        reports = sorted(lines[:-1], key=lambda report: report["file"])
+        assert [(r["sample_count"], r["failed"]) for r in reports] == [(0, True), (2, False)]
+        assert lines[-1]["summary"]["sample_count"] == 2
+        assert lines[-1]["summary"]["failed_count"] == 1
+
+        # three files are validated with a queue of two, the third once there's room
+        make_workbook(tmp_path / "third.xlsx", [[3, "s3"]])
+        lines = list(request_validation(listen, [str(tmp_path)]))
+        assert lines[-1]["summary"]["file_count"] == 3
+        assert lines[-1]["summary"]["sample_count"] == 3
+        assert service.pending == 0
+
+        # a job arriving when the queue is full is refused
+        assert service._reserve(2) == 2
+        try:
+            with pytest.raises(QueueFull):
+                list(request_validation(listen, [str(tmp_path)]))
+        finally:
+            service._release()
+            service._release()
+        assert service.pending == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_upload(tmp_path, make_workbook, service):
+    make_workbook(tmp_path / "samples.xlsx", [[1, "s1"], [2, "s2"], [3, "s3"]])
+    server = serve("127.0.0.1:0", service)
+    try:
+        listen = "127.0.0.1:{}".format(server.server_address[1])
+        connection = connect(listen)
+        connection.request(
+            "POST",
+            "/upload",
+            (tmp_path / "samples.xlsx").read_bytes(),
+            {"X-Filename": "../samples.xlsx"},
+        )
+        response = connection.getresponse()
+        assert response.status == 200
+        report, summary = [json.loads(line) for line in response]
+        assert report["file"] == "samples.xlsx"
+        assert report["sample_count"] == 3
+        assert summary["summary"]["file_count"] == 1
+
+        for filename in ("..", ".", "dir/"):
+            connection = connect(listen)
+            connection.request("POST", "/upload", b"", {"X-Filename": filename})
+            response = connection.getresponse()
+            assert response.status == 400
+            assert "X-Filename" in json.loads(response.read())["error"]
+
+        connection = connect(listen)
+        connection.request("GET", "/health")
+        assert json.loads(connection.getresponse().read())["pending"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,315 @@
+import datetime
+import functools
+import logging
+
+import openpyxl
+import pytest
+import xlrd
+from xlrd.sheet import Cell
+
+from .excel_wrapper import ExcelWrapper, MergedCellIndex, make_field_definition as fld
+from .bpa_ingest_validations import extract_ands_id, get_clean_number
+from . import xlsx_header
+from .errors import ErrorBudget
+
+logger = logging.getLogger(__name__)
+
+field_spec = [
+    fld("sample_id", "sample_id", coerce=extract_ands_id),
+    fld("depth", "depth", coerce=get_clean_number),
+    fld("collection_date", "collection_date"),
+    fld("notes", "notes"),
+    fld("collector", "collector"),
+]
+
+
+HEADER = ["sample_id", "depth", "collection_date", "notes", "extra"]
+
+
+@pytest.fixture
+def make_workbook(make_workbook):
+    return functools.partial(make_workbook, header=HEADER)
+
+
+def test_streaming_get_all(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "samples.xlsx",
+        [
+            [1234, "12.5", datetime.datetime(2021, 3, 4), "  padded  ", "x"],
+            ["102.100.100/5678", 3, datetime.datetime(2021, 3, 5, 10, 30), None, "y"],
+            ["junk", "deep", None, "note", None],
+        ],
+    )
+    wrapper = ExcelWrapper(
+        logger, field_spec, fname, sheet_name="Sample metadata", header_length=1, streaming=True
+    )
+    errors = wrapper.get_errors()
+    assert errors == [
+        "E3001: Column `collector' not found in `samples.xlsx' `Sample metadata'",
+        "E3002: Column `extra` in `samples.xlsx` `Sample metadata` is not mapped to an output field in the codebase.",
+    ]
+    rows = list(wrapper.get_all())
+    assert [row.sample_id for row in rows] == [
+        "102.100.100/1234",
+        "102.100.100/5678",
+        None,
+    ]
+    assert [row.depth for row in rows] == [12.5, 3.0, None]
+    assert rows[0].collection_date == datetime.datetime(2021, 3, 4)
+    assert rows[1].collection_date == datetime.datetime(2021, 3, 5, 10, 30)
+    assert rows[2].collection_date == ""
+    assert rows[0].notes == "padded"
+    assert rows[0].collector is None
+    assert wrapper.get_errors()[2:] == [
+        "Field sample_id, Cell A:3 in samples.xlsx, Sample metadata: unable to parse BPA ID: junk",
+        "Field depth, Cell B:3 in samples.xlsx, Sample metadata: Potential invalid number - Value error: deep",
+    ]
+    record = wrapper.get_error_records()[2]
+    assert (record.code, record.field, record.column, record.row, record.sheet) == (
+        None,
+        "sample_id",
+        0,
+        3,
+        "Sample metadata",
+    )
+    assert record.args == ("unable to parse BPA ID: junk",)
+    assert wrapper.get_error_records()[0].code == "E3001"
+
+
+def test_streaming_merged_cells(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "merged.xlsx",
+        [
+            [1, 1.0, None, "shared", None],
+            [2, 2.0, None, None, None],
+            [3, 3.0, None, None, None],
+        ],
+        merged=["D2:D4"],
+    )
+    wrapper = ExcelWrapper(
+        logger, field_spec, fname, sheet_name="Sample metadata", header_length=1, streaming=True
+    )
+    assert [row.notes for row in wrapper.get_all()] == ["shared", "shared", "shared"]
+
+
+def test_merged_cell_index():
+    # two ranges: B1:C2 starting in the header row, and A3:A5 running to the end
+    index = MergedCellIndex([(2, 5, 0, 1), (0, 2, 1, 3)])
+    sheet = [[Cell(xlrd.XL_CELL_NUMBER, float(10 * r + c)) for c in range(3)] for r in range(5)]
+    resolved = [[cell.value for cell in index.resolve(r, row)] for r, row in enumerate(sheet)]
+    assert resolved == [
+        [0.0, 1.0, 1.0],
+        [10.0, 1.0, 1.0],
+        [20.0, 21.0, 22.0],
+        [20.0, 31.0, 32.0],
+        [20.0, 41.0, 42.0],
+    ]
+
+
+def test_columnar_get_all(tmp_path, make_workbook):
+    rows = [
+        [1234, "12.5", datetime.datetime(2021, 3, 4), "  padded  ", "x"],
+        ["junk", "deep", None, "note", None],
+        ["102.100.100/5678", 3, None, None, "y"],
+    ] * 5
+    fname = make_workbook(tmp_path / "samples.xlsx", rows)
+    serial = ExcelWrapper(logger, field_spec, fname, header_length=1, streaming=True)
+    columnar = ExcelWrapper(logger, field_spec, fname, header_length=1, streaming=True)
+    assert list(columnar.get_all(columnar=True, chunk_size=4)) == list(serial.get_all())
+    assert columnar.get_errors() == serial.get_errors()
+    # the rows with errors are only noted for an error budget
+    assert columnar._error_rows is None
+
+
+def test_generated_row_decoder(tmp_path, make_workbook):
+    rows = [
+        [1234, "12.5", datetime.datetime(2021, 3, 4), "  padded  ", "x"],
+        ["junk", "deep", datetime.datetime(2021, 3, 5, 10, 30), None, "y"],
+        ["102.100.100/5678", 3, "  ", 7, None],
+    ]
+    fname = make_workbook(tmp_path / "samples.xlsx", rows)
+    context = {"file": "samples.xlsx", "batch": 2}
+    generic = ExcelWrapper(logger, field_spec, fname, header_length=1, additional_context=context)
+    generic.generate_row_decoder = False
+    generated = ExcelWrapper(logger, field_spec, fname, header_length=1, additional_context=context)
+    assert list(generated.get_all()) == list(generic.get_all())
+    assert generated.get_error_records() == generic.get_error_records()
+    # the decoder is generated once for a header
+    decoder_info = generated.schema.row_decoder.cache_info()
+    list(ExcelWrapper(logger, field_spec, fname, header_length=1, additional_context=context).get_all())
+    assert generated.schema.row_decoder.cache_info().hits == decoder_info.hits + 1
+
+
+def test_projected_get_all(tmp_path, make_workbook):
+    rows = [
+        [1234, "12.5", datetime.datetime(2021, 3, 4), "  padded  ", "x"],
+        ["junk", "deep", None, "note", None],
+    ] * 3
+    fname = make_workbook(tmp_path / "samples.xlsx", rows)
+    full = ExcelWrapper(logger, field_spec, fname, header_length=1)
+    full_rows = list(full.get_all())
+    for columnar in (False, True):
+        wrapper = ExcelWrapper(logger, field_spec, fname, header_length=1)
+        projected = list(
+            wrapper.get_all(columnar=columnar, chunk_size=4, columns=["notes", "depth"])
+        )
+        assert projected[0]._fields == ("notes", "depth")
+        assert projected == [(row.notes, row.depth) for row in full_rows]
+        # the header is checked in full, cell errors only for the fields read
+        assert wrapper.get_errors() == [
+            error
+            for error in full.get_errors()
+            if not error.startswith("Field sample_id")
+        ]
+    with pytest.raises(ValueError, match="no field named extra"):
+        list(wrapper.get_all(columns=["depth", "extra"]))
+
+
+def test_memoized_get_all(tmp_path, make_workbook):
+    rows = [[1234, "12.5", None, "NA", None], ["junk", "12.5", None, "NA", None]] * 10
+    fname = make_workbook(tmp_path / "samples.xlsx", rows)
+    plain = ExcelWrapper(logger, field_spec, fname, header_length=1, streaming=True)
+    memoized = ExcelWrapper(
+        logger, field_spec, fname, header_length=1, streaming=True, memoize_size=16
+    )
+    assert list(memoized.get_all()) == list(plain.get_all())
+    assert memoized.get_errors() == plain.get_errors()
+    stats = memoized.coerce_cache_info()
+    assert set(stats) == {"sample_id", "depth"}
+    assert (stats["sample_id"].hits, stats["sample_id"].misses) == (18, 2)
+    assert (stats["depth"].hits, stats["depth"].misses) == (19, 1)
+
+
+def test_aggregate_errors(tmp_path, make_workbook):
+    rows = [["junk{}".format(n), "deep", None, None, None] for n in range(30)]
+    rows[10][0] = 10
+    fname = make_workbook(tmp_path / "dirty.xlsx", rows)
+    wrapper = ExcelWrapper(
+        logger,
+        field_spec,
+        fname,
+        header_length=1,
+        streaming=True,
+        aggregate_errors=True,
+        error_examples=2,
+    )
+    list(wrapper.get_all())
+    errors = wrapper.get_errors()
+    assert errors[0] == "E3001: Column `collector' not found in `dirty.xlsx' `Sample metadata'"
+    assert errors[1] == "E3002: Column `extra` in `dirty.xlsx` `Sample metadata` is not mapped to an output field in the codebase."
+    assert errors[2].splitlines() == [
+        "Field sample_id: 29 errors in rows 1-10, 12-30: unable to parse BPA ID (first 2 shown)",
+        "  Field sample_id, Cell A:1 in dirty.xlsx, Sample metadata: unable to parse BPA ID: junk0",
+        "  Field sample_id, Cell A:2 in dirty.xlsx, Sample metadata: unable to parse BPA ID: junk1",
+    ]
+    assert errors[3].splitlines()[0] == (
+        "Field depth: 30 errors in rows 1-30: Potential invalid number - Value error (first 2 shown)"
+    )
+    assert [group.count for group in wrapper.get_error_groups()] == [1, 1, 29, 30]
+
+
+def test_error_budget(tmp_path, make_workbook):
+    rows = [["junk{}".format(n), n, None, None, None] for n in range(50)]
+    rows[0][0] = rows[2][0] = 1
+    fname = make_workbook(tmp_path / "broken.xlsx", rows)
+
+    def read(columnar=False, **budget):
+        wrapper = ExcelWrapper(
+            logger,
+            field_spec,
+            fname,
+            header_length=1,
+            streaming=True,
+            error_budget=ErrorBudget(**budget),
+        )
+        return wrapper, list(wrapper.get_all(columnar=columnar, chunk_size=8))
+
+    wrapper, rows = read(max_field_errors=3)
+    assert len(rows) == 6
+    assert wrapper.stopped == "more than 3 errors in field sample_id"
+    assert wrapper.get_errors()[-1] == (
+        "Stopped reading `broken.xlsx' `Sample metadata' after 6 rows: "
+        "more than 3 errors in field sample_id"
+    )
+
+    wrapper, rows = read(max_errors=10)
+    assert len(rows) == 13
+    wrapper, rows = read(max_error_ratio=0.5, sample_rows=10)
+    assert len(rows) == 10
+    assert wrapper.stopped == "8 of the first 10 rows have errors"
+    # the columnar path counts a chunk's errors before yielding its first row
+    wrapper, rows = read(columnar=True, max_errors=10)
+    assert len(rows) == 9
+    # and the rows with errors, for the ratio
+    wrapper, rows = read(columnar=True, max_error_ratio=0.5, sample_rows=10)
+    assert len(rows) == 10
+    assert wrapper.stopped == "8 of the first 10 rows have errors"
+
+    # the required column collector is missing, so no rows are read
+    wrapper, rows = read(stop_on_missing_column=True)
+    assert rows == []
+    assert wrapper.stopped == "required columns missing: collector"
+
+    # a generous budget reads everything
+    wrapper, rows = read(max_errors=1000, max_field_errors=1000, max_error_ratio=1.0)
+    assert len(rows) == 50
+    assert wrapper.stopped is None
+
+
+def test_header_only(tmp_path, make_workbook):
+    fname = make_workbook(tmp_path / "samples.xlsx", [[1234, "12.5", None, "n", "x"]])
+    full = ExcelWrapper(logger, field_spec, fname, header_length=1, suggest_template=True)
+    wrapper = ExcelWrapper(
+        logger, field_spec, fname, header_length=1, suggest_template=True, header_only=True
+    )
+    assert wrapper.get_errors() == full.get_errors()
+    assert wrapper.header == full.header
+    assert wrapper.missing_required_fields() == ["collector"]
+    assert wrapper.unmapped_columns == ["extra"]
+    assert wrapper.suggested_template.startswith("[\n            fld('sample_id', ")
+    with pytest.raises(ValueError):
+        list(wrapper.get_all())
+
+
+def test_header_only_xlsx_cells(tmp_path):
+    # numbers, booleans, rich and inline text, gaps, and a hidden sheet first
+    workbook = openpyxl.Workbook()
+    hidden = workbook.active
+    hidden.title = "Lists"
+    hidden.sheet_state = "hidden"
+    hidden.append(["not", "this"])
+    sheet = workbook.create_sheet("Sample metadata")
+    sheet.append([None, "unused"])
+    sheet.append(["Sample ID ", 12, None, True, "depth"])
+    fname = str(tmp_path / "cells.xlsx")
+    workbook.save(fname)
+
+    book = openpyxl.load_workbook(fname, read_only=True)
+    expected = [c.value for c in next(book["Sample metadata"].iter_rows(min_row=2))]
+    header = xlsx_header.HeaderWorkbook(fname)
+    assert header.sheet_names() == ["Lists", "Sample metadata"]
+    assert header.sheet_by_index(0).visibility == 1
+    assert header.sheet_by_name("Sample metadata").row_values(1) == [
+        "Sample ID ", 12.0, "", 1, "depth"
+    ]
+    assert len(expected) == 5
+    assert header.sheet_by_name("Sample metadata").row_values(5) == []
+    assert header.props["modified"]
+    with pytest.raises(ValueError, match="header_only"):
+        header.sheet_by_name("Sample metadata").get_rows()
+
+
+def test_parallel_get_all(tmp_path, make_workbook):
+    rows = [
+        [1234, "12.5", datetime.datetime(2021, 3, 4), "  padded  ", "x"],
+        ["junk", "deep", None, "note", None],
+        ["102.100.100/5678", 3, None, None, "y"],
+    ] * 7
+    fname = make_workbook(tmp_path / "samples.xlsx", rows)
+    serial = ExcelWrapper(logger, field_spec, fname, header_length=1, streaming=True)
+    parallel = ExcelWrapper(logger, field_spec, fname, header_length=1, streaming=True)
+    expected = list(serial.get_all())
+    assert list(parallel.get_all(chunk_size=2, workers=2)) == expected
+    # row numbers in the errors follow on from chunk to chunk
+    assert parallel.get_errors() == serial.get_errors()
+    assert "Cell B:20 " in parallel.get_errors()[-1]
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import openpyxl.utils.cell
+import xlrd
+
+from . import errors, excel_wrapper
+
+# seconds to import the CLI, and with it metadata_handler and excel_wrapper
+IMPORT_BUDGET = 0.2
+HEAVY_MODULES = ("xlrd", "openpyxl", "pandas", "numpy", "concurrent.futures.process")
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import bpa_ingest_validation.cli
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def run_import():
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(heavy=HEAVY_MODULES)],
+        cwd=SRC_DIR,
+        universal_newlines=True,
+    )
+    elapsed, loaded = output.splitlines()
+    return float(elapsed), loaded
+
+
+def test_import_is_light():
+    timings = []
+    for _ in range(3):
+        elapsed, loaded = run_import()
+        assert loaded == ""
+        timings.append(elapsed)
+    assert min(timings) < IMPORT_BUDGET
+
+
+def test_lazy_stand_ins():
+    assert excel_wrapper.XL_CELL_TEXT == xlrd.XL_CELL_TEXT
+    assert excel_wrapper.XL_CELL_DATE == xlrd.XL_CELL_DATE
+    for idx in (1, 26, 27, 52, 53, 702, 703, 16384):
+        assert errors.get_column_letter(idx) == openpyxl.utils.cell.get_column_letter(idx)
@@ -1,13 +1,19 @@
+import datetime
+import random
 
 
-from bpa_ingest_validations  import (
+
+from .bpa_ingest_validations import (
     extract_ands_id,
+    extract_ands_ids,
     get_int,
     int_or_comment,
     get_date_isoformat,
     date_or_int_or_comment,
     get_clean_number
 )
+from .bpa_ingest_validations import column_date_isoformat
+from .columnar import batch_coerce
 
 def test_extract_and_id():
     assert True
@@ -31,6 +37,36 @@ def test_get_clean_number():
     assert get_clean_number( None) == (None, None)
     assert get_clean_number( 'Boo') == (None, 'Potential invalid number - Value error: Boo')
 
+def test_get_date_isoformat():
+    strings = (
+        ("2021-03-04", ("2021-03-04", None)),
+        ("2021-03", ("2021-03-01", None)),
+        ("04/03/2021", ("2021-03-04", None)),
+        ("04.03.21", ("2021-03-04", None)),
+        ("04/03/21", ("2021-03-04", None)),
+        ("2021-03-04T05:06:07Z", ("2021-03-04", None)),
+        ("TBA", (None, None)),
+        ("  ", (None, None)),
+        ("sometime", (None, "Date `sometime` is not in a supported format")),
+    )
+    for s, d in strings:
+        assert get_date_isoformat(s) == d
+    assert get_date_isoformat("sometime", silent=True) == (None, None)
+    assert get_date_isoformat(None) == (None, None)
+    assert get_date_isoformat(datetime.datetime(2021, 3, 4, 5, 6)) == ("2021-03-04", None)
+
+
+def test_column_date_isoformat_learns_format():
+    coerce = column_date_isoformat()
+    parser = coerce.keywords["parser"]
+    assert coerce("04/03/21") == ("2021-03-04", None)
+    assert parser.formats[0] == "%d/%m/%y"
+    assert coerce("05/03/21") == ("2021-03-05", None)
+    # a different format is still found, and becomes the first one tried
+    assert coerce("2021-03-06") == ("2021-03-06", None)
+    assert parser.formats[0] == "%Y-%m-%d"
+
+
 """
 the get_clean_doi method is not used at this time, and has not been converted.
 def test_get_clean_doi():
@@ -51,4 +87,62 @@ def test_get_clean_doi():
         assert get_clean_doi( s) == (f, None)
     assert get_clean_doi("") == ("", None)
     assert get_clean_doi(None) == (None, None)
-"""
\ No newline at end of file
+"""
+
+def test_batch_coerce_matches_scalar():
+    values = [
+        None, "", 12.0, 12.7, -0.5, -3.0, float("inf"), float("nan"), 1e300, 7,
+        "42", "-2.5", "3.", "007", " 5 ", "1e3", "37.1 degrees", "NA", "unknown",
+        "102.100.100/1234", "102.100.100.5678", "102.100.100/1234_2", "e.g. 1234",
+        "102.100.100.102.100.100.25977", "Boo", "12345678901234567890",
+        "-9223372036854775808", "9223372036854775807", 1.2345678901234567e19,
+    ]
+    for func in (get_clean_number, get_int, int_or_comment, extract_ands_id):
+        expected = []
+        for value in values:
+            try:
+                expected.append(func(value))
+            except (ValueError, OverflowError):
+                # the scalar functions do not guard against inf/nan; skip those for both
+                expected.append(None)
+        safe = [v for v, e in zip(values, expected) if e is not None]
+        out, errors = batch_coerce(func, safe)
+        assert list(zip(out, errors)) == [e for e in expected if e is not None], func
+
+
+def test_extract_ands_ids_matches_scalar():
+    values = [
+        None, "", 12.0, 12.7, -0.5, -3.0, 1e300, 7, -7, True, "42", "007", " 5 ", "NA",
+        "102.100.100/1234", "102.100.100.5678", "102.100..100/9", "102.100..100.10",
+        "102.100.100/1234_2", "1234_2", "1234__2", "102.100.100/", "102.100.100/x",
+        "102.100.100/102.100.100/5", "102.100.100.102.100.100.25977", "e.g. 1234",
+        "12\n34", "\x0112", "١٢٣", "²", "Boo",
+    ]
+    expected = [extract_ands_id(value) for value in values]
+    # the whole column, then columns of one kind of value, which take other paths
+    assert list(zip(*extract_ands_ids(values))) == expected
+    for kind in (str, float):
+        column = [v for v in values if type(v) is kind and v != "12\n34"]
+        assert list(zip(*extract_ands_ids(column))) == [extract_ands_id(v) for v in column]
+    canonical = ["102.100.100/1", "102.100.100/22", "102.100.100/333"]
+    assert extract_ands_ids(canonical) == (canonical, [None, None, None])
+    assert extract_ands_ids(canonical + ["102.100.100/"])[1][-1] == (
+        "unable to parse BPA ID: 102.100.100/"
+    )
+    assert extract_ands_ids([]) == ([], [])
+
+
+def test_extract_ands_ids_fuzz():
+    # random strings built from the pieces IDs, and the junk around them, are made of
+    pieces = [
+        "102.100.100/", "102.100.100.", "102.100..100/", "102.100..100.", "102.100.",
+        "1", "23", "0", "_", "_2", " ", "\n", "\t", "/", ".", "NA", "e.g. ", "x", "١",
+        "²", "",
+    ]
+    rng = random.Random(20)
+    values = [
+        "".join(rng.choice(pieces) for _ in range(rng.randint(0, 4)))
+        for _ in range(200000)
+    ]
+    ids, errors = extract_ands_ids(values)
+    assert list(zip(ids, errors)) == [extract_ands_id(value) for value in values]
@@ -0,0 +1,155 @@
+import functools
+import logging
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from .export import read_metadata_frame, write_metadata_parquet
+from . import readers
+from .metadata_handler import BaseDatasetControlContextual, BaseSampleContextual
+from .metadata_store import SpillingMetadataStore
+
+
+HEADER = ["bioplatforms_sample_id", "sample_id", "taxon_id", "decimal_longitude_public"]
+
+
+@pytest.fixture
+def make_workbook(make_workbook):
+    return functools.partial(make_workbook, header=HEADER)
+
+
+def test_read_metadata_frame(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "samples.xlsx",
+        [[1, "a", 9606, 151.2], [None, "skipped", None, None], [2, "b", None, 150.5]],
+    )
+    contextual = BaseSampleContextual(streaming=True)
+    sample_metadata = contextual._read_metadata(fname)
+    frame = read_metadata_frame(contextual, fname)
+
+    assert list(frame["bioplatforms_sample_id"]) == list(sample_metadata)
+    assert list(frame.columns[1:]) == list(sample_metadata["102.100.100/1"])
+    for record in frame.to_dict("records"):
+        expected = sample_metadata[record.pop("bioplatforms_sample_id")]
+        assert {k: None if pd.isna(v) else v for k, v in record.items()} == expected
+    # name_mapping applies to the columns, and integers with blanks stay integers
+    assert "longitude" in frame.columns
+    assert str(frame["taxon_id"].dtype) == "Int64"
+
+
+def test_read_metadata_columns(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "samples.xlsx", [[1, "a", 9606, 151.2], [2, "b", None, 150.5]]
+    )
+    contextual = BaseSampleContextual()
+    sample_metadata = contextual._read_metadata(fname)
+    projected = contextual._read_metadata(fname, columns=["decimal_longitude_public"])
+    assert projected == {
+        key: {
+            field: value
+            for field, value in sample.items()
+            if field in ("metadata_revision_date", "metadata_revision_filename", "decimal_longitude_public")
+        }
+        for key, sample in sample_metadata.items()
+    }
+    frame = read_metadata_frame(contextual, fname, columns=["taxon_id"])
+    assert list(frame.columns) == [
+        "bioplatforms_sample_id",
+        "metadata_revision_date",
+        "metadata_revision_filename",
+        "taxon_id",
+    ]
+
+
+def test_read_metadata_frame_duplicates(tmp_path, make_workbook):
+    fname = make_workbook(tmp_path / "samples.xlsx", [[1, "a"], [1, "b"]])
+    with pytest.raises(Exception, match="duplicate bioplatforms_sample_id: 102.100.100/1"):
+        read_metadata_frame(BaseSampleContextual(streaming=True), fname)
+
+
+def test_write_metadata_parquet(tmp_path, make_workbook):
+    pytest.importorskip("pyarrow")
+    fname = make_workbook(tmp_path / "samples.xlsx", [[1, "a", 9606, 151.2]])
+    path = str(tmp_path / "samples.parquet")
+    frame = write_metadata_parquet(BaseSampleContextual(streaming=True), fname, path)
+    assert pd.read_parquet(path).equals(frame)
+
+
+def test_write_metadata_parquet_mixed_types(tmp_path, make_workbook):
+    pytest.importorskip("pyarrow")
+    fname = make_workbook(
+        tmp_path / "samples.xlsx", [[1, "a", 9606, 151.2], [2, 17.5, None, 150.5]]
+    )
+    path = str(tmp_path / "samples.parquet")
+    frame = write_metadata_parquet(BaseSampleContextual(streaming=True), fname, path)
+    assert list(frame["sample_id"]) == ["a", 17.5]
+    assert list(pd.read_parquet(path)["sample_id"]) == ["a", "17.5"]
+
+
+def test_shared_workbook_session(tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    samples = workbook.active
+    samples.title = "Sample metadata"
+    samples.append(["bioplatforms_sample_id", "sample_id"])
+    samples.append([1, "a"])
+    control = workbook.create_sheet("Dataset Control")
+    control.append(["access_control_date", "access_control_reason", "related_data", "sample_id"])
+    control.append(["2022-01-01", "embargo", "none", 1])
+    fname = str(tmp_path / "samples.xlsx")
+    workbook.save(fname)
+
+    opened = []
+    open_workbook = readers.open_workbook
+    monkeypatch.setattr(
+        readers, "open_workbook", lambda *args: opened.append(args) or open_workbook(*args)
+    )
+
+    class DatasetControl(BaseDatasetControlContextual):
+        contextual_linkage = ("sample_id",)
+
+    logger = logging.getLogger(__name__)
+    with readers.WorkbookSession(fname) as session:
+        sample_metadata = BaseSampleContextual()._read_metadata(fname, session=session)
+        dataset_control = DatasetControl(logger, str(tmp_path), session=session)
+    assert len(opened) == 1
+    assert list(sample_metadata) == ["102.100.100/1"]
+    assert dataset_control.get("102.100.100/1") == {
+        "access_control_date": "2022-01-01",
+        "access_control_reason": "embargo",
+        "related_data": "none",
+    }
+
+    # without a session the workbook is opened once for all of its sheets
+    DatasetControl(logger, fname)
+    assert len(opened) == 2
+
+
+def test_spilling_metadata_store(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "samples.xlsx",
+        [[n, "s{}".format(n), 9606, 151.2] for n in range(1, 8)],
+    )
+    expected = BaseSampleContextual()._read_metadata(fname)
+    factory = functools.partial(SpillingMetadataStore, 2, directory=str(tmp_path))
+    with BaseSampleContextual(metadata_store=factory)._read_metadata(fname) as store:
+        assert store.spilled == 6
+        assert len(store) == 7
+        assert list(store.items()) == list(expected.items())
+        assert store["102.100.100/1"] == expected["102.100.100/1"]
+        assert "102.100.100/8" not in store and store.get("102.100.100/8") is None
+
+        # a replaced or deleted key behaves as in a dict, wherever it is held
+        store["102.100.100/1"] = expected["102.100.100/1"] = {}
+        store["102.100.100/7"] = expected["102.100.100/7"] = {}
+        del store["102.100.100/2"], expected["102.100.100/2"]
+        del store["102.100.100/6"], expected["102.100.100/6"]
+        assert dict(store) == expected and list(store) == list(expected)
+    assert os.listdir(str(tmp_path)) == ["samples.xlsx"]
+
+    # duplicates are found on disk too
+    fname = make_workbook(tmp_path / "duplicates.xlsx", [[1, "a"], [2, "b"], [3, "c"], [1, "d"]])
+    with pytest.raises(Exception, match="duplicate bioplatforms_sample_id: 102.100.100/1"):
+        BaseSampleContextual(metadata_store=factory)._read_metadata(fname)
+    assert sorted(os.listdir(str(tmp_path))) == ["duplicates.xlsx", "samples.xlsx"]
@@ -0,0 +1,120 @@
+import datetime
+import logging
+
+import pandas as pd
+import pytest
+
+from .excel_wrapper import ExcelWrapper
+from .readers import SNIFF_BYTES, open_workbook, sniff_encoding, sniff_engine
+from .test_excel_wrapper import field_spec
+
+logger = logging.getLogger(__name__)
+
+HEADER = ["sample_id", "depth", "collection_date", "notes", "extra"]
+ROWS = [
+    ["1234", "12.5", "", "  padded  ", "x"],
+    ["102.100.100/5678", "3", "", "", "y"],
+    ["junk", "deep", "", "note", ""],
+]
+
+
+def write_text(path, rows, delimiter):
+    with open(str(path), "w", newline="", encoding="utf-8") as fd:
+        for row in [HEADER] + rows:
+            fd.write(delimiter.join(row) + "\r\n")
+    return str(path)
+
+
+def read(fname, **kwargs):
+    wrapper = ExcelWrapper(
+        logger, field_spec, fname, sheet_name="Sample metadata", header_length=1, **kwargs
+    )
+    return wrapper, list(wrapper.get_all())
+
+
+def test_text_engines_match_xlsx(tmp_path, make_workbook):
+    xlsx = make_workbook(
+        tmp_path / "samples.xlsx", [[v or None for v in row] for row in ROWS], header=HEADER
+    )
+    _, expected = read(xlsx)
+    for name, delimiter in (("samples.csv", ","), ("samples.tsv", "\t"), ("samples.txt", "\t")):
+        fname = write_text(tmp_path / name, ROWS, delimiter)
+        assert sniff_engine(fname) == "csv"
+        wrapper, rows = read(fname)
+        assert wrapper.engine == "csv"
+        assert rows == expected
+        # there is no sheet to look for, so no messages about it
+        assert wrapper.get_errors()[:2] == [
+            "E3001: Column `collector' not found in `{0}' `{0}'".format(name),
+            "E3002: Column `extra` in `{0}` `{0}` is not mapped to an output field in the codebase.".format(name),
+        ]
+    assert sniff_engine(xlsx) == "xlsx"
+
+
+def test_csv_short_rows(tmp_path):
+    fname = tmp_path / "samples.csv"
+    fname.write_text("sample_id,depth,collection_date,notes,extra\n1,2\n")
+    _, rows = read(str(fname))
+    assert rows[0].sample_id == "102.100.100/1"
+    assert rows[0].depth == 2.0
+    assert rows[0].notes == ""
+
+
+def test_csv_cp1252(tmp_path):
+    # as Excel on Windows exports it, the non-ASCII text well past the first rows
+    rows = [["{}".format(n), "1", "", "", ""] for n in range(1, 2000)]
+    rows.append(["2000", "1", "", "Café – 5 µm", ""])
+    lines = [",".join(row) for row in [HEADER] + rows]
+    fname = tmp_path / "samples.csv"
+    fname.write_bytes("\r\n".join(lines).encode("cp1252") + b"\x81\r\n")
+    _, read_rows = read(str(fname))
+    assert len(read_rows) == 2000
+    assert read_rows[-1].notes == "Café – 5 µm"
+
+
+def test_csv_cp1252_past_sniff(tmp_path):
+    # UTF-8 as far as sniff_encoding reads, cp1252 from then on
+    rows = [["{}".format(n), "1", "", "", ""] for n in range(1, SNIFF_BYTES // 10)]
+    rows.append(["0", "1", "", "Café", ""])
+    lines = [",".join(row) for row in [HEADER] + rows]
+    fname = str(tmp_path / "samples.csv")
+    with open(fname, "wb") as fd:
+        fd.write("\r\n".join(lines).encode("cp1252") + b"\r\n")
+    assert sniff_encoding(fname) == "utf-8-sig"
+    _, read_rows = read(fname)
+    assert len(read_rows) == len(rows)
+    assert read_rows[-1].notes == "Café"
+    # no row is read twice, or skipped, where the encoding changed
+    assert [row.sample_id for row in read_rows[:-1]] == [
+        "102.100.100/" + row[0] for row in rows[:-1]
+    ]
+
+
+def test_csv_header_only_cp1252(tmp_path):
+    fname = str(tmp_path / "samples.csv")
+    with open(fname, "wb") as fd:
+        fd.write("sample_id,depth,notes é\r\n1,2,3\r\n".encode("cp1252"))
+    sheet = open_workbook(fname, header_only=True).sheet_by_index(0)
+    assert sheet.row_values(0) == ["sample_id", "depth", "notes é"]
+
+
+def test_parquet_engine(tmp_path):
+    pytest.importorskip("pyarrow")
+    fname = str(tmp_path / "samples.parquet")
+    pd.DataFrame(
+        {
+            "sample_id": [1234, 5678],
+            "depth": [12.5, None],
+            "collection_date": [datetime.datetime(2021, 3, 4), None],
+            "notes": ["a", None],
+            "extra": ["x", "y"],
+        }
+    ).to_parquet(fname)
+    assert sniff_engine(fname) == "parquet"
+    wrapper, rows = read(fname)
+    # only the mapped columns are read
+    assert wrapper.sheet.columns == [0, 1, 2, 3]
+    assert [row.sample_id for row in rows] == ["102.100.100/1234", "102.100.100/5678"]
+    assert [row.depth for row in rows] == [12.5, None]
+    assert rows[0].collection_date == datetime.datetime(2021, 3, 4)
+    assert [row.notes for row in rows] == ["a", ""]
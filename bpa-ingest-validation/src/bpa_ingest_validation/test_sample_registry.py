@@ -0,0 +1,32 @@
+from .sample_registry import SampleRecord, SampleRegistry
+
+
+def test_sample_registry(tmp_path):
+    path = str(tmp_path / "registry.sqlite")
+    with SampleRegistry(path) as registry:
+        registry.register("a.xlsx", "Sample metadata", [("102.100.100/1", 1), (2.0, 2)], "2022-01-01")
+        registry.register("b.xlsx", "Sample metadata", [("102.100.100.2", 1), ("junk", 2)])
+        assert len(registry) == 3
+
+    # recorded IDs persist, and are found whichever way they are written
+    with SampleRegistry(path) as registry:
+        found = registry.find(["2", "102.100.100/1", "3", "", None, "junk"])
+        assert found == {
+            "102.100.100/1": [
+                SampleRecord("102.100.100/1", "a.xlsx", "Sample metadata", 1, "2022-01-01")
+            ],
+            "102.100.100/2": [
+                SampleRecord("102.100.100/2", "a.xlsx", "Sample metadata", 2, "2022-01-01"),
+                SampleRecord("102.100.100/2", "b.xlsx", "Sample metadata", 1, None),
+            ],
+        }
+        assert list(registry.find(["2"], exclude_file="a.xlsx")["102.100.100/2"]) == [
+            SampleRecord("102.100.100/2", "b.xlsx", "Sample metadata", 1, None)
+        ]
+
+        # registering a file again replaces its samples
+        registry.register("a.xlsx", "Sample metadata", [("102.100.100/3", 4)])
+        assert registry.find(["1"]) == {}
+        assert registry.find(["3"])["102.100.100/3"][0].row == 4
+        registry.forget("a.xlsx")
+        assert len(registry) == 1
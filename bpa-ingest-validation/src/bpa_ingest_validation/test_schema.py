@@ -0,0 +1,53 @@
+import re
+
+from .excel_wrapper import make_field_definition as fld, make_skip_column as skp
+from .schema import CompiledSchema, compile_schema
+
+field_spec = [
+    fld("sample_id", "Sample_ID"),
+    fld("depth", re.compile(r"depth_?\(?m?\)?$")),
+    fld("taxon", ("taxon_id", re.compile(r"tax_?id"))),
+    fld("note", re.compile(r"note"), find_all=True),
+    fld("flag", re.compile(r"FLAG", re.IGNORECASE), optional=True),
+    fld("code", re.compile(r"(c)\1")),
+    skp("junk"),
+    skp(re.compile(r"z"), skip_all=True),
+]
+
+
+def test_resolve():
+    schema = CompiledSchema(field_spec)
+    mapping = schema.resolve(
+        [" sample_id", "notes", "Depth (m)", "taxid", "junk", "z1", "z2", "note 2", 7.0, "", "cc"]
+    )
+    assert mapping.column_map == {
+        "sample_id": 0,
+        "depth": None,
+        "taxon": 3,
+        "note": 1,
+        "note2": 7,
+        "flag": None,
+        "code": 10,
+    }
+    assert mapping.header[7] == "note2"
+    assert [spec.attribute for spec in mapping.missing] == ["depth", "flag"]
+    assert [mapping.header[idx] for idx in mapping.unmapped] == ["depth (m)", "7.0"]
+    assert mapping.non_strings == [7.0]
+
+    # the combined pattern gives the same matches as each pattern on its own
+    for name in ["depth", "depth_m", "note", "tax_id", "flag", "cc", "x"]:
+        assert sorted(schema.matching_patterns(name)) == [
+            idx for idx, pattern in enumerate(schema._patterns) if pattern.match(name)
+        ]
+
+
+def test_resolve_cache():
+    schema = compile_schema(field_spec)
+    assert compile_schema(field_spec) is schema
+    assert compile_schema(list(field_spec)) is not schema
+    header = ["sample_id", "depth", "taxon_id", "cc"]
+    assert schema.resolve(header) is schema.resolve(list(header))
+    assert schema.resolve_cache_info().hits == 1
+    # 1 and 1.0 are different column names
+    assert schema.resolve(header + [1]).header[-1] == "1"
+    assert schema.resolve(header + [1.0]).header[-1] == "1.0"
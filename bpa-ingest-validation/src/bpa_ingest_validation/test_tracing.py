@@ -0,0 +1,88 @@
+import functools
+import json
+import os
+
+import pytest
+
+from .cli import main
+from .metadata_handler import BaseSampleContextual
+from .tracing import JsonLinesTracer, NULL_TRACER, Tracer
+
+
+class ListTracer(Tracer):
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+HEADER = ["bioplatforms_sample_id", "sample_id", "taxon_id", "depth"]
+
+
+@pytest.fixture
+def make_workbook(make_workbook):
+    return functools.partial(make_workbook, header=HEADER)
+
+
+def test_read_metadata_spans(tmp_path, make_workbook):
+    fname = make_workbook(
+        tmp_path / "samples.xlsx", [[1, "a", 9606, 10], [2, "b", "x", 20], [None, "c"]]
+    )
+    tracer = ListTracer()
+    contextual = BaseSampleContextual(streaming=True, tracer=tracer)
+    sample_metadata = contextual._read_metadata(fname)
+
+    spans = {record["span"]: record for record in tracer.records}
+    assert [record["span"] for record in tracer.records] == [
+        "open_workbook",
+        "find_sheet",
+        "map_header",
+        "get_all",
+        "process_row",
+        "read_metadata",
+    ]
+    assert all(record["file"] == fname for record in tracer.records)
+    assert spans["find_sheet"]["sheet"] == "Sample metadata"
+    assert spans["get_all"]["rows"] == 3
+    assert spans["process_row"]["rows"] == 3
+    assert spans["read_metadata"]["samples"] == len(sample_metadata) == 2
+    # every field with a coerce function is timed
+    assert set(spans["get_all"]["coerce"]) == {
+        spec.attribute
+        for spec in contextual.field_spec
+        if getattr(spec, "coerce", None) is not None
+    }
+    # the stages fit inside the whole
+    assert spans["read_metadata"]["duration"] >= sum(
+        spans[name]["duration"]
+        for name in ("open_workbook", "find_sheet", "map_header", "get_all", "process_row")
+    )
+
+    # the same rows and errors with tracing off
+    untraced = BaseSampleContextual(streaming=True)
+    assert untraced.tracer is NULL_TRACER
+    assert untraced._read_metadata(fname) == sample_metadata
+    assert untraced.errors == contextual.errors
+
+
+def test_cli_trace_and_profile(tmp_path, make_workbook, capsys):
+    fname = make_workbook(tmp_path / "samples.xlsx", [[1, "a", 9606, 10]])
+    trace_file = str(tmp_path / "trace.jsonl")
+    profile_dir = tmp_path / "profiles"
+    main(["--trace", trace_file, "--profile-dir", str(profile_dir), fname])
+    capsys.readouterr()
+
+    with open(trace_file) as fd:
+        records = [json.loads(line) for line in fd]
+    assert {record["span"] for record in records} >= {"open_workbook", "get_all", "read_metadata"}
+    profiles = os.listdir(str(profile_dir))
+    assert len(profiles) == 1 and profiles[0].startswith("samples.xlsx-")
+
+    # appended to, not overwritten
+    tracer = JsonLinesTracer(trace_file)
+    with tracer.span("extra"):
+        pass
+    tracer.close()
+    with open(trace_file) as fd:
+        assert len(fd.readlines()) == len(records) + 1
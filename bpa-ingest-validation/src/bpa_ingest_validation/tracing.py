@@ -0,0 +1,230 @@
+"""
+Timed spans for the stages of validating a workbook.
+
+ExcelWrapper and BaseSampleContextual report each stage - opening the workbook, finding
+the sheet, mapping the header, reading rows, coercion and process_row - as a span to a
+Tracer. A span is a record of the stage name, its start time and duration, and counts
+such as the number of rows and the time spent in each field's coerce function.
+
+Tracing is off by default: the NULL_TRACER discards spans, and the per-row and per-cell
+timing is only set up when a tracer is enabled, so untraced runs execute the same row
+loop as before. To receive spans, subclass Tracer and implement emit(), or use
+JsonLinesTracer to append them to a file, one JSON object per line.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+
+class Span:
+    """
+    A stage being timed.
+
+    name: name of the stage
+    attrs: dict of values reported with the span, e.g. the file name or a row count
+    """
+
+    __slots__ = ("name", "attrs", "start", "duration", "_started")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def finish(self):
+        # the duration may have been set already, for a stage timed in pieces
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+
+    def record(self):
+        return dict(self.attrs, span=self.name, start=self.start, duration=self.duration)
+
+
+class _NullSpan:
+    """Stands in for a Span when tracing is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Receives spans; subclasses implement emit(record) to send them somewhere"""
+
+    enabled = True
+
+    def emit(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def start_span(self, name, **attrs):
+        return Span(name, attrs)
+
+    def end_span(self, span):
+        span.finish()
+        self.emit(span.record())
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.set("error", type(e).__name__)
+            raise
+        finally:
+            self.end_span(span)
+
+    def add_span(self, name, duration, **attrs):
+        """Report a stage timed elsewhere, e.g. summed over many calls"""
+        span = self.start_span(name, **attrs)
+        span.duration = duration
+        self.end_span(span)
+
+    def trace_rows(self, name, rows, **attrs):
+        """
+        Yields from rows, reporting a span for the time spent producing them, not counting
+        the time the caller spends between rows, with the number of rows as `rows`
+        """
+        span = self.start_span(name, **attrs)
+        clock = time.perf_counter
+        busy = 0.0
+        count = 0
+        try:
+            started = clock()
+            for row in rows:
+                busy += clock() - started
+                count += 1
+                yield row
+                started = clock()
+            busy += clock() - started
+        finally:
+            span.set("rows", count)
+            span.duration = busy
+            self.end_span(span)
+
+
+class NullTracer(Tracer):
+    """Discards everything, the default"""
+
+    enabled = False
+
+    def emit(self, record):
+        pass
+
+    def start_span(self, name, **attrs):
+        return NULL_SPAN
+
+    def end_span(self, span):
+        pass
+
+    def span(self, name, **attrs):
+        return NULL_SPAN
+
+    def add_span(self, name, duration, **attrs):
+        pass
+
+    def trace_rows(self, name, rows, **attrs):
+        return rows
+
+
+NULL_TRACER = NullTracer()
+
+
+class JsonLinesTracer(Tracer):
+    """
+    Appends spans to path, one JSON object per line. Each line is a single write to a
+    file opened for appending, so several processes can share a trace file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def emit(self, record):
+        record["pid"] = os.getpid()
+        line = json.dumps(record, default=str, sort_keys=True) + "\n"
+        os.write(self._fd, line.encode("utf8"))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class Timed:
+    """
+    Wraps func, adding the time spent in each call to totals[key], and counting the
+    calls in counts[key] if counts is given
+    """
+
+    __slots__ = ("func", "key", "totals", "counts")
+
+    def __init__(self, func, key, totals, counts=None):
+        self.func = func
+        self.key = key
+        self.totals = totals
+        self.counts = counts
+        totals.setdefault(key, 0.0)
+        if counts is not None:
+            counts.setdefault(key, 0)
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.totals[self.key] += time.perf_counter() - started
+            if self.counts is not None:
+                self.counts[self.key] += 1
+
+
+def profile_path(profile_dir, fname):
+    """Where the profile of workbook fname is written, unique per workbook path"""
+    import hashlib
+
+    digest = hashlib.sha1(os.path.abspath(fname).encode("utf8")).hexdigest()[:8]
+    return os.path.join(
+        profile_dir, "{}-{}.prof".format(os.path.basename(fname), digest)
+    )
+
+
+@contextlib.contextmanager
+def profiled(profile_dir, fname):
+    """
+    Runs the body under cProfile, writing the stats for workbook fname to profile_dir
+    (see profile_path), for reading with pstats or snakeviz. Does nothing if profile_dir
+    is None.
+    """
+    if profile_dir is None:
+        yield
+        return
+    import cProfile
+
+    os.makedirs(profile_dir, exist_ok=True)
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(profile_path(profile_dir, fname))
@@ -4,9 +4,11 @@ def make_logger(name, level=logging.INFO):
     logger = logging.getLogger(name)
     logger.propagate = False
     logger.setLevel(level)
-    handler = logging.StreamHandler()
-    fmt = logging.Formatter("%(asctime)s [%(levelname)-7s] [%(name)s]  %(message)s")
-    handler.setFormatter(fmt)
-    logger.addHandler(handler)
+    # loggers are shared, so only the first caller adds a handler
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        fmt = logging.Formatter("%(asctime)s [%(levelname)-7s] [%(name)s]  %(message)s")
+        handler.setFormatter(fmt)
+        logger.addHandler(handler)
     return logger
 
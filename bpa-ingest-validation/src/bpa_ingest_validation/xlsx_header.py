@@ -0,0 +1,224 @@
+"""
+The header rows of .xlsx sheets, read straight out of the workbook archive.
+
+Checking a workbook's columns against a field_spec needs the sheet names and one row.
+Opening the workbook with openpyxl, even in read-only mode, imports openpyxl and reads
+the styles and every shared string first. HeaderWorkbook reads the workbook's sheet
+list, and then parses a sheet's XML only up to the row asked for, and the shared
+strings table only up to the last string that row uses.
+
+Values are returned as xlrd would read them: strings, floats for numbers, and ints for
+booleans. HeaderWorkbook has the part of the xlrd Book interface ExcelWrapper needs
+to map a header, see ExcelWrapper(header_only=True); it can't read data rows.
+"""
+
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CORE_MODIFIED = "{http://purl.org/dc/terms/}modified"
+
+_sheet_visibility = {
+    "visible": 0,
+    "hidden": 1,
+    "veryHidden": 2,
+}
+
+
+def open_header_workbook(file_name):
+    return HeaderWorkbook(file_name)
+
+
+def column_index(ref):
+    """Zero based column index of a cell reference such as AB12"""
+    idx = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        idx = idx * 26 + ord(char.upper()) - 64
+    return idx - 1
+
+
+def _rels(archive, part):
+    """{relationship id: (type, part name)} for the relationships of part"""
+    directory, name = posixpath.split(part)
+    rels_part = posixpath.join(directory, "_rels", name + ".rels")
+    rels = {}
+    if rels_part not in archive.NameToInfo:
+        return rels
+    with archive.open(rels_part) as src:
+        for _event, element in iterparse(src):
+            if element.tag == PACKAGE_REL_NS + "Relationship":
+                target = element.get("Target")
+                if target.startswith("/"):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(directory, target))
+                rels[element.get("Id")] = (element.get("Type"), target)
+    return rels
+
+
+class HeaderWorkbook:
+    """
+    Sheet list and header rows of an .xlsx workbook.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._archive = zipfile.ZipFile(file_name)
+        self._shared_strings = []
+        self._shared_strings_part = None
+        self.datemode = 0
+        self.props = {}
+        self._sheets = []
+
+        workbook_part = "xl/workbook.xml"
+        for rel_type, target in _rels(self._archive, "").values():
+            if rel_type.endswith("/officeDocument"):
+                workbook_part = target
+        workbook_rels = _rels(self._archive, workbook_part)
+        for rel_type, target in workbook_rels.values():
+            if rel_type.endswith("/sharedStrings"):
+                self._shared_strings_part = target
+            elif rel_type.endswith("/core-properties"):
+                self._read_modified(target)
+
+        with self._archive.open(workbook_part) as src:
+            for _event, element in iterparse(src):
+                if element.tag == MAIN_NS + "workbookPr":
+                    if element.get("date1904") in ("1", "true"):
+                        self.datemode = 1
+                elif element.tag == MAIN_NS + "sheet":
+                    _type, part = workbook_rels[element.get(REL_NS + "id")]
+                    self._sheets.append(
+                        HeaderSheet(
+                            self,
+                            element.get("name"),
+                            part,
+                            _sheet_visibility.get(element.get("state"), 0),
+                        )
+                    )
+        if "modified" not in self.props and "docProps/core.xml" in self._archive.NameToInfo:
+            self._read_modified("docProps/core.xml")
+
+    def _read_modified(self, part):
+        with self._archive.open(part) as src:
+            for _event, element in iterparse(src):
+                if element.tag == CORE_MODIFIED and element.text:
+                    self.props["modified"] = element.text.strip()
+
+    def shared_strings(self, count):
+        """The first count shared strings, or all of them if there are fewer"""
+        strings = self._shared_strings
+        if len(strings) >= count or self._shared_strings_part is None:
+            return strings
+        strings = self._shared_strings = []
+        # the text of an <si> is the text of its <t> elements, less phonetic runs
+        texts = []
+        in_phonetic = 0
+        with self._archive.open(self._shared_strings_part) as src:
+            for event, element in iterparse(src, events=("start", "end")):
+                tag = element.tag
+                if tag == MAIN_NS + "rPh":
+                    in_phonetic += 1 if event == "start" else -1
+                elif event != "end":
+                    continue
+                elif tag == MAIN_NS + "t" and not in_phonetic:
+                    texts.append(element.text or "")
+                elif tag == MAIN_NS + "si":
+                    strings.append("".join(texts))
+                    texts = []
+                    element.clear()
+                    if len(strings) >= count:
+                        break
+        return strings
+
+    def sheet_names(self):
+        return [sheet.name for sheet in self._sheets]
+
+    def sheet_by_name(self, sheet_name):
+        for sheet in self._sheets:
+            if sheet.name == sheet_name:
+                return sheet
+        raise KeyError(sheet_name)
+
+    def sheet_by_index(self, sheetx):
+        return self._sheets[sheetx]
+
+    def release_resources(self):
+        self._archive.close()
+
+
+class HeaderSheet:
+    """
+    A sheet of a HeaderWorkbook, only row_values() is supported
+    """
+
+    merged_cells = ()
+
+    def __init__(self, book, name, part, visibility):
+        self.book = book
+        self.name = name
+        self.visibility = visibility
+        self._part = part
+
+    def _read_row(self, rowx):
+        """[(column index, type, text)] of the cells in row rowx"""
+        cells = []
+        row_idx = -1
+        with self.book._archive.open(self._part) as src:
+            for event, element in iterparse(src, events=("start", "end")):
+                tag = element.tag
+                if tag == MAIN_NS + "row":
+                    if event == "start":
+                        row_idx = int(element.get("r", row_idx + 2)) - 1
+                        if row_idx > rowx:
+                            break
+                        continue
+                    if row_idx == rowx:
+                        break
+                    element.clear()
+                elif event == "end" and tag == MAIN_NS + "c" and row_idx == rowx:
+                    ref = element.get("r")
+                    col_idx = column_index(ref) if ref else len(cells)
+                    cell_type = element.get("t", "n")
+                    if cell_type == "inlineStr":
+                        text = "".join(t.text or "" for t in element.iter(MAIN_NS + "t"))
+                    else:
+                        value = element.find(MAIN_NS + "v")
+                        text = value.text if value is not None else None
+                    cells.append((col_idx, cell_type, text))
+                elif event == "end" and tag == MAIN_NS + "sheetData":
+                    break
+        return cells
+
+    def row_values(self, rowx):
+        cells = self._read_row(rowx)
+        if not cells:
+            return []
+        shared = [int(text) for _idx, cell_type, text in cells if cell_type == "s" and text]
+        strings = self.book.shared_strings(max(shared) + 1) if shared else []
+        values = [""] * (max(idx for idx, _type, _text in cells) + 1)
+        for idx, cell_type, text in cells:
+            if text is None:
+                continue
+            if cell_type == "s":
+                value = strings[int(text)]
+            elif cell_type in ("str", "inlineStr", "e"):
+                value = text
+            elif cell_type == "b":
+                value = int(text)
+            else:
+                value = float(text)
+            values[idx] = value
+        return values
+
+    def get_rows(self, start_rowx=0):
+        raise ValueError(
+            "{} was opened with header_only=True, it has no rows to read".format(
+                self.book.file_name
+            )
+        )
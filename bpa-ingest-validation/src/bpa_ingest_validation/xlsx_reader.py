@@ -0,0 +1,157 @@
+# _*_ coding: utf-8 _*_
+"""
+Streaming, read-only access to .xlsx workbooks.
+
+xlrd.open_workbook() decodes every sheet and every cell before a single row can be
+read. The classes here wrap openpyxl's read-only mode and expose the small subset of the
+xlrd Book/Sheet interface that ExcelWrapper relies on, so rows are decoded one at a time
+and memory stays flat regardless of the number of rows in the sheet.
+
+Cells are returned as xlrd Cell instances with xlrd ctypes: numbers are floats, and dates
+are Excel serial numbers with ctype XL_CELL_DATE, so the downstream date handling is
+identical whichever backend read the file.
+"""
+
+import datetime
+from xml.etree.ElementTree import iterparse
+
+import xlrd
+from xlrd.sheet import Cell
+from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import to_excel, CALENDAR_MAC_1904
+
+SHEET_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+EMPTY_CELL = Cell(xlrd.XL_CELL_EMPTY, "")
+
+_sheet_visibility = {
+    "visible": 0,
+    "hidden": 1,
+    "veryHidden": 2,
+}
+# xlrd stores error cells as the internal error code, not the display text
+_error_code_from_text = dict(
+    (text, code) for code, text in xlrd.error_text_from_code.items()
+)
+
+
+def open_streaming_workbook(file_name):
+    return StreamingWorkbook(file_name)
+
+
+class StreamingWorkbook:
+    """
+    Read-only workbook, with the parts of the xlrd.Book interface used by ExcelWrapper.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._workbook = load_workbook(
+            file_name, read_only=True, data_only=True, keep_links=False
+        )
+        self._epoch = self._workbook.epoch
+        self.datemode = 1 if self._epoch == CALENDAR_MAC_1904 else 0
+        self.props = {}
+        modified = self._workbook.properties.modified
+        if modified is not None:
+            # match the string form xlrd reads out of docProps/core.xml
+            self.props["modified"] = modified.strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._sheets = {}
+
+    def sheet_names(self):
+        return self._workbook.sheetnames
+
+    def sheet_by_name(self, sheet_name):
+        if sheet_name not in self._sheets:
+            self._sheets[sheet_name] = StreamingSheet(
+                self, self._workbook[sheet_name]
+            )
+        return self._sheets[sheet_name]
+
+    def sheet_by_index(self, sheetx):
+        return self.sheet_by_name(self.sheet_names()[sheetx])
+
+    def release_resources(self):
+        self._workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.release_resources()
+
+
+class StreamingSheet:
+    """
+    Read-only sheet, rows are parsed from the workbook archive each time they are iterated.
+    """
+
+    def __init__(self, book, worksheet):
+        self.book = book
+        self.name = worksheet.title
+        self.visibility = _sheet_visibility.get(worksheet.sheet_state, 0)
+        self._worksheet = worksheet
+        self._merged_cells = None
+
+    @property
+    def ncols(self):
+        return self._worksheet.max_column or 0
+
+    @property
+    def merged_cells(self):
+        """
+        Merged ranges as xlrd (rlo, rhi, clo, chi) tuples. Read-only mode does not load these,
+        so the sheet XML is scanned for them once, discarding rows as they are parsed.
+        """
+        if self._merged_cells is None:
+            self._merged_cells = list(self._iter_merged_cells())
+        return self._merged_cells
+
+    def _iter_merged_cells(self):
+        with self._worksheet._get_source() as src:
+            for _event, element in iterparse(src):
+                if element.tag == SHEET_MAIN_NS + "mergeCell":
+                    min_col, min_row, max_col, max_row = range_boundaries(
+                        element.get("ref")
+                    )
+                    yield min_row - 1, max_row, min_col - 1, max_col
+                    element.clear()
+                elif element.tag == SHEET_MAIN_NS + "row":
+                    element.clear()
+
+    def _to_xlrd_cell(self, cell):
+        value = cell.value
+        if value is None:
+            return EMPTY_CELL
+        if cell.data_type == "e":
+            return Cell(xlrd.XL_CELL_ERROR, _error_code_from_text.get(value, value))
+        if isinstance(value, bool):
+            return Cell(xlrd.XL_CELL_BOOLEAN, int(value))
+        if isinstance(value, (int, float)):
+            # xlrd reads all numbers as floats
+            return Cell(xlrd.XL_CELL_NUMBER, float(value))
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return Cell(xlrd.XL_CELL_DATE, to_excel(value, self.book._epoch))
+        if isinstance(value, datetime.timedelta):
+            return Cell(xlrd.XL_CELL_DATE, value.total_seconds() / 86400.0)
+        return Cell(xlrd.XL_CELL_TEXT, str(value))
+
+    def get_rows(self, start_rowx=0):
+        """Yields each row as a list of xlrd Cells, padded to the width of the sheet"""
+        # unsized sheets (no <dimension> element) are padded to the widest row seen so far
+        width = self.ncols
+        for row in self._worksheet.iter_rows(min_row=start_rowx + 1):
+            cells = [self._to_xlrd_cell(cell) for cell in row]
+            if len(cells) < width:
+                cells.extend([EMPTY_CELL] * (width - len(cells)))
+            width = len(cells)
+            yield cells
+
+    def row(self, rowx):
+        for cells in self.get_rows(rowx):
+            return cells
+        raise IndexError("row index out of range: {}".format(rowx))
+
+    def row_values(self, rowx):
+        return [cell.value for cell in self.row(rowx)]